@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+parsers for c and c++ files, built around the AST dumps of clang and gcc:
+    from python_c_cpp_parser import clang_parser
+    c = clang_parser("test/c/for_loops/simple.c")
+    c.execute()
+
+Nothing is imported by the package itself, the backends are loaded on first
+access of one of their names, as they are slow to import.
+"""
+import importlib
+
+# public name -> module defining it
+_NAMES = {
+    "clang_parser": "clang",
+    "clang_version": "clang",
+    "Node": "clang",
+    "SourceFilter": "clang",
+    "gcc_parser": "gcc",
+    "GccGraph": "gcc",
+    "pycparser_parser": "pycparser",
+    "clang_project": "project",
+    "CompileCommand": "project",
+    "load_compile_commands": "project",
+    "ParseResult": "batch",
+    "run_many": "batch",
+    "ASTCache": "cache",
+    "CompactTree": "compact",
+    "SymbolIndex": "symbols",
+    "PrecompiledHeader": "pch",
+    "Toolchain": "toolchain",
+    "discover": "toolchain",
+}
+
+# backends, accessible as attributes, e.g. `python_c_cpp_parser.gcc.parse_many`
+_MODULES = ("batch", "cache", "clang", "common", "compact", "gcc", "libclang",
+            "pch", "project", "pycparser", "stream", "symbols", "toolchain")
+
+__all__ = list(_NAMES) + list(_MODULES)
+
+
+def __getattr__(name: str):
+    if name in _NAMES:
+        value = getattr(importlib.import_module("." + _NAMES[name], __name__), name)
+    elif name in _MODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    # found directly on the next access
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
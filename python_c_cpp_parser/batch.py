@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+helpers to parse many files within a bounded pool of worker processes, or
+concurrently within an asyncio event loop.
+"""
+import os
+import sys
+import weakref
+
+# deep ASTs (e.g. long `else if` chains) are pickled recursively when they
+# are sent back from the workers.
+RECURSION_LIMIT = 10000
+
+# a file whose worker process died this often is reported as failed
+MAX_CRASHES = 2
+
+# event loop -> its default semaphore of `run_process`
+_semaphores = weakref.WeakKeyDictionary()
+
+
+class ParseResult:
+    """
+    result of a single file of a batch
+    """
+
+    def __init__(self, file, parser=None, root=None, error: str = None, value=None):
+        """
+        :param file: the parsed file
+        :param parser: the parser after `execute()`, e.g. a `clang_parser`
+        :param root: the return value of `execute()`
+        :param error: description of the error, if the file couldn't be parsed
+        :param value: result of workers which send back something else than
+            the parser and the tree, e.g. the symbols of `symbols.py`
+        """
+        self.file = file
+        self.parser = parser
+        self.root = root
+        self.error = error
+        self.value = value
+
+    def ok(self):
+        """
+        :return: true if the file was parsed successfully
+        """
+        return self.error is None
+
+    def __str__(self):
+        return str(self.file) + (": ok" if self.ok() else ": " + self.error)
+
+
+def _init_worker():
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+
+
+def _run(worker, file, kwargs: dict):
+    """
+    runs `worker` on a single file and catches all errors
+    """
+    try:
+        ret = worker(file, **kwargs)
+    except Exception as e:
+        return ParseResult(file, error="{}: {}".format(type(e).__name__, e))
+    if type(ret) is ParseResult:
+        return ret
+    parser, root = ret
+    if root is None:
+        return ParseResult(file, parser, error="couldn't parse")
+    return ParseResult(file, parser, root)
+
+
+def run_many(worker, files, jobs: int = None, kwargs: dict = None):
+    """
+    runs `worker(file, **kwargs)` for each file in up to `jobs` processes.
+    At most `2 * jobs` files are in flight at the same time.
+    If a worker process dies (e.g. killed by the oom killer), the pool is
+    restarted and the files which were in flight are run again, one at a
+    time, to find the one which crashed. It is reported as failed after
+    `MAX_CRASHES` crashes, the others are not affected.
+    :param worker: picklable function returning a tuple `(parser, root)`,
+        or a `ParseResult`
+    :param jobs: number of processes, defaults to the number of cpus.
+        If 1, everything is done within the current process.
+    :return: iterator over `ParseResult`s in completion order. Errors are
+        reported in `ParseResult.error` and do not stop the batch.
+    """
+    kwargs = kwargs if kwargs is not None else {}
+    jobs = jobs if jobs is not None else (os.cpu_count() or 1)
+    if jobs <= 1:
+        for file in files:
+            yield _run(worker, file, kwargs)
+        return
+
+    # imported here, as it is slow to import and not needed for `jobs=1`
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    pending = {}
+    # files in flight while a worker died, run alone afterwards
+    suspects = []
+    # file index -> number of crashes while running alone
+    crashes = {}
+    # files may not be hashable, hence they are identified by their index
+    files = enumerate(files)
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+    try:
+        while True:
+            if suspects:
+                if not pending:
+                    i, file = suspects.pop(0)
+                    pending[pool.submit(_run, worker, file, kwargs)] = (i, file)
+            else:
+                for i, file in files:
+                    pending[pool.submit(_run, worker, file, kwargs)] = (i, file)
+                    if len(pending) >= 2 * jobs:
+                        break
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                except Exception as e:
+                    # e.g. the result couldn't be pickled
+                    result = ParseResult(pending[future][1], error="{}: {}".format(type(e).__name__, e))
+                del pending[future]
+                yield result
+
+            if broken:
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+                if len(pending) == 1:
+                    # the file ran alone, hence it crashed the worker
+                    i, file = next(iter(pending.values()))
+                    crashes[i] = crashes.get(i, 0) + 1
+                    if crashes[i] >= MAX_CRASHES:
+                        yield ParseResult(file, error="worker process died")
+                    else:
+                        suspects.append((i, file))
+                else:
+                    suspects.extend(pending.values())
+                pending = {}
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def default_semaphore():
+    """
+    :return: the semaphore of the running event loop, which limits the
+        number of concurrent compiler processes to the number of cpus
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(os.cpu_count() or 1)
+    return _semaphores[loop]
+
+
+async def run_process(cmd: list[str], cwd: str = None, semaphore: "asyncio.Semaphore" = None):
+    """
+    runs `cmd` without blocking the event loop. At most as many processes as
+    allowed by `semaphore` run at the same time.
+    :param semaphore: defaults to `default_semaphore()`
+    :return: tuple `(returncode, stdout, stderr)`
+    """
+    import asyncio
+    async with semaphore if semaphore is not None else default_semaphore():
+        p = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                 stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.PIPE, cwd=cwd)
+        try:
+            out, err = await p.communicate()
+        except asyncio.CancelledError:
+            if p.returncode is None:
+                p.kill()
+                await p.wait()
+            raise
+    return p.returncode, out, err
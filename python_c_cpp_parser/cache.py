@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+persistent, content addressed cache of parsed ASTs, shared between processes.
+
+Similar to the direct mode of ccache a lookup needs two steps, as the
+included headers of a file are only known after it was parsed:
+    1. the manifest, addressed by the hash over the source file, the
+       command line and the compiler version, lists the headers (and their
+       hashes) of previous parses.
+    2. if all headers of a manifest entry are unchanged, the result of that
+       entry is addressed by the hash over the manifest key and the headers.
+
+Files are written into a temporary file first and moved into place via
+`os.replace`, so readers never see partial files. The cache is split into
+`SHARDS` directories, which are shrunk independently (least recently used
+first) if they grow above their share of `max_size`.
+"""
+from typing import Union
+from pathlib import Path
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SHARDS = 16
+# number of header sets remembered per manifest
+MANIFEST_ENTRIES = 8
+# a shard above its limit is shrunk to this fraction of it
+EVICTION_TARGET = 0.8
+
+# (path, mtime, size) -> sha256, to hash common headers only once per process
+_file_hashes = {}
+
+
+def hash_file(file: str) -> Union[str, None]:
+    """
+    :return: sha256 of the content of `file` or None if it can't be read
+    """
+    try:
+        st = os.stat(file)
+        key = (file, st.st_mtime_ns, st.st_size)
+        if key in _file_hashes:
+            return _file_hashes[key]
+
+        h = hashlib.sha256()
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    _file_hashes[key] = h.hexdigest()
+    return _file_hashes[key]
+
+
+class ASTCache:
+    """
+    cache of `clang_parser` results:
+        cache = ASTCache("~/.cache/python_c_cpp_parser", max_size=2 << 30)
+        c = clang_parser("main.c", cache=cache)
+        c.execute()  # only runs clang if main.c or its headers changed
+    """
+
+    def __init__(self, directory: Union[str, Path], max_size: int = 1 << 30):
+        """
+        :param directory: created if it doesn't exist
+        :param max_size: maximal size of the cache in bytes
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        for i in range(SHARDS):
+            os.makedirs(self.__shard(i), exist_ok=True)
+
+    def __shard(self, i: int):
+        return os.path.join(self.directory, "%x" % i)
+
+    def __path(self, key: str, suffix: str):
+        return os.path.join(self.__shard(int(key[0], 16)), key + suffix)
+
+    def __read(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # e.g. written by an incompatible version
+            logging.error("couldn't read cache entry %s: %s", path, e)
+            return None
+        # least recently used is approximated by the modification time, as
+        # the access time is often not updated (`noatime`)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def __write(self, path: str, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    @staticmethod
+    def __result_key(key: str, headers: dict):
+        h = hashlib.sha256(key.encode())
+        for file in sorted(headers):
+            h.update(("\0" + file + "\0" + headers[file]).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def key(signature: str, file: str) -> Union[str, None]:
+        """
+        :param signature: everything besides the source file influencing the
+            result, i.e. command line, compiler version and parser options
+        :return: the key of the manifest, or None if `file` can't be read
+        """
+        digest = hash_file(file)
+        if digest is None:
+            return None
+        return hashlib.sha256((signature + "\0" + digest).encode()).hexdigest()
+
+    def load(self, key: str):
+        """
+        :param key: see `key()`
+        :return: the stored object or None
+        """
+        manifest = self.__read(self.__path(key, ".manifest"))
+        for headers in manifest or []:
+            if all(hash_file(f) == h for f, h in headers.items()):
+                data = self.__read(self.__path(self.__result_key(key, headers), ".result"))
+                if data is not None:
+                    self.hits += 1
+                    return data
+        self.misses += 1
+        return None
+
+    def store(self, key: str, dependencies: list[str], data):
+        """
+        :param key: see `key()`
+        :param dependencies: all files, which were read to create `data`
+        :param data: picklable object
+        """
+        headers = {}
+        for file in dependencies:
+            headers[file] = hash_file(file)
+            if headers[file] is None:
+                return
+
+        result_key = self.__result_key(key, headers)
+        result = self.__path(result_key, ".result")
+        try:
+            self.__write(result, data)
+            # concurrent writers of the same manifest may drop each others
+            # entries, which only costs a miss
+            path = self.__path(key, ".manifest")
+            manifest = [h for h in (self.__read(path) or []) if h != headers]
+            self.__write(path, ([headers] + manifest)[:MANIFEST_ENTRIES])
+        except (OSError, pickle.PicklingError, RecursionError) as e:
+            logging.error("couldn't write cache entry %s: %s", result, e)
+            return
+        for shard in {int(key[0], 16), int(result_key[0], 16)}:
+            self.__evict(shard)
+
+    def __evict(self, shard: int):
+        """
+        removes the least recently used files of `shard`, if it is larger
+        than its share of `max_size`
+        """
+        limit = self.max_size // SHARDS
+        directory = self.__shard(shard)
+        files = []
+        size = 0
+        for entry in os.scandir(directory):
+            # `.tmp` files are still written by another process
+            if entry.name.endswith((".lock", ".tmp")):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime_ns, st.st_size, entry.path))
+            size += st.st_size
+        if size <= limit:
+            return
+
+        with open(os.path.join(directory, ".lock"), "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # another process is already evicting this shard
+                    return
+
+            files.sort()
+            for _, file_size, path in files:
+                if size <= limit * EVICTION_TARGET:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+
+    def size(self) -> int:
+        """
+        :return: total size of all entries in bytes
+        """
+        size = 0
+        for i in range(SHARDS):
+            for entry in os.scandir(self.__shard(i)):
+                if not entry.name.endswith(".lock"):
+                    try:
+                        size += entry.stat().st_size
+                    except FileNotFoundError:
+                        pass
+        return size
+
+    def clear(self):
+        """
+        removes all entries
+        """
+        for i in range(SHARDS):
+            for entry in os.scandir(self.__shard(i)):
+                if not entry.name.endswith(".lock"):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
-import copy
-from subprocess import Popen, PIPE, STDOUT
-from typing import Union
-from pathlib import Path
+from __future__ import annotations
+from bisect import bisect_right
+from array import array
 import logging
-import sys
 import os
-import json
-import tempfile
-import re
+import sys
 
-# TODO remove
-functions_decls = []
-compound_decls = []
-for_loop_decls = []
-while_loop_decls = []
-do_loop_decls = []
+# `subprocess`, `json`, `tempfile`, `asyncio` and the other modules only
+# needed to run or parse are imported on first use, to keep the import cheap.
+# The annotations are not evaluated, hence `typing` and `pathlib` are only
+# imported by type checkers.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Union
+    from pathlib import Path
+from python_c_cpp_parser.batch import run_many, run_process, default_semaphore
+from python_c_cpp_parser.common import Location, type2width
 
 # NOTE: some design decisions
 #   for each `function|compound_stmt` the following node are traced for fast access
@@ -27,69 +27,434 @@ do_loop_decls = []
 #   for each VarDecl its referenced are traced
 
 def str_to_class(classname: str):
-    """translate for example the string `TranslationUnitDecl` into that class"""
-    return getattr(sys.modules[__name__], classname)
+    """translate for example the string `TranslationUnitDecl` into that class.
+    Kinds without a dedicated class are translated into `UnknownNode`"""
+    return NODE_CLASSES.get(classname, UnknownNode)
 
 
-def type2width(t: str) -> Union[int, None]:
+class Range:
     """
-    TODO: probably via dict
+    wrapper around clangs `range` field: the source code from the first
+    token at `begin_*` up to (and including) the last token at `end_*`.
     """
-    # pointer
-    if "*" in t:
-        # well actually 
-        return 8
+    __slots__ = ("begin_offset", "begin_col", "begin_tokLen", "end_offset",
+                 "end_col", "end_tokLen", "begin_line", "end_line", "file")
 
-    if t == "int":
-        return 4
-    elif t == "long int":
-        return 8
-    else:
-        print(t, "not implemented")
-        return -1
+    def __init__(self, begin_offset: int, begin_col: int, begin_tokLen: int,
+                 end_offset: int, end_col: int, end_tokLen: int,
+                 begin_line: int = None, end_line: int = None, file: str = None):
+        self.begin_offset, self.begin_col, self.begin_tokLen = begin_offset, begin_col, begin_tokLen
+        self.end_offset, self.end_col, self.end_tokLen = end_offset, end_col, end_tokLen
+        self.begin_line, self.end_line, self.file = begin_line, end_line, file
+
+    def __str__(self):
+        return "{}:{}:{}-{}:{}".format(self.file, self.begin_line, self.begin_col,
+                                      self.end_line, self.end_col + self.end_tokLen)
 
 
-class Range:
+class SubtreeIndex:
     """
-    TODO describe
+    Euler tour over the subtree of `root`: each node gets an `enter` number
+    (its position in pre-order) and `exit[enter]`, the largest enter number
+    within its subtree. For every node class the enter numbers are stored in
+    sorted order, hence all nodes of a class below a node are found via
+    binary search instead of walking the subtree again.
     """
 
-    def __init__(self, begin_offset: int, begin_col: int, begin_tokLen: int,
-                 end_offset: int, end_col: int, end_tokLen: int):
-        self.begin_offset, self.begin_col, self.begin_tokLen = begin_offset, begin_col, begin_tokLen
-        self.end_offset, self.end_col, self.end_tokLen = end_offset, end_col, end_tokLen
+    def __init__(self, root):
+        self.nodes = []
+        self.exit = []
+        self.enter = {}
+        self.classes = {}
+
+        # single traversal in pre-order, the `int`s on the stack mark the
+        # end of the subtree of the node with this enter number.
+        stack = [root]
+        while stack:
+            n = stack.pop()
+            if type(n) is int:
+                self.exit[n] = len(self.nodes) - 1
+                continue
+
+            i = len(self.nodes)
+            self.nodes.append(n)
+            self.exit.append(i)
+            self.enter[id(n)] = i
+            self.classes.setdefault(type(n), []).append(i)
+            stack.append(i)
+            if n.inner:
+                stack.extend(reversed(n.inner))
+
+    def find(self, node, t):
+        """
+        :return: all nodes of class `t` below `node` in pre-order
+        """
+        enters = self.classes.get(t)
+        if enters is None:
+            return []
+        i = self.enter[id(node)]
+        lo = bisect_right(enters, i)
+        hi = bisect_right(enters, self.exit[i], lo)
+        return [self.nodes[j] for j in enters[lo:hi]]
+
+
+class DeclIndex:
+    """
+    maps the ids of all nodes below `root` to the nodes and each declaration
+    to the `DeclRefExpr`s referencing it. Redeclarations (`previousDecl`)
+    share their usages with the first declaration. Built in a single
+    traversal, afterwards references are resolved via dict lookups.
+    """
+
+    def __init__(self, root):
+        self.ids = {}
+        # id of the first declaration -> `DeclRefExpr`s in pre-order
+        self.uses = {}
+        self.__canonical = {}
+        decl_stmts = []
+
+        stack = [root]
+        while stack:
+            n = stack.pop()
+            d = n.__dict__
+            self.ids[n.id] = n
+            prev = d.get("previousDecl")
+            if prev is not None:
+                self.__canonical[n.id] = self.__canonical.get(prev, prev)
+            ref = d.get("referencedDecl")
+            if type(ref) is dict and "id" in ref:
+                i = self.__canonical.get(ref["id"], ref["id"])
+                self.uses.setdefault(i, []).append(n)
+            if type(n) is DeclStmt:
+                decl_stmts.append(n)
+            if n.inner:
+                stack.extend(reversed(n.inner))
+
+        for n in decl_stmts:
+            n.refs = []
+            for decl in n.inner or []:
+                n.refs.extend(self.get_usages(decl))
+
+    def get_node(self, id: str):
+        """
+        :return: the node with `id` or None, e.g. if its declaration was
+            skipped by a `SourceFilter`
+        """
+        return self.ids.get(id)
+
+    def get_usages(self, decl):
+        """
+        :return: all `DeclRefExpr`s referencing `decl` or one of its
+            redeclarations
+        """
+        return self.uses.get(self.__canonical.get(decl.id, decl.id), [])
 
 
-class Location:
+class LocationIndex:
     """
-    wrapper around clangs `loc` field.
+    interval index over the source ranges of all nodes below `root`. The
+    elided files and lines of clangs output are resolved in a single pass
+    in dump order. For each file the boundaries of all ranges split the
+    file into elementary segments, each one is assigned the innermost node
+    covering it. A position is then looked up via binary search.
+    Ranges are assumed to be nested (or disjoint), as within an AST.
     """
 
-    def __init__(self, offset: int, file: str, line: int, col: int, tokLen: int):
-        self.offset = offset
-        self.file = file
-        self.line = line
-        self.col = col
-        self.tokLen = tokLen
+    def __init__(self, root, cwd: str = None):
+        """
+        :param cwd: working directory of clang, relative file names are
+            relative to it
+        """
+        self.cwd = cwd
+        # file id -> file
+        self.files = []
+        self.__file_ids = {}
+        self.nodes = []
+        # `Range` of each node in pre-order, or None
+        self.ranges = []
+        self.file_ids = array("i")
+        self.__segments = {}
+        # id(node) -> position in pre-order
+        self.__positions = {}
+
+        state = [None, None]
+        resolved = {}
+
+        def visit(loc, f, l):
+            resolved[id(loc)] = (f, l)
+
+        stack = [root]
+        while stack:
+            n = stack.pop()
+            for k, v in n.__dict__.items():
+                if not k.startswith("_") and k != "inner" and (type(v) is dict or type(v) is list):
+                    _walk_locations(v, state, visit, k)
+
+            r = None
+            rng = n.__dict__.get("range")
+            if type(rng) is dict:
+                b = _expansion(rng.get("begin"))
+                e = _expansion(rng.get("end"))
+                if b is not None and e is not None and id(b) in resolved and id(e) in resolved:
+                    (bf, bl), (ef, el) = resolved[id(b)], resolved[id(e)]
+                    if bf is not None and bf == ef:
+                        r = Range(b["offset"], b.get("col", 0), b.get("tokLen", 0),
+                                  e["offset"], e.get("col", 0), e.get("tokLen", 0), bl, el, bf)
+            resolved.clear()
+
+            self.__positions[id(n)] = len(self.nodes)
+            self.nodes.append(n)
+            self.ranges.append(r)
+            self.file_ids.append(self.file_id(r.file, True) if r is not None else -1)
+            if n.inner:
+                stack.extend(reversed(n.inner))
+
+    def file_id(self, file: str, add: bool = False):
+        """
+        :param file: as written by clang, or its absolute path
+        :return: the id of `file` or -1
+        """
+        ret = self.__file_ids.get(file)
+        if ret is None:
+            path = os.path.abspath(os.path.join(self.cwd or "", file))
+            ret = self.__file_ids.get(path, -1)
+            if ret < 0 and add:
+                ret = len(self.files)
+                self.files.append(file)
+                self.__file_ids[file] = ret
+                self.__file_ids.setdefault(path, ret)
+        return ret
 
-    def __str__(self):
-        return self.file + str(self.line) + ":" + str(self.col) + ":" + str(self.tokLen)
+    def __build(self, by_line: bool):
+        """
+        computes the elementary segments of all files
+        :param by_line: the segments are bounded by `(line, col)` instead
+            of offsets
+        :return: file id -> (begins of the segments, index of the innermost node)
+        """
+        items = {}
+        for i, r in enumerate(self.ranges):
+            if r is None:
+                continue
+            if by_line:
+                if r.begin_line is None or r.end_line is None:
+                    continue
+                b, e = (r.begin_line, r.begin_col), (r.end_line, r.end_col + r.end_tokLen)
+            else:
+                b, e = r.begin_offset, r.end_offset + r.end_tokLen
+            if b < e:
+                items.setdefault(self.file_ids[i], []).append((b, e, i))
+
+        ret = {}
+        for f, ranges in items.items():
+            # outer ranges first, on equal ranges the node further down
+            ranges.sort(key=lambda x: x[1], reverse=True)
+            ranges.sort(key=lambda x: x[0])
+            begins, owners = [], []
+
+            def emit(pos, owner):
+                if begins and begins[-1] == pos:
+                    owners[-1] = owner
+                else:
+                    begins.append(pos)
+                    owners.append(owner)
+
+            stack = []
+            for b, e, i in ranges:
+                while stack and stack[-1][0] <= b:
+                    end, _ = stack.pop()
+                    emit(end, stack[-1][1] if stack else -1)
+                if stack:
+                    e = min(e, stack[-1][0])
+                emit(b, i)
+                stack.append((e, i))
+            while stack:
+                end, _ = stack.pop()
+                emit(end, stack[-1][1] if stack else -1)
+            ret[f] = (begins, owners)
+        return ret
+
+    def __find(self, file: str, offset: int, line: int, col: int):
+        """
+        :return: the index of the innermost node or -1
+        """
+        by_line = offset is None
+        if by_line not in self.__segments:
+            self.__segments[by_line] = self.__build(by_line)
+        segments = self.__segments[by_line].get(self.file_id(file))
+        if segments is None:
+            return -1
+        begins, owners = segments
+        j = bisect_right(begins, (line, col) if by_line else offset) - 1
+        return owners[j] if j >= 0 else -1
+
+    def get_range(self, node):
+        """
+        :return: the `Range` of `node` or None
+        """
+        i = self.__positions.get(id(node))
+        return self.ranges[i] if i is not None else None
+
+    def innermost(self, file: str, offset: int = None, line: int = None, col: int = None):
+        """
+        :param file: as written by clang, or its absolute path
+        :param offset: byte offset within `file`, or `line` and `col`
+        :return: the innermost node whose range covers the position or None
+        """
+        i = self.__find(file, offset, line, col)
+        return self.nodes[i] if i >= 0 else None
+
+    def enclosing(self, file: str, offset: int = None, line: int = None, col: int = None):
+        """
+        :return: all nodes whose range covers the position, from the
+            innermost to the outermost one
+        """
+        n = self.innermost(file, offset, line, col)
+        ret = []
+        while n is not None:
+            if self.get_range(n) is not None:
+                ret.append(n)
+            n = n.parent
+        return ret
+
+
+def _expansion(loc):
+    """
+    :return: the location where a (possibly macro) location appears in the file
+    """
+    if type(loc) is not dict:
+        return None
+    if "expansionLoc" in loc:
+        loc = loc["expansionLoc"]
+    return loc if "offset" in loc else None
+
+
+class ParseContext:
+    """
+    state of a single parse. It is passed down to every `Node` while the
+    tree is constructed and collects the declarations, so several parses
+    can run at the same time (e.g. in different threads).
+    """
+
+    # keys of the json objects whose (often repeated) string values are interned
+    INTERNED_KEYS = ("name", "valueCategory", "castKind", "opcode", "storageClass")
+
+    def __init__(self, lazy: bool = False, intern_strings: bool = True):
+        """
+        :param lazy: if true, the nodes keep their raw `inner` payload and
+            translate it on first access.
+        :param intern_strings: if true, repeated strings (kinds, names,
+            files, ...) are stored only once and equal `type` objects are
+            shared between the nodes, see `intern`.
+        """
+        self.lazy = lazy
+        self.intern_strings = intern_strings
+        # (key, value) pairs of a `type` object -> the shared object
+        self.types = {}
+        self.function_decls = []
+        self.compound_decls = []
+        self.for_loop_decls = []
+        self.while_loop_decls = []
+        self.do_loop_decls = []
+
+    def intern(self, fields: dict):
+        """
+        replaces the strings of the json object `fields` of a node, which are
+        repeated throughout a translation unit (e.g. the file of every
+        location, `int`, `lvalue`), by a single instance via `sys.intern`.
+        Equal `type` objects are replaced by a single shared one.
+        """
+        for k in ParseContext.INTERNED_KEYS:
+            v = fields.get(k)
+            if type(v) is str:
+                fields[k] = sys.intern(v)
+        t = fields.get("type")
+        if type(t) is dict:
+            fields["type"] = self.intern_type(t)
+
+        loc = fields.get("loc")
+        if type(loc) is dict:
+            _intern_location(loc)
+        r = fields.get("range")
+        if type(r) is dict:
+            for loc in r.values():
+                if type(loc) is dict:
+                    _intern_location(loc)
+
+        ref = fields.get("referencedDecl")
+        if type(ref) is dict:
+            for k in ("kind", "name"):
+                if type(ref.get(k)) is str:
+                    ref[k] = sys.intern(ref[k])
+            if type(ref.get("type")) is dict:
+                ref["type"] = self.intern_type(ref["type"])
+
+    def intern_type(self, t: dict):
+        """
+        :return: the shared object equal to the `type` object `t`
+        """
+        try:
+            key = tuple(t.items())
+            ret = self.types.get(key)
+        except TypeError:
+            # not hashable, e.g. nested objects
+            return t
+        if ret is None:
+            ret = {k: sys.intern(v) if type(v) is str else v for k, v in t.items()}
+            self.types[key] = ret
+        return ret
+
+
+def _intern_location(loc: dict):
+    """
+    interns the file of a single location of the json output
+    """
+    for k in ("file", "spellingLoc", "expansionLoc", "includedFrom"):
+        v = loc.get(k)
+        if type(v) is str:
+            loc[k] = sys.intern(v)
+        elif type(v) is dict:
+            _intern_location(v)
 
 
 class Node:
     """
     """
 
-    def __init__(self, id: str, kind: str, *args, **kwargs):
+    def __init__(self, id: str, kind: str, *args, lazy: bool = False,
+                 ctx: ParseContext = None, **kwargs):
         """
         id and kind are mandatory, hence we are enforcing them
         as function arguments
+        :param lazy: if true, the raw `inner` payload is kept and only
+            translated into nodes on the first access of `inner`.
+            Only used if no `ctx` is given.
+        :param ctx: context of the parse this node belongs to. If None, a
+            new one is created for this node and its children.
         """
         self.id = id
-        self.kind = kind
+        self.kind = sys.intern(kind)
         self.__dict__.update((k, v) for k, v in kwargs.items() if k not in ["inner"])
         self.parent = None
-        self.__parse_inner(**kwargs)
+        self._ctx = ctx if ctx is not None else ParseContext(lazy)
+        if self._ctx.intern_strings:
+            self._ctx.intern(self.__dict__)
+        inner = kwargs["inner"] if "inner" in kwargs else None
+        if self._ctx.lazy and type(inner) is list and len(inner) > 0:
+            self._raw_inner = inner
+        else:
+            self.__parse_inner(**kwargs)
+
+    def __getattr__(self, name: str):
+        """
+        only called if `name` is not set. For lazy nodes this is the case
+        for `inner` until its first access.
+        """
+        if name != "inner" or "_raw_inner" not in self.__dict__:
+            raise AttributeError("'{}' object has no attribute '{}'".format(
+                type(self).__name__, name))
+        self.__parse_inner(inner=self.__dict__.pop("_raw_inner"))
+        return self.inner
 
     def __parse_inner(self, **kwargs):
         """
@@ -99,11 +464,15 @@ class Node:
         self.inner = []
         if type(inner) is list and len(inner) > 0:
             for inn in inner:
-                if len(inn.keys()) == 0:
-                    continue
-
-                C = str_to_class(inn["kind"])
-                n = C(**inn)
+                # already constructed by `build_from_events`
+                if isinstance(inn, Node):
+                    n = inn
+                else:
+                    if len(inn.keys()) == 0:
+                        continue
+
+                    C = NODE_CLASSES.get(inn["kind"], UnknownNode)
+                    n = C(ctx=self._ctx, **inn)
                 n.parent = self
                 self.inner.append(n)
         else:
@@ -112,6 +481,10 @@ class Node:
     def reparse(self, out, t, recursive=True, check=None):
         """ reparse the current `inner` nodes for type `t` and appends them
         to out"""
+        if recursive and check is None:
+            out.extend(self.get_subtree_index().find(self, t))
+            return out
+
         if self.inner is not None:
             for tmp in self.inner:
                 if type(tmp) is t:
@@ -125,6 +498,52 @@ class Node:
 
         return out
 
+    def get_subtree_index(self):
+        """
+        returns the `SubtreeIndex` of the enclosing function (or of the
+        whole tree, if this node is not within a function). It is built on
+        first use.
+        """
+        n = self
+        while n.parent is not None and type(n) is not FunctionDecl:
+            n = n.parent
+        if "_subtree_index" not in n.__dict__:
+            n._subtree_index = SubtreeIndex(n)
+        return n._subtree_index
+
+    def get_decl_index(self):
+        """
+        returns the `DeclIndex` of the whole tree, which is built on first
+        use.
+        """
+        n = self
+        while n.parent is not None:
+            n = n.parent
+        if "_decl_index" not in n.__dict__:
+            n._decl_index = DeclIndex(n)
+        return n._decl_index
+
+    def get_location_index(self, cwd: str = None):
+        """
+        returns the `LocationIndex` of the whole tree, which is built on
+        first use.
+        :param cwd: working directory of clang, used to resolve relative
+            file names on the first call
+        """
+        n = self
+        while n.parent is not None:
+            n = n.parent
+        if "_location_index" not in n.__dict__:
+            n._location_index = LocationIndex(n, cwd)
+        return n._location_index
+
+    def get_range(self):
+        """
+        returns a `Range` object with resolved file and lines if available
+        else None
+        """
+        return self.get_location_index().get_range(self)
+
     def reparse_single(self, out, t):
         """ reparse the current `inner` nodes for a single type `t`. The
         on first occurrence will set `out` to it, quits afterward"""
@@ -267,6 +686,25 @@ class FunctionDecl(Node):
         self.__arguments = []
         self.__return_type = []
         self.__body = None
+        self.__analysed = False
+        if not self._ctx.lazy:
+            self.__analyse()
+
+        # kind of strange
+        try:
+            self.__return_type = kwargs["type"]["qualType"]
+        except:
+            self.__return_type = ""
+        # NOTE: we cannot assert this, because there are empty function
+        # assert self.__body
+        self._ctx.function_decls.append(self)
+
+    def __analyse(self):
+        """
+        computes the arguments and the body. In lazy mode this is delayed
+        until the first call to one of the accessors.
+        """
+        self.__analysed = True
 
         # find the function arguments
         if self.inner is not None:
@@ -279,24 +717,26 @@ class FunctionDecl(Node):
                 if type(i) is CompoundStmt:
                     self.__body = i
 
-        # kind of strange
-        try:
-            self.__return_type = kwargs["type"]["qualType"]
-        except:
-            self.__return_type = ""
-        # NOTE: we cannot assert this, because there are empty function
-        # assert self.__body
-        functions_decls.append(self)
-
     def get_arguments(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__arguments
 
     def get_body(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__body
 
     def get_return_type(self):
         return self.__return_type
 
+    def usages(self):
+        """
+        returns the `DeclRefExpr`s referencing this function or one of its
+        redeclarations, e.g. the callees of calls
+        """
+        return self.get_decl_index().get_usages(self)
+
 
 class CompoundStmt(Node):
     def __init__(self, id: str, kind: str, *args, **kwargs):
@@ -314,6 +754,16 @@ class CompoundStmt(Node):
         self.__while_loops = []
         self.__calls = []
         self.__do_loops = []
+        self.__analysed = False
+        self._ctx.compound_decls.append(self)
+
+    def __analyse(self):
+        """
+        collects the statements of this block. This is delayed until the
+        first call to one of the accessors, i.e. after the whole tree is
+        built, so the `SubtreeIndex` can be used.
+        """
+        self.__analysed = True
         self.__isempty = self.inner is None
 
         self.reparse(self.__var_decls, DeclStmt, recursive=False)
@@ -321,9 +771,10 @@ class CompoundStmt(Node):
         self.reparse(self.__while_loops, WhileStmt)
         self.reparse(self.__do_loops, DoStmt)
         self.reparse(self.__calls, CallExpr)
-        compound_decls.append(self)
 
     def get_var_decls(self, i: int = None):
+        if not self.__analysed:
+            self.__analyse()
         if i is not None:
             if i > len(self.__var_decls):
                 print("OOB")
@@ -332,6 +783,8 @@ class CompoundStmt(Node):
         return self.__var_decls
 
     def get_for_loops(self, i: int = None):
+        if not self.__analysed:
+            self.__analyse()
         if i is not None:
             if i > len(self.__for_loops):
                 print("OOB")
@@ -340,6 +793,8 @@ class CompoundStmt(Node):
         return self.__for_loops
 
     def get_do_loops(self, i: int = None):
+        if not self.__analysed:
+            self.__analyse()
         if i is not None:
             if i > len(self.__do_loops):
                 print("OOB")
@@ -348,6 +803,8 @@ class CompoundStmt(Node):
         return self.__do_loops
 
     def get_while_loops(self, i: int = None):
+        if not self.__analysed:
+            self.__analyse()
         if i is not None:
             if i > len(self.__while_loops):
                 print("OOB")
@@ -367,6 +824,11 @@ class DeclStmt(Node):
         self.refs = []
 
     def get_references(self):
+        """
+        returns the `DeclRefExpr`s referencing the variables declared by
+        this statement
+        """
+        self.get_decl_index()
         return self.refs
 
 
@@ -376,8 +838,15 @@ class VarDecl(Node):
         """
         super().__init__(id, kind, *args, **kwargs)
         self.__init_value = None
+        self.__analysed = False
+        if not self._ctx.lazy:
+            self.__analyse()
 
-        # parse/check for integer declarations
+    def __analyse(self):
+        """
+        parse/check for integer declarations
+        """
+        self.__analysed = True
         if (self.inner is not None and
                 len(self.inner) == 1 and
                 type(self.inner[0]) is IntegerLiteral):
@@ -402,6 +871,8 @@ class VarDecl(Node):
     def get_init_value(self):
         """
         """
+        if not self.__analysed:
+            self.__analyse()
         return self.__init_value
 
     def is_const(self):
@@ -410,6 +881,13 @@ class VarDecl(Node):
         """
         raise NotImplementedError
 
+    def usages(self):
+        """
+        returns the list of usages of this variable, i.e. the `DeclRefExpr`s
+        referencing it.
+        """
+        return self.get_decl_index().get_usages(self)
+
 
 class ParmVarDecl(Node):
     def __init__(self, id: str, kind: str, *args, **kwargs):
@@ -449,11 +927,10 @@ class ParmVarDecl(Node):
 
     def usages(self):
         """
-        This is rather cool: returns the list of usages of this variable.
-        This is just the list of Nodes where this is in the `inner` field
-        as a `DeclRef`
+        returns the list of usages of this variable, i.e. the `DeclRefExpr`s
+        referencing it.
         """
-        raise NotImplementedError
+        return self.get_decl_index().get_usages(self)
 
 
 class TypedefDecl(Node):
@@ -500,6 +977,13 @@ class DeclRefExpr(Node):
     def get_reference_id(self):
         return self.__dict__["referencedDecl"]["id"]
 
+    def get_referenced_decl(self):
+        """
+        returns the referenced declaration or None, if it is not part of
+        the tree
+        """
+        return self.get_decl_index().get_node(self.get_reference_id())
+
 class BinaryOperator(Node):
     pass
 
@@ -540,7 +1024,17 @@ class ForStmt(Node):
         self.__upper_limit = None
         self.__step_size = None
         self.__body = None
+        self.__analysed = False
+
+        # append the decl to the declarations of this parse
+        self._ctx.for_loop_decls.append(self)
 
+    def __analyse(self):
+        """
+        computes the body and the limits of the loop. This is delayed until
+        the first call to one of the accessors.
+        """
+        self.__analysed = True
         self.__body = self.reparse_single(self.__body, CompoundStmt)
         if self.__body is not None:
             self.__var_decl = self.__body.reparse(self.__var_decls, DeclStmt)
@@ -555,39 +1049,54 @@ class ForStmt(Node):
             self.__upper_limit = self.inner[1]
             self.__step_size = self.inner[2]
 
-        # append the decl to the global declaration
-        for_loop_decls.append(self)
-
     def is_basic_loop(self):
         """
         returns true if the loop is of the simplest form:
             for(int i = 0; i < 32; i++){ ... }
 
         """
+        if not self.__analysed:
+            self.__analyse()
         return self.__is_basic_loop
 
     def get_var_decls(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__var_decls
 
     def get_func_calls(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__func_calls
 
     def get_break_stmts(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__break_stmts
 
     def get_lower_limit(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__lower_limit
 
     def get_upper_limit(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__lower_limit
 
     def get_step_size(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__step_size
 
     def get_body(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__body
 
     def get_variables(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__var_decls
     
     def print(self):
@@ -610,16 +1119,25 @@ class WhileStmt(Node):
         self.__func_calls = []
         self.__break_stmts = []
         self.__body = None
+        self.__analysed = False
 
+        self._ctx.while_loop_decls.append(self)
+
+    def __analyse(self):
+        """
+        computes the body of the loop. This is delayed until the first call
+        to one of the accessors.
+        """
+        self.__analysed = True
         self.__body = self.reparse_single(self.__body, CompoundStmt)
         if self.__body is not None:
             self.__var_decl = self.__body.reparse(self.__var_decls, DeclStmt)
             self.__func_calls = self.__body.reparse(self.__func_calls, CallExpr)
             self.__break_stmts = self.__body.reparse(self.__break_stmts, BreakStmt, recursive=False)
 
-        while_loop_decls.append(self)
-
     def get_variables(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__var_decls
 
     def print(self):
@@ -642,16 +1160,25 @@ class DoStmt(Node):
         self.__func_calls = []
         self.__break_stmts = []
         self.__body = None
+        self.__analysed = False
 
+        self._ctx.do_loop_decls.append(self)
+
+    def __analyse(self):
+        """
+        computes the body of the loop. This is delayed until the first call
+        to one of the accessors.
+        """
+        self.__analysed = True
         self.reparse_single(self.__body, CompoundStmt)
         if self.__body is not None:
             self.__var_decl = self.__body.reparse(self.__var_decls, DeclStmt)
             self.__func_calls = self.__body.reparse(self.__func_calls, CallExpr)
             self.__break_stmts = self.__body.reparse(self.__break_stmts, BreakStmt, recursive=False)
 
-        while_loop_decls.append(self)
-
     def get_variables(self):
+        if not self.__analysed:
+            self.__analyse()
         return self.__var_decls
 
     def print(self):
@@ -730,8 +1257,17 @@ class CallExpr(Node):
         """
         super().__init__(id, kind, *args, **kwargs)
         self.__arguments = []
+        self.__analysed = False
+
+    def __analyse(self):
+        self.__analysed = True
         self.reparse(self.__arguments, DeclRefExpr)
 
+    def get_arguments(self):
+        if not self.__analysed:
+            self.__analyse()
+        return self.__arguments
+
 
 class GNUInlineAttr(Node):
     pass
@@ -774,6 +1310,411 @@ class CXXNullPtrLiteralExpr(Node):
     pass
 
 
+class UnknownNode(Node):
+    """
+    fallback for all kinds without a dedicated class, e.g. `StringLiteral`
+    """
+    pass
+
+
+# kind -> class of the node, built once at import time. `UnknownNode` is
+# used for all kinds which are not within this dict.
+NODE_CLASSES = {k: C for k, C in list(globals().items())
+                if isinstance(C, type) and issubclass(C, Node) and
+                C is not Node and C is not UnknownNode}
+
+
+def register_node(kind: str, C: type = None):
+    """
+    registers (or replaces) the class used for nodes of kind `kind`.
+    Can also be used as decorator:
+        @register_node("StringLiteral")
+        class StringLiteral(Node):
+            ...
+    :param C: subclass of `Node`
+    """
+    def register(C: type):
+        assert issubclass(C, Node)
+        NODE_CLASSES[kind] = C
+        return C
+
+    if C is None:
+        return register
+    return register(C)
+
+
+def _track_file(obj, last: str, parent_key: str = None):
+    """
+    clang only writes the `file` of a location if it differs from the
+    previously written one. This function walks `obj` in dump order and
+    returns the last file mentioned within it (or `last` if there is none).
+    """
+    if type(obj) is dict:
+        for k, v in obj.items():
+            if k == "file" and parent_key != "includedFrom":
+                last = v
+            elif type(v) is dict or type(v) is list:
+                last = _track_file(v, last, k)
+    elif type(obj) is list:
+        for v in obj:
+            if type(v) is dict or type(v) is list:
+                last = _track_file(v, last, parent_key)
+    return last
+
+
+# keys of the json output containing a source location
+_LOCATION_KEYS = frozenset(("loc", "begin", "end", "spellingLoc", "expansionLoc"))
+
+
+def _walk_locations(obj, state: list, visit, parent_key: str = None):
+    """
+    walks `obj` (a `Node` or a part of the json output) in dump order and
+    calls `visit(location, file, line)` for each source location, with the
+    `file` and `line` resolved as described in `_track_file`.
+    :param state: `[file, line]` of the previously written location. It is
+        updated while walking.
+    """
+    if isinstance(obj, Node):
+        d = obj.__dict__
+        for k, v in d.items():
+            if not k.startswith("_") and k != "inner" and (type(v) is dict or type(v) is list):
+                _walk_locations(v, state, visit, k)
+        inner = d["inner"] if "inner" in d else d.get("_raw_inner")
+        for n in inner or []:
+            _walk_locations(n, state, visit, "inner")
+    elif type(obj) is dict:
+        if parent_key in _LOCATION_KEYS and "offset" in obj:
+            if "file" in obj:
+                state[0] = obj["file"]
+            if "line" in obj:
+                state[1] = obj["line"]
+            visit(obj, state[0], state[1])
+            return
+        for k, v in obj.items():
+            if k != "includedFrom" and (type(v) is dict or type(v) is list or isinstance(v, Node)):
+                _walk_locations(v, state, visit, k)
+    elif type(obj) is list:
+        for v in obj:
+            # e.g. `DeclStmt.refs`, only the `inner` nodes belong to the tree
+            if isinstance(v, Node) and parent_key != "inner":
+                continue
+            _walk_locations(v, state, visit, parent_key)
+
+
+class SourceFilter:
+    """
+    decides which top level declarations of a translation unit are
+    translated into `Node`s, based on the file they are located in.
+    Declarations which are not kept are either dropped or, if `stubs` is
+    set, replaced by a node only containing `id`, `kind`, `name`, `type`
+    and `loc`.
+    """
+    SYSTEM_PREFIXES = ["/usr/include", "/usr/local/include", "/usr/lib",
+                       "/opt/homebrew", "/Library/Developer", "/Applications/Xcode.app"]
+
+    def __init__(self, main_file: Union[str, Path], skip_system: bool = True,
+                 allow: list[str] = None, stubs: bool = False, system_dirs: list[str] = None):
+        """
+        :param main_file: the file which is parsed. Its declarations are always kept.
+        :param skip_system: drop declarations from system headers
+        :param allow: if given, only declarations from the main file or
+            from files below one of these paths are kept
+        :param stubs: keep dropped declarations as stubs
+        :param system_dirs: system include directories of the compiler, in
+            addition to `SYSTEM_PREFIXES`
+        """
+        self.main_file = os.path.abspath(main_file)
+        self.skip_system = skip_system
+        self.allow = [os.path.abspath(a) for a in allow] if allow is not None else None
+        self.stubs = stubs
+        self.system_dirs = SourceFilter.SYSTEM_PREFIXES + [
+            os.path.join(d, "") for d in system_dirs or [] if d not in SourceFilter.SYSTEM_PREFIXES]
+        self.__cache = {}
+
+    def keep(self, file: str):
+        """
+        :param file: the (resolved) file of a declaration or None
+        :return: true if the declaration should be kept
+        """
+        if file is None:
+            # compiler builtins like `__int128_t`
+            return not self.skip_system and self.allow is None
+
+        ret = self.__cache.get(file)
+        if ret is not None:
+            return ret
+
+        path = os.path.abspath(file)
+        if path == self.main_file:
+            ret = True
+        elif self.allow is not None:
+            ret = any(path.startswith(a) for a in self.allow)
+        else:
+            ret = not (self.skip_system and
+                       any(path.startswith(p) for p in self.system_dirs))
+        self.__cache[file] = ret
+        return ret
+
+    def stub(self, data: dict, file: str):
+        """
+        :return: the reduced version of the json object `data`
+        """
+        ret = {k: data[k] for k in ("id", "kind", "name", "type") if k in data}
+        ret["loc"] = dict(data["loc"], file=file) if "loc" in data else {}
+        return ret
+
+    def filter(self, inner: list):
+        """
+        filters the top level declarations `inner` of an already loaded
+        `TranslationUnitDecl`
+        """
+        ret = []
+        last = None
+        for d in inner:
+            if "loc" in d:
+                last = _track_file(d["loc"], last, "loc")
+
+            if self.keep(last):
+                ret.append(d)
+            elif self.stubs:
+                ret.append(self.stub(d, last))
+            last = _track_file(d, last)
+        return ret
+
+    def events(self, events):
+        """
+        filters the top level declarations of a `TranslationUnitDecl` within
+        a stream of json events. The events of each declaration are buffered
+        until its `loc` is known, afterwards they are either passed through
+        or skipped without building anything.
+        :param events: iterator over (event, value) pairs
+        """
+        # keys of the currently open containers
+        keys = []
+        key = None
+        last = None
+        root = None
+        buf = None
+        stub = False
+        # skip all events until only `skip` containers are open again
+        skip = -1
+        for event, value in events:
+            closed = popped = None
+            if event == "map_key":
+                key = value
+            elif event == "start_map" or event == "start_array":
+                keys.append(key)
+            elif event == "end_map" or event == "end_array":
+                closed = True
+                popped = keys.pop()
+                if not keys:
+                    root = None
+            elif event == "string":
+                if key == "file" and keys[-1] != "includedFrom":
+                    last = value
+                elif key == "kind" and len(keys) == 1:
+                    root = value
+
+            if skip >= 0:
+                if closed and len(keys) == skip:
+                    skip = -1
+                continue
+
+            if buf is None:
+                if root == "TranslationUnitDecl" and len(keys) >= 2 and keys[1] == "inner":
+                    if event == "start_map" and len(keys) == 3:
+                        buf = [(event, value)]
+                        stub = False
+                        continue
+                    if stub and event == "map_key" and len(keys) == 3 and \
+                            (value == "range" or value == "inner"):
+                        skip = 3
+                        continue
+                yield event, value
+                continue
+
+            buf.append((event, value))
+            # the declaration is either finished or its location is known
+            if closed and (len(keys) == 2 or (len(keys) == 3 and popped == "loc")):
+                if self.keep(last):
+                    yield from buf
+                elif self.stubs and len(keys) == 3:
+                    buf.insert(-1, ("map_key", "file"))
+                    buf.insert(-1, ("string", last))
+                    yield from buf
+                    stub = True
+                elif len(keys) == 3:
+                    skip = 2
+                buf = None
+
+
+def build_from_events(events, source_filter: SourceFilter = None,
+                      ctx: ParseContext = None):
+    """
+    builds the AST bottom-up from a stream of json events (see `stream.py`).
+    Each json object within an `inner` list is turned into its `Node` as soon
+    as it is closed, hence only the already constructed nodes and the path
+    from the root to the current object are kept in memory.
+    :param events: iterator over (event, value) pairs
+    :param source_filter: if given, top level declarations which are not
+        kept by the filter are skipped without building anything.
+    :param ctx: context of the parse, a new one is created if None. If
+        `ctx.lazy` is set, only the root and the top level declarations are
+        built, everything below is kept as json objects and translated on access.
+    :return: list of the top level nodes. Normally this is a single
+        `TranslationUnitDecl`, but clang emits one value for each match
+        if `-ast-dump-filter=` is used.
+    """
+    if source_filter is not None:
+        events = source_filter.events(events)
+    if ctx is None:
+        ctx = ParseContext()
+    lazy = ctx.lazy
+
+    roots = []
+    # stack of [key within the parent, container]
+    stack = []
+    key = None
+    for event, value in events:
+        if event == "map_key":
+            key = value
+        elif event == "start_map":
+            stack.append((key, {}))
+        elif event == "start_array":
+            stack.append((key, []))
+        elif event == "end_map" or event == "end_array":
+            key, value = stack.pop()
+            # only the elements of the `inner` list of a node are nodes, not
+            # e.g. the `referencedDecl` of a `DeclRefExpr`
+            if event == "end_map" and "kind" in value and \
+                    (not stack or (type(stack[-1][1]) is list and stack[-1][0] == "inner" and
+                                   len(stack) >= 2 and "kind" in stack[-2][1])) and \
+                    (not lazy or len(stack) <= 2):
+                value = NODE_CLASSES.get(value["kind"], UnknownNode)(ctx=ctx, **value)
+            if not stack:
+                roots.append(value)
+                continue
+
+            parent = stack[-1][1]
+            if type(parent) is list:
+                parent.append(value)
+            else:
+                parent[key] = value
+        else:
+            parent = stack[-1][1]
+            if type(parent) is list:
+                parent.append(value)
+            else:
+                parent[key] = value
+
+    return roots
+
+
+def _line_changes(old: bytes, new: bytes):
+    """
+    line based diff of two versions of a file
+    :return: list of changes `(begin, end, offset_delta, line, line_delta)`,
+        with `[begin, end)` being the replaced bytes and `line` the first
+        line (1 based) after the replaced lines within `old`. None if a
+        preprocessor directive was changed.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    old_offsets = [0]
+    for line in old_lines:
+        old_offsets.append(old_offsets[-1] + len(line))
+    new_offsets = [0]
+    for line in new_lines:
+        new_offsets.append(new_offsets[-1] + len(line))
+
+    import difflib
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if any(line.lstrip().startswith(b"#") for line in old_lines[i1:i2] + new_lines[j1:j2]):
+            return None
+        changes.append((old_offsets[i1], old_offsets[i2],
+                        (new_offsets[j2] - new_offsets[j1]) - (old_offsets[i2] - old_offsets[i1]),
+                        i2 + 1, (j2 - j1) - (i2 - i1)))
+    return changes
+
+
+def _shift_functions(changes: list):
+    """
+    :param changes: see `_line_changes`
+    :return: two functions translating an offset and a line of the old
+        version of the file into the new one
+    """
+    ends = [c[1] for c in changes]
+    lines = [c[3] for c in changes]
+    offset_deltas = [0]
+    line_deltas = [0]
+    for c in changes:
+        offset_deltas.append(offset_deltas[-1] + c[2])
+        line_deltas.append(line_deltas[-1] + c[4])
+
+    def shift_offset(offset: int):
+        return offset + offset_deltas[bisect_right(ends, offset)]
+
+    def shift_line(line: int):
+        return line + line_deltas[bisect_right(lines, line)]
+    return shift_offset, shift_line
+
+
+def _json_values(out: str):
+    """
+    :return: iterator over the json values within `out`. clang emits one
+        value per match of `-ast-dump-filter=`.
+    :raises ValueError: on invalid json
+    """
+    import json
+    decoder = json.JSONDecoder()
+    pos = 0
+    while True:
+        while pos < len(out) and out[pos].isspace():
+            pos += 1
+        if pos == len(out):
+            return
+        data, pos = decoder.raw_decode(out, pos)
+        yield data
+
+
+def clang_version(binary: str = None) -> Union[str, None]:
+    """
+    :param binary: defaults to `clang_parser.BINARY`
+    :return: first line of `clang --version` or None if clang can't be
+        executed. See `toolchain.discover`.
+    """
+    from python_c_cpp_parser.toolchain import discover
+    t = discover(binary if binary is not None else clang_parser.BINARY)
+    return t.version if t is not None else None
+
+
+def parse_depfile(data: str) -> list[str]:
+    """
+    parses the output of `-MD`, e.g.
+        main.o: main.c include/a.h \\
+          /usr/include/stdio.h
+    :return: all prerequisites, e.g. `["main.c", "include/a.h", ...]`
+    """
+    import re
+    data = data.replace("\\\n", " ")
+    deps = {}
+    for line in data.splitlines():
+        # `-MP` adds empty rules for each header
+        _, sep, rest = line.partition(": ")
+        if not sep:
+            continue
+        # spaces within paths are escaped as `\ `
+        for dep in re.split(r"(?<!\\)\s+", rest.strip()):
+            dep = dep.replace("\\ ", " ")
+            if dep:
+                deps[dep] = None
+    return list(deps)
+
+
 class clang_parser:
     """
     parser build around the command:
@@ -782,34 +1723,94 @@ class clang_parser:
     BINARY = "clang"
     COMMAND = ["-fsyntax-only", "-Xclang", "-ast-dump=json",
                "-fno-color-diagnostics", "-Wno-visibility", "-Wno-everything"]
+    # the name of the function is appended to the last argument
     COMMAND_FUNCTION_FILER = ["-Xclang", "-ast-dump-filter="]
 
-    def __init__(self, file: Union[str, Path], functions: list[str] = []):
+    def __init__(self, file: Union[str, Path], functions: list[str] = [],
+                 stream: bool = False, skip_system: bool = False,
+                 allow: list[str] = None, stubs: bool = False,
+                 lazy: bool = False, compact: bool = False,
+                 flags: list[str] = None, cwd: Union[str, Path] = None,
+                 dependencies: bool = False, cache: "ASTCache" = None,
+                 engine: str = "clang", pch: "PrecompiledHeader" = None):
         """
         :param functions: if given only parse the given functions into an AST
+        :param stream: if true, the json output of clang is not written into
+            a temporary file, but read through a pipe and converted into
+            `Node`s while clang is still running.
+        :param skip_system: if true, top level declarations from system
+            headers (e.g. everything from `<stdio.h>`) are not translated.
+        :param allow: if given, only top level declarations from the parsed
+            file or from files below one of these paths are translated.
+        :param stubs: keep the skipped declarations as stubs, containing
+            only their `id`, `kind`, `name`, `type` and `loc`.
+        :param lazy: only the top level declarations are translated into
+            `Node`s, everything below is translated on first access.
+        :param compact: store the AST as `CompactTree` (see `compact.py`).
+            `execute` returns a view of the root implementing the `Node`
+            accessors. Implies `stream`.
+        :param flags: additional compiler flags, e.g. `["-Iinclude", "-DN=1"]`
+        :param cwd: directory clang is executed in. Relative paths in `file`
+            and `flags` are relative to this directory.
+        :param dependencies: if true, the files included by `file` are
+            recorded via `-MD`. See `get_dependencies()`.
+        :param cache: `ASTCache` (see `cache.py`). clang is only executed
+            if `file`, one of its headers, the flags or clang changed.
+        :param engine: "clang" runs the clang binary, "libclang" parses
+            within this process via the libclang python bindings (see
+            `libclang.py`), which avoids the process and the json overhead.
+        :param pch: `PrecompiledHeader` (see `pch.py`) of the leading
+            includes of `file`, loaded instead of parsing them again. It is
+            (re)built on first use. NOTE: clang doesn't dump the declarations
+            loaded from the pch, hence the AST lacks the declarations of the
+            prelude, like with `skip_system` for system headers. References
+            to them keep their `id` and `name`, but `get_referenced_decl()`
+            returns None. If clang fails with the pch, e.g. as a header
+            changed in the meantime, the file is parsed again without it.
+            Not used by the "libclang" engine.
         """
         self.__file = file if type(file) is str else file.absolute()
-        self.__outfile = tempfile.NamedTemporaryFile(suffix=".json")
+        # created on the first run writing into it, see `__execute`
+        self.__outfile = None
         self.__functions = functions # TODO not implemented
-
-        # reset global variables
-        global functions_decls, compound_decls, for_loop_decls, while_loop_decls, do_loop_decls
-        functions_decls = []
-        compound_decls = []
-        for_loop_decls = []
-        while_loop_decls = []
-        do_loop_decls = []
-
+        self.__stream = stream
+        self.__lazy = lazy
+        self.__compact = compact
+        self.__flags = list(flags) if flags is not None else []
+        self.__cwd = str(cwd) if cwd is not None else None
+        self.__dependencies = [] if dependencies or cache is not None else None
+        self.__cache = cache
+        self.__engine = engine
+        self.__pch = pch
+        self.__filter = None
+        if skip_system or allow is not None:
+            t = clang_parser.get_toolchain() if skip_system else None
+            self.__filter = SourceFilter(self.__file, skip_system, allow, stubs,
+                                         t.include_dirs + t.cxx_include_dirs if t is not None else None)
+
+        self.__ctx = None
+        self.__root = None
+        self.__source = None
         self.__function_decls = []
         self.__compound_decls = []
         self.__for_loop_decls = []
         self.__while_loop_decls = []
         self.__do_loop_decls = []
 
-        if not os.path.isfile(self.__file):
+        if not os.path.isfile(os.path.join(self.__cwd or "", self.__file)):
             logging.error("file does not exists")
             return
 
+    def __getstate__(self):
+        """
+        the temporary file cannot be pickled, e.g. to send a parser back
+        from a worker of `parse_many`
+        """
+        state = self.__dict__.copy()
+        state["_clang_parser__outfile"] = None
+        state["_clang_parser__cache"] = None
+        return state
+
     def get_function_decls(self, i: int = None):
         if i is not None:
             if i > len(self.__function_decls):
@@ -819,58 +1820,585 @@ class clang_parser:
             return self.__function_decls[i]
         return self.__function_decls
 
-    def __available__(self):
+    def get_dependencies(self):
         """
-        :return: true if `clang` is available else false
+        :return: absolute paths of the parsed file and all files included by
+            it, or None if the parser was not created with `dependencies=True`
         """
-        cmd = [clang_parser.BINARY] + ["--version"]
-        p = Popen(cmd, stdin=PIPE, stdout=self.__outfile, stderr=STDOUT)
-        p.wait()
-        assert p.stdout
+        return self.__dependencies
 
-        if p.returncode != 0 and p.returncode is not None:
-            logging.error("couldn't execute: %s %s", " ".join(cmd), p.stdout.read())
+    def __main_file(self, file):
+        return str(file if file is not None else self.__file)
+
+    def get_node_at(self, offset: int = None, line: int = None, col: int = None,
+                    file: Union[str, Path] = None):
+        """
+        :param offset: byte offset, alternatively `line` and `col` (1-based)
+        :param file: defaults to the parsed file
+        :return: the innermost node whose source range covers the position or
+            None. Not available in `compact` mode.
+        """
+        if self.__root is None:
+            return None
+        return self.__root.get_location_index(self.__cwd).innermost(self.__main_file(file), offset, line, col)
+
+    def get_enclosing_nodes(self, offset: int = None, line: int = None, col: int = None,
+                            file: Union[str, Path] = None):
+        """
+        :return: all nodes whose source range covers the position, starting
+            with the innermost one. See `get_node_at()`.
+        """
+        if self.__root is None:
+            return []
+        return self.__root.get_location_index(self.__cwd).enclosing(self.__main_file(file), offset, line, col)
+
+    @staticmethod
+    def get_toolchain():
+        """
+        :return: the `Toolchain` of `BINARY` or None if it is not available
+        """
+        from python_c_cpp_parser.toolchain import discover
+        return discover(clang_parser.BINARY)
+
+    def __available__(self):
+        """
+        :return: true if `clang` is available else false, and its version
+            number like `14.0.6`
+        """
+        t = clang_parser.get_toolchain()
+        if t is None:
+            logging.error("couldn't execute: %s --version", clang_parser.BINARY)
             return False, ""
 
-        data = p.stdout.readlines()
-        data = [str(a).replace("b'", "")
-                .replace("\\n'", "")
-                .lstrip() for a in data]
+        import re
+        ver = re.findall(r"\d+\.\d+\.\d+", t.version)
+        return True, ver[0] if ver else ""
 
-        assert len(data) > 1
-        data = data[0]
-        ver = re.findall(r'\d.\d.\n', data)
-        assert len(ver) == 1
-        return True, ver[0]
+    def __cache_key(self):
+        """
+        :return: key of this file within `ASTCache` or None
+        """
+        import json
+        version = clang_version()
+        if version is None:
+            return None
+        signature = json.dumps([clang_parser.BINARY, version, clang_parser.COMMAND,
+                                self.__flags, self.__functions, self.__cwd,
+                                str(self.__file), self.__stream, self.__lazy,
+                                self.__compact, self.__engine,
+                                # the prelude is missing from the AST
+                                self.__uses_pch() and self.__pch.headers,
+                                self.__filter is not None and
+                                [self.__filter.skip_system, self.__filter.allow,
+                                 self.__filter.stubs]])
+        return self.__cache.key(signature, os.path.join(self.__cwd or "", self.__file))
 
     def execute(self):
-        cmd = [clang_parser.BINARY] + clang_parser.COMMAND
-        for f in self.__functions:
-            cmd += clang_parser.COMMAND_FUNCTION_FILER + [f]
+        if self.__cache is None:
+            return self.__execute()
+
+        key = self.__cache_key()
+        if key is not None:
+            cached = self.__cache.load(key)
+            if cached is not None:
+                state, data = cached
+                self.__restore(state)
+                return data
+
+        data = self.__execute()
+        if data is not None and key is not None:
+            self.__cache.store(key, self.__dependencies, (self.__getstate__(), data))
+        return data
+
+    def __restore(self, state: dict):
+        """
+        takes over the results of another parser of the same file, e.g. from
+        the cache or a worker process
+        """
+        state["_clang_parser__outfile"] = self.__outfile
+        state["_clang_parser__cache"] = self.__cache
+        self.__dict__.update(state)
+
+    async def execute_async(self, semaphore: "asyncio.Semaphore" = None, executor=None):
+        """
+        like `execute()`, but without blocking the event loop: clang runs as
+        an asyncio subprocess and the tree is built within `executor`.
+            results = await asyncio.gather(*[clang_parser(f).execute_async() for f in files])
+        :param semaphore: limits the number of concurrent clang processes,
+            defaults to `batch.default_semaphore()`
+        :param executor: defaults to the default executor of the event loop.
+            A `ProcessPoolExecutor` is supported as well, the parser is sent
+            to the worker and its results are sent back.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        key = None
+        if self.__cache is not None:
+            key = await loop.run_in_executor(None, self.__cache_key)
+            if key is not None:
+                cached = await loop.run_in_executor(None, self.__cache.load, key)
+                if cached is not None:
+                    state, data = cached
+                    self.__restore(state)
+                    return data
+
+        if self.__engine == "libclang" or self.__stream or self.__compact:
+            # these parse while clang is running (or within this process)
+            async with semaphore if semaphore is not None else default_semaphore():
+                parser, data = await loop.run_in_executor(executor, clang_parser._execute_worker, self)
+        else:
+            for pch in (True, False):
+                cmd, depfile = self.__prepare(pch)
+                returncode, out, err = await run_process(cmd, self.__cwd, semaphore)
+                deps = depfile.read() if depfile is not None else None
+                if depfile is not None:
+                    depfile.close()
+                if returncode == 0 or not self.__uses_pch():
+                    break
+                logging.error("retrying without the pch: %s %s", " ".join(cmd),
+                              err.decode(errors="replace"))
+            if returncode != 0:
+                logging.error("couldn't execute: %s %s", " ".join(cmd), err.decode(errors="replace"))
+                return None
+            parser, data = await loop.run_in_executor(executor, clang_parser._build_worker,
+                                                      self, out, deps)
+        if parser is not self:
+            self.__restore(parser.__getstate__())
+
+        if data is not None and key is not None:
+            await loop.run_in_executor(None, self.__cache.store, key, self.__dependencies,
+                                       (self.__getstate__(), data))
+        return data
+
+    @staticmethod
+    def _execute_worker(parser):
+        """
+        worker of `execute_async`, may run in another process
+        """
+        return parser, parser.__execute()
+
+    @staticmethod
+    def _build_worker(parser, output: bytes, deps: bytes):
+        """
+        worker of `execute_async`, builds the tree from the `output` of
+        clang. May run in another process.
+        """
+        try:
+            data = parser.__build(output)
+        except ValueError as e:
+            logging.error("couldn't parse the output of clang for %s: %s", parser.__file, e)
+            return parser, None
+        return parser, parser.__finish(data, deps)
+
+    def __uses_pch(self):
+        return self.__pch is not None and self.__engine != "libclang"
+
+    def __command(self, functions: list[str], pch: bool = True):
+        cmd = [clang_parser.BINARY] + clang_parser.COMMAND + self.__flags
+        if pch and self.__uses_pch():
+            cmd += self.__pch.get_flags()
+        for f in functions:
+            cmd += clang_parser.COMMAND_FUNCTION_FILER[:-1] + [clang_parser.COMMAND_FUNCTION_FILER[-1] + f]
+        return cmd
+
+    def __read_source(self):
+        try:
+            with open(os.path.join(self.__cwd or "", self.__file), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __prepare(self, pch: bool = True):
+        """
+        resets the results of a previous run
+        :param pch: if false, the `PrecompiledHeader` is not used
+        :return: the command and the temporary dependency file or None
+        """
+        cmd = self.__command(self.__functions, pch)
+
+        depfile = None
+        if self.__engine == "libclang":
+            pass
+        elif self.__dependencies is not None:
+            import tempfile
+            depfile = tempfile.NamedTemporaryFile(suffix=".d")
+            cmd += ["-MD", "-MF", depfile.name]
 
         cmd += [self.__file]
         logging.info(cmd)
-        p = Popen(cmd, stdin=PIPE, stdout=self.__outfile, stderr=STDOUT)
-        p.wait()
+        self.__ctx = ParseContext(self.__lazy)
+        self.__root = None
+        # kept for `update()`
+        self.__source = self.__read_source() if not self.__compact else None
+        # output of a previous `execute()`
+        if self.__outfile is not None:
+            self.__outfile.seek(0)
+            self.__outfile.truncate()
+        return cmd, depfile
+
+    def __build(self, output: bytes):
+        """
+        :param output: the json output of clang
+        :return: the root node, or a list of them if `functions` matched
+            several declarations
+        """
+        roots = []
+        for data in _json_values(output.decode(errors="replace")):
+            if self.__filter is not None and "inner" in data:
+                data["inner"] = self.__filter.filter(data["inner"])
+            roots.append(str_to_class(data["kind"])(ctx=self.__ctx, **data))
+        if not roots:
+            raise ValueError("no output")
+        return roots[0] if len(roots) == 1 else roots
+
+    def __execute(self):
+        data = self.__run()
+        if data is None and self.__uses_pch():
+            logging.error("retrying without the pch: %s", self.__file)
+            data = self.__run(pch=False)
+        return data
+
+    def __run(self, pch: bool = True):
+        cmd, depfile = self.__prepare(pch)
+        if self.__engine == "libclang":
+            data = self.__execute_libclang()
+            if data is None:
+                return None
+        elif self.__stream or self.__compact:
+            data = self.__execute_stream(cmd)
+            if data is None:
+                return None
+        else:
+            from subprocess import Popen, PIPE, STDOUT
+            if self.__outfile is None:
+                import tempfile
+                self.__outfile = tempfile.NamedTemporaryFile(suffix=".json")
+            p = Popen(cmd, stdin=PIPE, stdout=self.__outfile, stderr=STDOUT,
+                      cwd=self.__cwd)
+            p.wait()
+
+            if p.returncode != 0 and p.returncode is not None:
+                logging.error("couldn't execute: %s", " ".join(cmd))
+                return None
+
+            self.__outfile.flush()
+            self.__outfile.seek(0)
+            try:
+                data = self.__build(self.__outfile.read())
+            except ValueError as e:
+                logging.error("couldn't parse the output of: %s: %s", " ".join(cmd), e)
+                return None
+
+        deps = None
+        if depfile is not None:
+            deps = depfile.read()
+            depfile.close()
+        return self.__finish(data, deps)
+
+    def __finish(self, data, deps: bytes = None):
+        """
+        collects the results of a run
+        :param data: the root node(s)
+        :param deps: content of the dependency file written by clang
+        """
+        if deps is not None:
+            deps = parse_depfile(deps.decode(errors="replace"))
+            self.__dependencies = [os.path.abspath(os.path.join(self.__cwd or "", d))
+                                   for d in deps]
+
+        # accessing `inner` translates the top level declarations
+        if self.__lazy:
+            for root in (data if type(data) is list else [data]):
+                root.inner
+
+        if self.__compact:
+            tree = (data[0] if type(data) is list else data).tree
+            self.__function_decls = tree.find("FunctionDecl")
+            self.__compound_decls = tree.find("CompoundStmt")
+            self.__for_loop_decls = tree.find("ForStmt")
+            self.__while_loop_decls = tree.find("WhileStmt")
+            self.__do_loop_decls = tree.find("DoStmt")
+            return data
+
+        self.__function_decls = self.__ctx.function_decls
+        self.__compound_decls = self.__ctx.compound_decls
+        self.__for_loop_decls = self.__ctx.for_loop_decls
+        self.__while_loop_decls = self.__ctx.while_loop_decls
+        self.__do_loop_decls = self.__ctx.do_loop_decls
+        self.__root = data
+        return data
+
+    def __execute_libclang(self):
+        """
+        parses the file within this process via libclang
+        :return: the root node or None on any error
+        """
+        # imported here, as libclang is an optional dependency
+        from python_c_cpp_parser.libclang import translate
+        ret = translate(self.__file, self.__flags, self.__cwd, self.__filter,
+                        self.__functions)
+        if ret is None:
+            return None
+
+        roots, dependencies = ret
+        if self.__dependencies is not None:
+            self.__dependencies = dependencies
+        if self.__compact:
+            from python_c_cpp_parser.compact import CompactTree
+            from python_c_cpp_parser.stream import events
+            # each root is a separate top level value, like in the output of clang
+            roots = CompactTree.from_events(e for r in roots for e in events(r)).roots()
+        else:
+            roots = [Node(ctx=self.__ctx, **r) for r in roots]
+
+        if not roots:
+            return None
+        return roots[0] if len(roots) == 1 else roots
+
+    def __execute_stream(self, cmd: list[str]):
+        """
+        runs `cmd` and builds the AST directly from its stdout.
+        The diagnostics of clang are collected in an anonymous temporary file.
+        :return: the root node or None on any error
+        """
+        import tempfile
+        with tempfile.TemporaryFile() as err:
+            return self.__read_stream(cmd, err)
+
+    def __read_stream(self, cmd: list[str], err):
+        from subprocess import Popen, PIPE, DEVNULL
+        from python_c_cpp_parser.stream import basic_parse
+        p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=err, cwd=self.__cwd)
+        try:
+            if self.__compact:
+                # imported here, as `compact.py` depends on this file
+                from python_c_cpp_parser.compact import CompactTree
+                events = basic_parse(p.stdout)
+                if self.__filter is not None:
+                    events = self.__filter.events(events)
+                roots = CompactTree.from_events(events).roots()
+            else:
+                roots = build_from_events(basic_parse(p.stdout), self.__filter, self.__ctx)
+        except ValueError as e:
+            logging.error("couldn't parse the output of: %s: %s", " ".join(cmd), e)
+            roots = None
+        finally:
+            p.stdout.close()
+            p.wait()
 
         if p.returncode != 0 and p.returncode is not None:
+            err.seek(0)
+            logging.error("couldn't execute: %s %s", " ".join(cmd),
+                          err.read().decode(errors="replace"))
+            return None
+
+        if not roots:
+            return None
+        return roots[0] if len(roots) == 1 else roots
+
+    def update(self, file: Union[str, Path] = None):
+        """
+        updates the AST of the last `execute()` after the file was modified.
+        Only the functions whose bodies changed are dumped again (via
+        `-ast-dump-filter`) and spliced into the existing tree, the source
+        locations of everything behind them are shifted. If a change is not
+        within a single function body (e.g. a new declaration or a changed
+        `#define`), or the function can't be found, the whole file is parsed
+        again.
+        NOTE: the `id`s within the spliced functions stem from another run
+        of clang. References to declarations outside of them are resolved by
+        their name.
+        :param file: the modified file, defaults to the parsed one
+        :return: the root node
+        """
+        if file is not None:
+            self.__file = file if type(file) is str else file.absolute()
+        root = self.__root
+        old = self.__source
+        new = self.__read_source()
+        if root is None or old is None or new is None or self.__functions or \
+                self.__engine != "clang":
+            return self.execute()
+        if new == old:
+            return root
+
+        changes = _line_changes(old, new)
+        if changes is None:
+            return self.execute()
+
+        main = os.path.abspath(os.path.join(self.__cwd or "", self.__file))
+        files = {None: False}
+
+        def in_main(f):
+            if f not in files:
+                files[f] = os.path.abspath(os.path.join(self.__cwd or "", f)) == main
+            return files[f]
+
+        # functions of the main file containing all changes
+        changed = {}
+        state = [None, None]
+        for n in root.inner:
+            first = []
+            _walk_locations(n, state, lambda loc, f, l: first or first.append(f))
+            body = n.get_body() if isinstance(n, FunctionDecl) else None
+            if body is None or not first or not in_main(first[0]):
+                continue
+            try:
+                begin = body.range["begin"]["offset"]
+                end = body.range["end"]["offset"] + body.range["end"]["tokLen"]
+            except (AttributeError, KeyError, TypeError):
+                continue
+            for i, c in enumerate(changes):
+                if c[0] >= begin and c[1] <= end:
+                    changed[i] = n
+        if len(changed) != len(changes):
+            return self.execute()
+
+        functions = {}
+        for n in changed.values():
+            functions[id(n)] = n
+        replacements = {}
+        for f in functions.values():
+            data = self.__dump_function(f.name)
+            if data is None:
+                return self.execute()
+            replacements[id(f)] = data
+
+        # shift the locations behind the changes. The first location after
+        # each spliced function is written completely, as the elided parts
+        # refer to the old function.
+        shift_offset, shift_line = _shift_functions(changes)
+        state = [None, None]
+        fix = [False]
+
+        def visit(loc, f, l):
+            if in_main(f):
+                loc["offset"] = shift_offset(loc["offset"])
+                l = shift_line(l) if l is not None else None
+                if "line" in loc:
+                    loc["line"] = l
+            if fix[0]:
+                if f is not None:
+                    loc["file"] = f
+                if l is not None:
+                    loc["line"] = l
+                fix[0] = False
+
+        for n in root.inner:
+            if id(n) in replacements:
+                _walk_locations(n, state, lambda loc, f, l: None)
+                fix[0] = True
+            else:
+                _walk_locations(n, state, visit)
+
+        names = {}
+        for n in root.inner:
+            if "name" in n.__dict__:
+                names[(n.kind, n.name)] = n.id
+        for i, f in enumerate(root.inner):
+            if id(f) in replacements:
+                root.inner[i] = self.__splice(f, replacements[id(f)], names)
+        for k in ("_subtree_index", "_location_index", "_decl_index"):
+            root.__dict__.pop(k, None)
+        self.__source = new
+        return root
+
+    def __dump_function(self, name: str):
+        """
+        :return: the json output of the definition of the function `name`
+            or None
+        """
+        cmd = self.__command([name]) + [self.__file]
+        from subprocess import Popen, PIPE, DEVNULL
+        import json
+        logging.info(cmd)
+        p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL, cwd=self.__cwd)
+        out, _ = p.communicate()
+        if p.returncode != 0:
             logging.error("couldn't execute: %s", " ".join(cmd))
             return None
 
-        self.__outfile.flush()
-        self.__outfile.seek(0)
-        data = self.__outfile.read()
-        data = json.loads(data)
-        data = Node(**data)
-
-        # copy global variables into locaL variables
-        global functions_decls, compound_decls, for_loop_decls, while_loop_decls, do_loop_decls
-        self.__function_decls = copy.copy(functions_decls)
-        self.__compound_decls = copy.copy(compound_decls)
-        self.__for_loop_decls = copy.copy(for_loop_decls)
-        self.__while_loop_decls = copy.copy(while_loop_decls)
-        self.__do_loop_decls = copy.copy(do_loop_decls)
-        return data
+        # the filter is a substring match, each match is a separate value
+        ret = None
+        try:
+            for data in _json_values(out.decode(errors="replace")):
+                if data.get("kind") == "FunctionDecl" and data.get("name") == name and \
+                        any(i.get("kind") == "CompoundStmt" for i in data.get("inner", [])):
+                    ret = data
+        except ValueError as e:
+            logging.error("couldn't parse the output of: %s: %s", " ".join(cmd), e)
+            return None
+        return ret
+
+    def __splice(self, old: Node, data: dict, names: dict):
+        """
+        replaces the function `old` by the one build from `data`
+        :param names: (kind, name) -> id of the top level declarations
+        :return: the new function
+        """
+        # the function keeps its id, as it may be referenced by others
+        ids = {old.id}
+        refs = []
+        stack = [data]
+        while stack:
+            d = stack.pop()
+            if type(d) is dict:
+                if "id" in d and "kind" in d:
+                    ids.add(d["id"])
+                for k, v in d.items():
+                    if k == "referencedDecl" and type(v) is dict:
+                        refs.append(v)
+                    else:
+                        stack.append(v)
+            elif type(d) is list:
+                stack.extend(d)
+        for r in refs:
+            if r["id"] == data["id"]:
+                r["id"] = old.id
+            elif r["id"] not in ids and (r.get("kind"), r.get("name")) in names:
+                r["id"] = names[(r.get("kind"), r.get("name"))]
+        data["id"] = old.id
+        if "previousDecl" in old.__dict__:
+            data["previousDecl"] = old.previousDecl
+
+        ctx = ParseContext()
+        new = NODE_CLASSES.get("FunctionDecl", UnknownNode)(ctx=ctx, **data)
+        new.parent = old.parent
+
+        # the nodes are registered in the context of this parse, at the
+        # position of the nodes they replace
+        stack = [new]
+        while stack:
+            n = stack.pop()
+            n._ctx = self.__ctx
+            stack.extend(n.inner or [])
+        removed = set()
+        stack = [old]
+        while stack:
+            n = stack.pop()
+            removed.add(id(n))
+            stack.extend(n.__dict__.get("inner") or [])
+        # the nodes following `old` in dump order, i.e. within its later
+        # siblings and those of its parents
+        following = set()
+        node = old
+        while getattr(node, "parent", None) is not None:
+            siblings = node.parent.__dict__.get("inner") or []
+            pos = next(i for i, n in enumerate(siblings) if n is node)
+            stack = list(siblings[pos + 1:])
+            while stack:
+                n = stack.pop()
+                following.add(id(n))
+                stack.extend(n.__dict__.get("inner") or [])
+            node = node.parent
+        for attr in ("function_decls", "compound_decls", "for_loop_decls",
+                     "while_loop_decls", "do_loop_decls"):
+            nodes = getattr(self.__ctx, attr)
+            # the new nodes are inserted in front of the first following
+            # one, even if `old` had no nodes of this kind
+            pos = next((i for i, n in enumerate(nodes) if id(n) in following), len(nodes))
+            nodes[:pos] = [n for n in nodes[:pos] if id(n) not in removed] + getattr(ctx, attr)
+        return new
 
     def insert(self, line: str, pos: int):
         """
@@ -883,3 +2411,39 @@ class clang_parser:
         replaces the code-line `pos` with `line`
         """
         NotImplementedError  # TODO
+
+
+def _parse_one(file: Union[str, Path], **kwargs):
+    """
+    worker of `parse_many`
+    """
+    c = clang_parser(file, **kwargs)
+    return c, c.execute()
+
+
+def parse_many(files: list[Union[str, Path]], jobs: int = None, **kwargs):
+    """
+    parses each file via `clang_parser(file, **kwargs).execute()` within a
+    pool of `jobs` worker processes.
+        for r in parse_many(files, jobs=8, skip_system=True):
+            if r.ok():
+                print(r.file, r.parser.get_function_decls())
+    :param jobs: number of processes, defaults to the number of cpus.
+    :param kwargs: forwarded to each `clang_parser`. `pch=True` detects the
+        leading includes shared by all `files` and precompiles them. Their
+        declarations are missing from the ASTs then, see `clang_parser`.
+    :return: iterator over `ParseResult`s in completion order
+    """
+    pch = kwargs.get("pch")
+    if pch is True:
+        from python_c_cpp_parser.pch import PrecompiledHeader, common_prelude, include_dirs, language
+        files = list(files)
+        dirs = include_dirs(kwargs.get("flags"), kwargs.get("cwd"), language(files[0])) if files else []
+        headers = common_prelude(files, kwargs.get("cwd"), dirs) if len(files) > 1 else []
+        pch = PrecompiledHeader(headers, flags=kwargs.get("flags"), cwd=kwargs.get("cwd"),
+                                language=language(files[0])) if headers else None
+    # built once here, instead of within each worker
+    if pch is not None and not pch.get_flags():
+        pch = None
+    kwargs = dict(kwargs, pch=pch)
+    return run_many(_parse_one, files, jobs, kwargs)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+the parts of the node framework shared by the clang and the gcc backend,
+which can be imported without the other one
+"""
+from __future__ import annotations
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Union
+
+# qualType -> width in bytes. Pointer types are added on first use.
+_WIDTHS = {"int": 4, "long int": 8}
+
+
+def type2width(t: str) -> Union[int, None]:
+    """
+    returns the width of the type `t` in bytes or -1
+    """
+    w = _WIDTHS.get(t)
+    if w is not None:
+        return w
+
+    # pointer
+    if "*" in t:
+        # well actually 
+        _WIDTHS[t] = 8
+        return 8
+
+    print(t, "not implemented")
+    return -1
+
+
+class Location:
+    """
+    wrapper around clangs `loc` field.
+    """
+    __slots__ = ("offset", "file", "line", "col", "tokLen")
+
+    def __init__(self, offset: int, file: str, line: int, col: int, tokLen: int):
+        self.offset = offset
+        self.file = file
+        self.line = line
+        self.col = col
+        self.tokLen = tokLen
+
+    def __str__(self):
+        return self.file + str(self.line) + ":" + str(self.col) + ":" + str(self.tokLen)
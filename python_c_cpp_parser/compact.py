@@ -0,0 +1,664 @@
+#!/usr/bin/env python3
+"""
+compact struct-of-arrays representation of a clang AST.
+
+Instead of one python object (and its `__dict__`, `loc`, `range` and `type`
+dicts) per node, all nodes of a translation unit are stored within a few
+flat typed arrays. Nodes are numbered in pre-order, hence the subtree of the
+node `i` are exactly the nodes `i, ..., ends[i] - 1`.
+Lightweight `__slots__` views (`CompactNode` and its subclasses) implement
+the accessors of `Node` on top of these arrays.
+
+A tree can be written into a binary file (`CompactTree.save`) and opened
+again via `mmap` (`CompactTree.load`). The file contains the arrays as they
+are in memory, hence opening it only maps the file and the views read the
+arrays (and decode the strings) on demand:
+    header      magic, version, byte order, number of nodes, children and
+                strings, size of the string data (see `HEADER`)
+    arrays      `NODE_ARRAYS` with one entry per node, `children`, the
+                offsets of the strings within the string data
+    strings     utf-8 encoded strings
+Each array starts at a multiple of 8 bytes.
+"""
+from array import array
+import mmap
+import struct
+import sys
+
+from python_c_cpp_parser.clang import Location, Node, type2width
+from python_c_cpp_parser.stream import events as json_events
+
+# all keys for which a string is stored in `CompactTree.values`
+VALUE_KEYS = ["value", "opcode", "castKind"]
+
+MAGIC = b"PCCPAST\0"
+VERSION = 1
+# magic, version, little endian, nodes, children, strings, size of the string data
+HEADER = struct.Struct("=8sIIIIIQ")
+# arrays with one entry per node in the order of the binary file
+NODE_ARRAYS = [("kinds", "I"), ("ids", "Q"), ("parents", "i"), ("ends", "I"),
+               ("child_start", "I"), ("child_count", "I"), ("types", "I"),
+               ("names", "I"), ("values", "I"), ("refs", "Q"), ("files", "I"),
+               ("lines", "I"), ("cols", "I"), ("offsets", "I"), ("tok_lens", "I")]
+
+
+class _StringTable:
+    """
+    string table of a mapped file. The strings are decoded on first access.
+    """
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.__offsets = offsets
+        self.__data = data
+        self.__strings = [None] * (len(offsets) - 1)
+        self.__decoded = bytearray(len(offsets) - 1)
+
+    def __len__(self):
+        return len(self.__strings)
+
+    def __getitem__(self, i: int):
+        if not self.__decoded[i]:
+            if i > 0:
+                self.__strings[i] = str(self.__data[self.__offsets[i]:self.__offsets[i + 1]],
+                                        "utf-8")
+            self.__decoded[i] = 1
+        return self.__strings[i]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _pad(n: int):
+    return -n % 8
+
+
+class CompactTree:
+    """
+    AST of a single translation unit (or of all the declarations matched by
+    `-ast-dump-filter`) stored as struct of arrays.
+    String valued fields (kinds, types, names, files, ...) are indices into
+    the string table `strings`. The index 0 is reserved for `None`.
+    """
+
+    def __init__(self):
+        self.strings = [None]
+        self.__string_ids = {}
+
+        self.kinds = array("I")
+        # the clang id, e.g. `0x55d0c8e3a2f8`
+        self.ids = array("Q")
+        self.parents = array("i")
+        # end (exclusive) of the subtree
+        self.ends = array("I")
+        # the children of node `i` are `children[child_start[i]:child_start[i] + child_count[i]]`
+        self.child_start = array("I")
+        self.child_count = array("I")
+        self.children = array("I")
+        self.types = array("I")
+        self.names = array("I")
+        self.values = array("I")
+        # clang id of the `referencedDecl`
+        self.refs = array("Q")
+        # resolved location
+        self.files = array("I")
+        self.lines = array("I")
+        self.cols = array("I")
+        self.offsets = array("I")
+        self.tok_lens = array("I")
+        self.__views = []
+        # the mapped file of `load`
+        self.__buffer = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def intern(self, s: str):
+        """
+        :return: the index of `s` within the string table
+        """
+        if s is None:
+            return 0
+        ret = self.__string_ids.get(s)
+        if ret is None:
+            ret = len(self.strings)
+            self.strings.append(s)
+            self.__string_ids[s] = ret
+        return ret
+
+    def string_id(self, s: str):
+        """
+        :return: the index of `s` within the string table or -1
+        """
+        if self.__string_ids is None:
+            self.__string_ids = {t: i for i, t in enumerate(self.strings) if i > 0}
+        return self.__string_ids.get(s, -1)
+
+    def node(self, i: int):
+        """
+        :return: the view of the node `i`
+        """
+        k = self.kinds[i]
+        if k >= len(self.__views):
+            self.__views.extend(None for _ in range(k + 1 - len(self.__views)))
+        C = self.__views[k]
+        if C is None:
+            C = VIEWS.get(self.strings[k], CompactNode)
+            self.__views[k] = C
+        return C(self, i)
+
+    def roots(self):
+        """
+        :return: views of all nodes without a parent
+        """
+        # the roots are numbered in pre-order, too
+        ret = []
+        i = 0
+        while i < len(self):
+            ret.append(self.node(i))
+            i = self.ends[i]
+        return ret
+
+    def find(self, kind: str, i: int = None, recursive: bool = True):
+        """
+        :param kind: e.g. `ForStmt`
+        :param i: only search below the node `i`, if None the whole tree is searched
+        :param recursive: if false, only the children of `i` are searched
+        :return: the views of all nodes of kind `kind` in pre-order
+        """
+        k = self.string_id(kind)
+        if k < 0:
+            return []
+
+        kinds = self.kinds
+        if i is None:
+            return [self.node(j) for j in range(len(self)) if kinds[j] == k]
+        if not recursive:
+            s = self.child_start[i]
+            return [self.node(j) for j in self.children[s:s + self.child_count[i]]
+                    if kinds[j] == k]
+        return [self.node(j) for j in range(i + 1, self.ends[i]) if kinds[j] == k]
+
+    def nbytes(self):
+        """
+        :return: the number of bytes used by the arrays and the string table
+        """
+        ret = sys.getsizeof(self.strings) + sum(sys.getsizeof(s) for s in self.strings)
+        for a in (self.kinds, self.ids, self.parents, self.ends, self.child_start,
+                  self.child_count, self.children, self.types, self.names,
+                  self.values, self.refs, self.files, self.lines, self.cols,
+                  self.offsets, self.tok_lens):
+            ret += a.itemsize * len(a)
+        return ret
+
+    def save(self, path: str):
+        """
+        writes the tree into the binary file `path`, see `load`
+        """
+        data = [self.strings[i].encode("utf-8") for i in range(1, len(self.strings))]
+        offsets = array("Q", [0, 0])
+        for s in data:
+            offsets.append(offsets[-1] + len(s))
+
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == "little", len(self),
+                                len(self.children), len(self.strings), offsets[-1]))
+            f.write(b"\0" * _pad(HEADER.size))
+            for a in [getattr(self, name) for name, _ in NODE_ARRAYS] + [self.children, offsets]:
+                b = a.tobytes() if type(a) is array else bytes(a)
+                f.write(b)
+                f.write(b"\0" * _pad(len(b)))
+            for s in data:
+                f.write(s)
+
+    @staticmethod
+    def load(path: str):
+        """
+        opens a tree written by `save` via `mmap`. The arrays of the tree are
+        `memoryview`s of the mapped file, nothing is copied.
+        :return: the `CompactTree`, which is read only
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < HEADER.size:
+            raise ValueError("{} is not an AST file".format(path))
+        magic, version, little, n, n_children, n_strings, size = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not an AST file of version {}".format(path, VERSION))
+        if little != (sys.byteorder == "little"):
+            raise ValueError("{} was written on a machine of another byte order".format(path))
+
+        tree = CompactTree()
+        view = memoryview(buffer)
+        pos = HEADER.size + _pad(HEADER.size)
+
+        def take(typecode: str, count: int):
+            nonlocal pos
+            length = count * struct.calcsize(typecode)
+            if pos + length > len(view):
+                raise ValueError("{} is truncated".format(path))
+            ret = view[pos:pos + length].cast(typecode)
+            pos += length + _pad(length)
+            return ret
+
+        for name, typecode in NODE_ARRAYS:
+            setattr(tree, name, take(typecode, n))
+        tree.children = take("I", n_children)
+        offsets = take("Q", n_strings + 1)
+        tree.strings = _StringTable(offsets, take("B", size))
+        tree.__string_ids = None
+        tree.__buffer = buffer
+        return tree
+
+    @staticmethod
+    def from_node(root: Node):
+        """
+        builds the tree from a tree of `Node`s, e.g. to `save` it
+        """
+        return CompactTree.from_events(_node_events(root))
+
+    @staticmethod
+    def from_events(events):
+        """
+        builds the tree from a stream of json events (see `stream.py`).
+        Only the json objects of the nodes on the path from the root to the
+        current node are kept in memory.
+        NOTE: building the tree takes about as long as building `Node`s
+        from `json.loads`, but the events of the pure python tokenizer of
+        `stream.py` are several times slower than `json.loads`, unless
+        `ijson` is installed. The trade-off is the lower peak memory.
+        :param events: iterator over (event, value) pairs
+        """
+        tree = CompactTree()
+        arrays = [getattr(tree, name) for name, _ in NODE_ARRAYS]
+        kinds, ids, parents, ends, child_start, child_count, types, names, values, \
+            refs, files, lines, cols, offsets, tok_lens = arrays
+        intern = tree.intern
+        # the arrays are allocated in blocks of zeros, instead of appending
+        # to each of them per node, and cut to `n` nodes at the end
+        n = capacity = 0
+        # stack of [key within the parent, container, node index or -1]
+        stack = []
+        # index of the innermost open node
+        nodes = [-1]
+        key = None
+        last_file, last_line = 0, 0
+        for event, value in events:
+            if event == "map_key":
+                key = value
+            elif event == "start_map":
+                if not stack or (stack[-1][0] == "inner" and stack[-2][2] >= 0):
+                    if n == capacity:
+                        grow = max(capacity, 1024)
+                        for a in arrays:
+                            a.frombytes(bytes(grow * a.itemsize))
+                        capacity += grow
+                    parents[n] = nodes[-1]
+                    nodes.append(n)
+                    stack.append((key, {}, n))
+                    n += 1
+                else:
+                    stack.append((key, {}, -1))
+            elif event == "start_array":
+                stack.append((key, [], -1))
+            elif event == "end_map" or event == "end_array":
+                key, value, i = stack.pop()
+                if i >= 0:
+                    nodes.pop()
+                    if "kind" not in value:
+                        # empty placeholder like the missing condition
+                        # variable of a `ForStmt`, it has no children
+                        n -= 1
+                        parents[n] = 0
+                        continue
+                    # the fields of the node
+                    kinds[i] = intern(value["kind"])
+                    if "id" in value:
+                        ids[i] = int(value["id"], 16)
+                    ends[i] = n
+                    children = value.get("inner")
+                    if type(children) is list:
+                        child_start[i] = len(tree.children)
+                        child_count[i] = len(children)
+                        tree.children.extend(children)
+                    t = value.get("type")
+                    if type(t) is dict:
+                        types[i] = intern(t.get("qualType"))
+                    if "name" in value:
+                        names[i] = intern(value["name"])
+                    for k in VALUE_KEYS:
+                        if k in value:
+                            values[i] = intern(str(value[k]))
+                            break
+                    ref = value.get("referencedDecl")
+                    if type(ref) is dict and "id" in ref:
+                        refs[i] = int(ref["id"], 16)
+                    value = i
+                elif key == "loc" and stack and stack[-1][2] >= 0:
+                    # the location of a node: clang omits the file and the
+                    # line if they did not change.
+                    j = stack[-1][2]
+                    loc = value.get("expansionLoc", value)
+                    if "offset" in loc:
+                        files[j] = last_file
+                        lines[j] = last_line
+                        cols[j] = loc.get("col", 0)
+                        offsets[j] = loc["offset"]
+                        tok_lens[j] = loc.get("tokLen", 0)
+
+                if not stack:
+                    continue
+                parent = stack[-1][1]
+                if type(parent) is list:
+                    parent.append(value)
+                else:
+                    parent[key] = value
+            else:
+                if event == "string" and key == "file" and stack[-1][0] != "includedFrom":
+                    last_file = intern(value)
+                elif key == "line" and event == "number":
+                    last_line = value
+
+                parent = stack[-1][1]
+                if type(parent) is list:
+                    parent.append(value)
+                else:
+                    parent[key] = value
+
+        for a in arrays:
+            del a[n:]
+        return tree
+
+
+def _node_events(root: Node):
+    """
+    emits the json events of a tree of `Node`s, see `stream.py`
+    """
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if type(n) is tuple:
+            yield n
+            continue
+        if not isinstance(n, Node):
+            # not yet translated children of lazy nodes
+            yield from json_events(n)
+            continue
+
+        yield "start_map", None
+        stack.append(("end_map", None))
+        d = n.__dict__
+        inner = d["inner"] if "inner" in d else d.get("_raw_inner")
+        if inner:
+            stack.append(("end_array", None))
+            stack.extend(reversed(inner))
+            stack.append(("start_array", None))
+            stack.append(("map_key", "inner"))
+        for k, v in d.items():
+            if k.startswith("_") or k == "inner" or k == "parent" or \
+                    isinstance(v, Node) or (type(v) is list and any(isinstance(x, Node) for x in v)):
+                continue
+            yield "map_key", k
+            yield from json_events(v)
+
+
+class CompactNode:
+    """
+    view of a single node of a `CompactTree`. Implements the accessors of `Node`.
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: CompactTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and \
+            self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def id(self):
+        return hex(self.tree.ids[self.index])
+
+    @property
+    def kind(self):
+        return self.tree.strings[self.tree.kinds[self.index]]
+
+    @property
+    def name(self):
+        return self.tree.strings[self.tree.names[self.index]]
+
+    @property
+    def value(self):
+        return self.tree.strings[self.tree.values[self.index]]
+
+    @property
+    def parent(self):
+        p = self.tree.parents[self.index]
+        return None if p < 0 else self.tree.node(p)
+
+    @property
+    def inner(self):
+        """
+        list of the children or None, like `Node.inner`
+        """
+        tree, i = self.tree, self.index
+        n = tree.child_count[i]
+        if n == 0:
+            return None
+        s = tree.child_start[i]
+        return [tree.node(j) for j in tree.children[s:s + n]]
+
+    def reparse(self, out, t, recursive=True, check=None):
+        """ appends all nodes below this one of kind `t` to `out`.
+        :param t: kind string or a `CompactNode` subclass
+        """
+        kind = t if type(t) is str else t.KIND
+        for n in self.tree.find(kind, self.index, recursive):
+            if check is None or check(out, n):
+                out.append(n)
+        return out
+
+    def reparse_single(self, out, t):
+        """ returns the first child of kind `t` or None """
+        ret = self.reparse([], t, recursive=False)
+        return ret[0] if len(ret) > 0 else None
+
+    def get_file(self):
+        """
+        returns the path to the file where this AST element is located.
+        if no location is available: None is returned
+        """
+        return self.tree.strings[self.tree.files[self.index]]
+
+    def get_location(self):
+        """
+        returns a `Locations` object if available else None
+        """
+        tree, i = self.tree, self.index
+        if tree.lines[i] == 0:
+            return None
+        return Location(tree.offsets[i], self.get_file() or "", tree.lines[i],
+                        tree.cols[i], tree.tok_lens[i])
+
+    def get_type(self):
+        return self.tree.strings[self.tree.types[self.index]]
+
+    def is_empty(self):
+        return self.tree.child_count[self.index] == 0
+
+    def width(self):
+        t = self.get_type()
+        if t is None:
+            return None
+        return type2width(t)
+
+    def __str__(self, depth=0):
+        ret = str(self.id) + " " + str(self.__class__) + "\n"
+        if self.inner:
+            depth += 1
+            t = "\t" * depth
+            for a in self.inner:
+                ret += t + a.__str__(depth)
+        return ret
+
+    def __repr__(self):
+        return "<{} {}>".format(self.kind, self.index)
+
+
+class CompactFunctionDecl(CompactNode):
+    __slots__ = ()
+    KIND = "FunctionDecl"
+
+    def get_arguments(self):
+        return self.reparse([], CompactParmVarDecl, recursive=False)
+
+    def get_body(self):
+        ret = self.reparse([], CompactCompoundStmt, recursive=False)
+        return ret[-1] if len(ret) > 0 else None
+
+    def get_return_type(self):
+        return self.get_type() or ""
+
+
+class CompactCompoundStmt(CompactNode):
+    __slots__ = ()
+    KIND = "CompoundStmt"
+
+    def __get(self, t, i: int, recursive: bool = True):
+        ret = self.reparse([], t, recursive=recursive)
+        if i is not None:
+            if i > len(ret):
+                print("OOB")
+                return None
+            return ret[i]
+        return ret
+
+    def get_var_decls(self, i: int = None):
+        return self.__get("DeclStmt", i, recursive=False)
+
+    def get_for_loops(self, i: int = None):
+        return self.__get("ForStmt", i)
+
+    def get_do_loops(self, i: int = None):
+        return self.__get("DoStmt", i)
+
+    def get_while_loops(self, i: int = None):
+        return self.__get("WhileStmt", i)
+
+
+class CompactLoop(CompactNode):
+    """
+    common accessors of `ForStmt`, `WhileStmt` and `DoStmt`
+    """
+    __slots__ = ()
+
+    def get_body(self):
+        return self.reparse_single(None, CompactCompoundStmt)
+
+    def get_var_decls(self):
+        body = self.get_body()
+        return [] if body is None else body.reparse([], "DeclStmt")
+
+    def get_func_calls(self):
+        body = self.get_body()
+        return [] if body is None else body.reparse([], "CallExpr")
+
+    def get_break_stmts(self):
+        body = self.get_body()
+        return [] if body is None else body.reparse([], "BreakStmt", recursive=False)
+
+    def get_variables(self):
+        return self.get_var_decls()
+
+
+class CompactForStmt(CompactLoop):
+    __slots__ = ()
+    KIND = "ForStmt"
+
+    def is_basic_loop(self):
+        """
+        returns true if the loop is of the simplest form:
+            for(int i = 0; i < 32; i++){ ... }
+        """
+        return self.tree.child_count[self.index] == 4
+
+    def __limit(self, i: int):
+        inner = self.inner
+        return inner[i] if inner is not None and len(inner) == 4 else None
+
+    def get_lower_limit(self):
+        return self.__limit(0)
+
+    def get_upper_limit(self):
+        return self.__limit(1)
+
+    def get_step_size(self):
+        return self.__limit(2)
+
+
+class CompactWhileStmt(CompactLoop):
+    __slots__ = ()
+    KIND = "WhileStmt"
+
+
+class CompactDoStmt(CompactLoop):
+    __slots__ = ()
+    KIND = "DoStmt"
+
+
+class CompactVarDecl(CompactNode):
+    __slots__ = ()
+    KIND = "VarDecl"
+
+    def get_width(self):
+        """
+        returns the width if the variable in bytes, or None if it has no type
+        """
+        t = self.get_type()
+        return type2width(t) if t is not None else None
+
+    def is_integral(self):
+        """
+        returns if a variable is integral: int, long int, ....
+        """
+        w = self.get_width()
+        return w is not None and w > 0
+
+    def get_init_value(self):
+        inner = self.inner
+        if inner is not None and len(inner) == 1 and inner[0].kind == "IntegerLiteral":
+            return inner[0].value
+        return None
+
+
+class CompactParmVarDecl(CompactVarDecl):
+    __slots__ = ()
+    KIND = "ParmVarDecl"
+
+    def get_init_value(self):
+        return None
+
+
+class CompactDeclRefExpr(CompactNode):
+    __slots__ = ()
+    KIND = "DeclRefExpr"
+
+    def get_reference_id(self):
+        return hex(self.tree.refs[self.index])
+
+
+class CompactCallExpr(CompactNode):
+    __slots__ = ()
+    KIND = "CallExpr"
+
+    def get_arguments(self):
+        return self.reparse([], CompactDeclRefExpr)
+
+
+# kind -> view class
+VIEWS = {C.KIND: C for C in (CompactFunctionDecl, CompactCompoundStmt, CompactForStmt,
+                             CompactWhileStmt, CompactDoStmt, CompactVarDecl,
+                             CompactParmVarDecl, CompactDeclRefExpr, CompactCallExpr)}
@@ -1,16 +1,19 @@
 #!/usr/bin/env python3
-from subprocess import Popen, PIPE, STDOUT
-from typing import Union
-from pathlib import Path
-from types import SimpleNamespace
+from __future__ import annotations
 import logging
 import sys
 import os
-import json
 import re
-import tempfile
+from array import array
 
-from python_c_cpp_parser.clang import *
+from python_c_cpp_parser.batch import run_many, run_process, default_semaphore
+from python_c_cpp_parser.common import Location, type2width
+
+# `typing.TYPE_CHECKING`, without importing `typing`, see `clang.py`
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Union
+    from pathlib import Path
 
 
 def is_empty_str(s: str):
@@ -19,42 +22,80 @@ def is_empty_str(s: str):
     return False
 
 
-def parse_gcc_node_to_clang_node(nodes: dict):
+def parse_gcc_node_to_clang_node(nodes: Union[dict, list]):
     """
     parses the output of `gcc_parser().execute()`
-    into a general node framework
-    :nodes: dict of the following form: {
-        '1': {'id': '1', 'kind': 'bind_expr', 'type:': '@2', 'vars:': '@3', 'body:': '@4'}
-        '2': {'id': '2', 'kind': 'void_type', 'name:': '@5', 'algn:': '8'}
-        ...
-    }
-    
+    into a general node framework:
+        sections = gcc_parser("test.c").execute()
+        views = parse_gcc_node_to_clang_node(sections)
+        views["main"]["1"].kind  # `bind_expr`
+        # or a single section
+        views = parse_gcc_node_to_clang_node(sections["main"])
+        views["1"].kind
+    :nodes: the dict of the signatures of the functions and their sections
+        returned by `execute()`, i.e. `{"main": {"1": ParsingNode, ...}}`
+        (or `{"main": GccGraph}` with `graph=True`), or a single section:
+        the dict of the ids and the `ParsingNode`s of a function or a list
+        of them. The nodes can also be given as plain dicts, e.g.
+        `[{'id': '1', 'kind': 'bind_expr', 'type': '@2', 'body': '@4'}, ...]`
+    :return: dict of the node ids and the `GccNode` views of the nodes
+        with a translation (see `GCC_NODE_CLASSES`). For the sections of
+        `execute()` one such dict per signature, as the ids of the sections
+        overlap.
     """
-    translation = {
-        "function_type": FunctionDecl
-    }
-    ret = {}
-    for k, v in nodes.items():
-        assert v.kind
-        if v.kind in translation:
-            f = translation[v.kind]
-            f(**v.__dict__)
+    if type(nodes) is GccGraph:
+        return _views(nodes)
+    values = list(nodes.values()) if type(nodes) is dict else list(nodes)
+    # a section contains nodes, the sections of `execute()` contain sections
+    if values and (type(values[0]) is GccGraph or
+                   (type(values[0]) is dict and "kind" not in values[0])):
+        return {signature: parse_gcc_node_to_clang_node(section)
+                for signature, section in nodes.items()}
+    return _views(GccGraph.from_nodes(ParsingNode(**n) if type(n) is dict else n
+                                      for n in values))
+
 
+def _views(graph: GccGraph):
+    ret = {}
+    for i in range(len(graph)):
+        if graph.kind(i) in GCC_NODE_CLASSES:
+            ret[str(graph.ids[i])] = graph.node(i)
     return ret
 
 
+# single pass over a line of the raw tree dump. Matches either the head of
+# a record `@1  bind_expr`, the name of an identifier or string
+# `strg: some text  lngt: 9` (which may contain spaces) or a field
+# `type: @2`, `op 0: @3`, `0   : @4` or `srcp: test.c:3`.
+_TOKEN = re.compile(r"@(\d+)\s+(\w+)"
+                    r"|strg: (.*?) *(?=lngt: \d+\s*$|$)"
+                    r"|(\w+(?: \d+)?) *: (\S+)")
+
+
 def split_line(line: str):
-    splits = line.split(" ")
-    # first remove all the spaces
+    """
+    :return: the head of the record in `line` as `(id, kind)` (or None for
+        continuation lines) and a list of the `(key, value)` pairs. The keys
+        are normalized: `op 0: @3` -> `("op0", "@3")`.
+    """
+    head = None
     options = []
-    for i, s in enumerate(splits):
-        if not is_empty_str(s) and s != ":":
-            if s == "op":
-                s += splits[i + 1]
-                splits.pop(i+1)
-            options.append(s)
+    for m in _TOKEN.finditer(line):
+        key, value = m.group(4, 5)
+        if key is not None:
+            options.append((key.replace(" ", ""), value))
+        elif m.group(1) is not None:
+            head = (m.group(1), m.group(2))
+        else:
+            options.append(("strg", m.group(3)))
+    return head, options
+
 
-    return options
+def _decode(line):
+    if type(line) is bytes:
+        # keeps the exact bytes of non utf-8 string literals
+        return line.decode("utf-8", errors="surrogateescape")
+    return line
 
 
 class ParsingNode:
@@ -72,110 +113,998 @@ class ParsingNode:
 
         a new node
         """
-        options = split_line(line)
-        assert len(options) >= 2
-        assert options[0][0] == "@"
-        id = options[0][1:]
-        kind = options[1]
-        d = {"id": id, "kind": kind}
-
-        assert len(options) % 2 == 0
-        for i in range(2, len(options), 2):
-            opt = options[i]
-            val = options[i + 1]
-            d[opt] = val
-
+        head, options = split_line(line)
+        assert head is not None
+        d = {"id": head[0], "kind": head[1]}
+        d.update(options)
         return ParsingNode(**d)
 
     def __str__(self):
         return str(self.__dict__)
 
 
+# encoding of a field value within `GccGraph.values`: references are the
+# index of the target node, literals `LITERAL - string id`
+MISSING = -1
+LITERAL = -2
+# keys followed while searching statements below a node
+_STATEMENT_KEYS = frozenset(("body", "expr", "op0", "op1", "op2", "op3"))
+_FOR = re.compile(r"\bfor\s*\(")
+# statements updating the counter of a for loop
+_STEPS = frozenset(("postincrement_expr", "preincrement_expr", "postdecrement_expr",
+                    "predecrement_expr", "modify_expr"))
+
+
+class GccGraph:
+    """
+    the nodes of a single function section of a raw tree dump as a graph
+    in flat arrays. Each node is addressed by its index (its position in
+    the dump, `@1` is 0). The fields of node `i` are stored at
+    `fields[i]:fields[i + 1]` in `keys` (ids into `key_names`) and `values`
+    (see `LITERAL`), all `@N` references are resolved to indices once
+    while building the graph.
+    """
+
+    def __init__(self, function: str = None, directory: str = None):
+        """
+        :param function: name from the `;; Function` header of the section
+        :param directory: gcc only writes the base name of the files into
+            the `srcp` fields, they are looked up in this directory
+        """
+        self.function = function
+        self.signature = function
+        self.directory = directory
+        self.ids = array("I")
+        self.kinds = array("H")
+        self.fields = array("I", [0])
+        self.keys = array("H")
+        self.values = array("q")
+        self.kind_names = []
+        self.key_names = []
+        self.strings = []
+        self.__kind_ids = {}
+        self.__key_ids = {}
+        self.__string_ids = {}
+        self.__views = []
+        self.__sources = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def __intern(names: list, ids: dict, s: str):
+        ret = ids.get(s)
+        if ret is None:
+            ret = ids[s] = len(names)
+            names.append(sys.intern(s))
+        return ret
+
+    def __add_fields(self, options: list):
+        for key, value in options:
+            self.keys.append(self.__intern(self.key_names, self.__key_ids, key))
+            if value[:1] == "@" and value[1:].isdigit():
+                # resolved in `__resolve`
+                self.values.append(int(value[1:]))
+            else:
+                self.values.append(LITERAL - self.__intern(self.strings, self.__string_ids, value))
+
+    def __resolve(self):
+        index = array("q", [MISSING]) * (max(self.ids, default=0) + 1)
+        for i, id in enumerate(self.ids):
+            index[id] = i
+        n = len(index)
+        self.values = array("q", (index[v] if 0 <= v < n else (v if v < 0 else MISSING)
+                                  for v in self.values))
+        self.__views = [None] * len(self.ids)
+
+    @staticmethod
+    def from_lines(lines, directory: str = None):
+        """
+        builds the graph of the first function section of a dump directly
+        from its lines, without creating `ParsingNode`s
+        :param lines: iterable over `str` or `bytes` lines
+        """
+        g = GccGraph(directory=directory)
+        done = False
+        for line in lines:
+            line = _decode(line)
+            if line.startswith(";; Function "):
+                # the node ids start again at `@1` in the next section
+                done = done or len(g.ids) > 0
+                if g.function is None:
+                    g.signature, g.function = parse_header(line)
+            if done or line.startswith(";"):
+                continue
+            head, options = split_line(line)
+            if head is not None:
+                g.ids.append(int(head[0]))
+                g.kinds.append(g.__intern(g.kind_names, g.__kind_ids, head[1]))
+                g.fields.append(g.fields[-1])
+            elif not options:
+                continue
+            g.__add_fields(options)
+            g.fields[-1] = len(g.values)
+        g.__resolve()
+        return g
+
+    @staticmethod
+    def from_nodes(nodes, function: str = None, directory: str = None):
+        """
+        :param nodes: iterable over `ParsingNode`s, e.g. the values of
+            `gcc_parser.parse`
+        """
+        g = GccGraph(function, directory)
+        for n in sorted(nodes, key=lambda n: int(n.id)):
+            g.ids.append(int(n.id))
+            g.kinds.append(g.__intern(g.kind_names, g.__kind_ids, n.kind))
+            g.__add_fields([(k, v) for k, v in n.__dict__.items() if k not in ("id", "kind")])
+            g.fields.append(len(g.values))
+        g.__resolve()
+        return g
+
+    def kind(self, i: int):
+        return self.kind_names[self.kinds[i]]
+
+    def __value(self, v: int):
+        if v >= 0:
+            return v
+        if v == MISSING:
+            return None
+        return self.strings[LITERAL - v]
+
+    def get(self, i: int, key: str):
+        """
+        :return: the index of the referenced node, the literal `str` or None
+        """
+        k = self.__key_ids.get(key)
+        if k is None:
+            return None
+        for j in range(self.fields[i], self.fields[i + 1]):
+            if self.keys[j] == k:
+                return self.__value(self.values[j])
+        return None
+
+    def ref(self, i: int, key: str):
+        """
+        :return: the index of the node referenced by `key` or -1
+        """
+        v = self.get(i, key)
+        return v if type(v) is int else MISSING
+
+    def get_fields(self, i: int):
+        """
+        :return: dict of all fields of node `i`, see `get()`
+        """
+        return {self.key_names[self.keys[j]]: self.__value(self.values[j])
+                for j in range(self.fields[i], self.fields[i + 1])}
+
+    def children(self, i: int):
+        """
+        :return: the indices of the statements of a `statement_list`
+        """
+        return [v for k, v in self.get_fields(i).items() if k.isdigit() and type(v) is int]
+
+    def chain(self, i: int):
+        """
+        :return: `i` and all nodes following it via `chan`, e.g. the
+            variables of a `bind_expr`
+        """
+        ret = []
+        while i >= 0 and len(ret) <= len(self.ids):
+            ret.append(i)
+            i = self.ref(i, "chan")
+        return ret
+
+    def name(self, i: int):
+        """
+        :return: the identifier of a declaration or type or None
+        """
+        n = self.ref(i, "name")
+        if n >= 0 and self.kind(n) == "type_decl":
+            n = self.ref(n, "name")
+        if n < 0:
+            return None
+        strg = self.get(n, "strg")
+        return strg if type(strg) is str else None
+
+    def find(self, kind: str):
+        """
+        :return: the indices of all nodes of `kind`
+        """
+        k = self.__kind_ids.get(kind)
+        if k is None:
+            return []
+        return [i for i, x in enumerate(self.kinds) if x == k]
+
+    def node(self, i: int):
+        """
+        :return: the (lazily created) view of node `i`, see `GCC_NODE_CLASSES`
+        """
+        ret = self.__views[i]
+        if ret is None:
+            ret = self.__views[i] = GCC_NODE_CLASSES.get(self.kind(i), GccNode)(self, i)
+        return ret
+
+    def get_function_decls(self):
+        """
+        :return: the function of this section, or all `function_decl`s if
+            the section name is unknown
+        """
+        ret = [self.node(i) for i in self.find("function_decl")
+               if self.function is None or self.name(i) == self.function]
+        return ret[:1] if self.function is not None else ret
+
+    def source_line(self, file: str, line: int):
+        """
+        :return: the `line` (1-based) of `file` or ""
+        """
+        if file not in self.__sources:
+            try:
+                with open(os.path.join(self.directory or "", file), errors="replace") as f:
+                    self.__sources[file] = f.read().splitlines()
+            except OSError:
+                self.__sources[file] = []
+        lines = self.__sources[file]
+        return lines[line - 1] if 0 < line <= len(lines) else ""
+
+
+class GccNode:
+    """
+    view of a single node of a `GccGraph`, exposing accessors similar to
+    the ones of the clang backend
+    """
+
+    def __init__(self, graph: GccGraph, index: int):
+        self.graph = graph
+        self.index = index
+        self.kind = graph.kind(index)
+
+    @property
+    def id(self):
+        return str(self.graph.ids[self.index])
+
+    @property
+    def name(self):
+        return self.graph.name(self.index)
+
+    def get(self, key: str):
+        """
+        :return: the view of the referenced node, the literal or None
+        """
+        v = self.graph.get(self.index, key)
+        return self.graph.node(v) if type(v) is int else v
+
+    def get_type(self):
+        """
+        :return: the name of the type, e.g. `int`, or its kind if it has none
+        """
+        t = self.graph.ref(self.index, "type")
+        if t < 0:
+            return None
+        return self.graph.name(t) or self.graph.kind(t)
+
+    def get_location(self):
+        """
+        returns a `Location` object (without offset and column) if available
+        else None
+        """
+        srcp = self.graph.get(self.index, "srcp")
+        if type(srcp) is not str or ":" not in srcp:
+            return None
+        file, line = srcp.rsplit(":", 1)
+        return Location(None, file, int(line), None, None)
+
+    def get_file(self):
+        loc = self.get_location()
+        return loc.file if loc is not None else None
+
+    def __str__(self):
+        return "@{} {} {}".format(self.id, self.kind, self.graph.get_fields(self.index))
+
+
+class GccVarDecl(GccNode):
+    def get_width(self):
+        """
+        returns the width if the variable in bytes
+        """
+        size = self.graph.ref(self.index, "size")
+        if size < 0:
+            return type2width(self.get_type())
+        return int(self.graph.get(size, "int")) // 8
+
+    def is_integral(self):
+        t = self.graph.ref(self.index, "type")
+        return t >= 0 and self.graph.kind(t) == "integer_type"
+
+    def get_init_value(self):
+        """
+        :return: the value of an integer initializer or None
+        """
+        init = self.graph.ref(self.index, "init")
+        if init < 0 or self.graph.kind(init) != "integer_cst":
+            return None
+        return self.graph.get(init, "int")
+
+
+class GccParmVarDecl(GccVarDecl):
+    def get_init_value(self):
+        return None
+
+
+class GccFunctionDecl(GccNode):
+    def get_arguments(self):
+        """
+        the chain of the declarations is not dumped, hence these are the
+        first argument and all other ones which are used in the section
+        """
+        g = self.graph
+        first = g.ref(self.index, "args")
+        ret = [first] if first >= 0 else []
+        ret += [i for i in g.find("parm_decl") if i != first and g.ref(i, "scpe") == self.index]
+        return [g.node(i) for i in ret]
+
+    def get_body(self):
+        """
+        :return: the body of the function of the section (`@1`) or None
+        """
+        g = self.graph
+        if g.function is None or self.name != g.function or len(g) == 0:
+            return None
+        return g.node(0)
+
+    def get_return_type(self):
+        t = self.graph.ref(self.index, "type")
+        r = self.graph.ref(t, "retn") if t >= 0 else MISSING
+        return self.graph.name(r) if r >= 0 else None
+
+
+class GccLoop:
+    """
+    gcc lowers loops to labels and gotos before the tree is dumped:
+        for/while:  goto cond; body: ...; cond: if (c) goto body; else goto end; end:
+        do:         body: ...; if (c) goto body; else goto end; end:
+    for and while loops only differ in the source line of their labels. The
+    increment of a for loop is the last statement of its body, its init the
+    statement in front of the loop, or the initializer of the counter if it
+    is declared within the loop.
+
+    The accessors are the ones of the clang loops, they return None (or an
+    empty list) where gcc keeps no equivalent.
+    """
+
+    def __init__(self, graph: GccGraph, kind: str, label: int, condition: int, body: list[int],
+                 init: int = MISSING, end: int = MISSING):
+        """
+        :param label: the `label_decl` of the loop body
+        :param init: the statement in front of the loop
+        :param end: the `label_decl` following the loop, the target of `break`
+        """
+        self.graph = graph
+        # "for", "while" or "do"
+        self.kind = kind
+        self.__label = label
+        self.__condition = condition
+        self.__body = body
+        self.__end = end
+        g = graph
+        self.__increment = MISSING
+        if kind == "for" and body and g.kind(body[-1]) in _STEPS:
+            self.__increment = body[-1]
+            self.__body = body[:-1]
+        self.__variable = MISSING
+        if self.__increment >= 0:
+            v = g.ref(self.__increment, "op0")
+            if v >= 0 and g.kind(v) in ("var_decl", "parm_decl"):
+                self.__variable = v
+        self.__init = MISSING
+        if self.__variable >= 0:
+            if init >= 0 and g.kind(init) == "modify_expr" and g.ref(init, "op0") == self.__variable:
+                self.__init = init
+            elif g.ref(self.__variable, "init") >= 0 and \
+                    g.get(self.__variable, "srcp") == g.get(label, "srcp"):
+                # `for (int i = 0; ...)`
+                self.__init = self.__variable
+
+    def __node(self, i: int):
+        return self.graph.node(i) if i >= 0 else None
+
+    def get_condition(self):
+        return self.__node(self.__condition)
+
+    def get_body(self):
+        """
+        :return: the statements of the loop body, without the increment
+        """
+        return [self.graph.node(i) for i in self.__body]
+
+    def get_location(self):
+        return self.graph.node(self.__label).get_location() if self.__label >= 0 else None
+
+    def get_init(self):
+        """
+        :return: the assignment (or the `var_decl`) initializing the counter
+        """
+        return self.__node(self.__init)
+
+    def get_increment(self):
+        return self.__node(self.__increment)
+
+    def get_variable(self):
+        """
+        :return: the counter of a for loop
+        """
+        return self.__node(self.__variable)
+
+    def get_lower_limit(self):
+        g = self.graph
+        if self.__init < 0:
+            return None
+        return self.__node(g.ref(self.__init, "init" if self.__init == self.__variable else "op1"))
+
+    def get_upper_limit(self):
+        g = self.graph
+        c = self.__condition
+        if self.__variable < 0 or c < 0:
+            return None
+        if g.ref(c, "op0") == self.__variable:
+            return self.__node(g.ref(c, "op1"))
+        if g.ref(c, "op1") == self.__variable:
+            return self.__node(g.ref(c, "op0"))
+        return None
+
+    def get_step_size(self):
+        g = self.graph
+        i = self.__increment
+        if i < 0:
+            return None
+        if g.kind(i) != "modify_expr":
+            # `i++`, the step is op1
+            return self.__node(g.ref(i, "op1"))
+        value = g.ref(i, "op1")
+        if value >= 0 and g.kind(value) in ("plus_expr", "minus_expr") and \
+                g.ref(value, "op0") == self.__variable:
+            return self.__node(g.ref(value, "op1"))
+        return None
+
+    def is_basic_loop(self):
+        """
+        returns true if the loop is of the simplest form:
+            for(int i = 0; i < 32; i++){ ... }
+        """
+        return self.kind == "for" and None not in (
+            self.get_lower_limit(), self.get_upper_limit(), self.get_step_size())
+
+    def __walk(self):
+        """
+        :return: all nodes below the body statements in pre-order
+        """
+        g = self.graph
+        ret = []
+        seen = set()
+        stack = list(reversed(self.__body))
+        while stack:
+            i = stack.pop()
+            if i in seen:
+                continue
+            seen.add(i)
+            ret.append(i)
+            if g.kind(i) == "statement_list":
+                stack.extend(reversed(g.children(i)))
+            else:
+                stack.extend(reversed([v for k, v in g.get_fields(i).items()
+                                       if k in _STATEMENT_KEYS and type(v) is int]))
+        return ret
+
+    def get_var_decls(self):
+        """
+        :return: the first variable of each block within the body, see
+            `GccCompoundStmt.get_var_decls`
+        """
+        g = self.graph
+        return [g.node(g.ref(i, "vars")) for i in self.__walk()
+                if g.kind(i) == "bind_expr" and g.ref(i, "vars") >= 0]
+
+    def get_variables(self):
+        return self.get_var_decls()
+
+    def get_func_calls(self):
+        return [self.graph.node(i) for i in self.__walk() if self.graph.kind(i) == "call_expr"]
+
+    def get_break_stmts(self):
+        """
+        :return: the `goto_expr`s jumping behind the loop
+        """
+        g = self.graph
+        if self.__end < 0:
+            return []
+        return [g.node(i) for i in self.__walk()
+                if g.kind(i) == "goto_expr" and g.ref(i, "labl") == self.__end]
+
+
+class GccCompoundStmt(GccNode):
+    """
+    `bind_expr` (a block with variables) or `statement_list`
+    """
+
+    def __init__(self, graph: GccGraph, index: int):
+        super().__init__(graph, index)
+        self.__loops = None
+
+    def get_var_decls(self, i: int = None):
+        """
+        the chain of the declarations is not dumped, hence the outermost
+        block of a function returns all local variables of the function,
+        nested blocks only their first one.
+        """
+        g = self.graph
+        first = g.ref(self.index, "vars") if self.kind == "bind_expr" else MISSING
+        ret = [first] if first >= 0 else []
+        if self.index == 0 and g.get_function_decls():
+            f = g.get_function_decls()[0].index
+            ret += [j for j in g.find("var_decl") if j != first and g.ref(j, "scpe") == f]
+        ret = [g.node(j) for j in ret]
+        if i is not None:
+            if i > len(ret):
+                print("OOB")
+                return None
+            return ret[i]
+        return ret
+
+    def __statement_lists(self):
+        """
+        :return: all `statement_list`s below this node in pre-order
+        """
+        g = self.graph
+        ret = []
+        seen = set()
+        stack = [self.index]
+        while stack:
+            i = stack.pop()
+            if i in seen:
+                continue
+            seen.add(i)
+            kind = g.kind(i)
+            if kind == "statement_list":
+                ret.append(i)
+                stack.extend(reversed(g.children(i)))
+            else:
+                stack.extend(v for k, v in g.get_fields(i).items()
+                             if k in _STATEMENT_KEYS and type(v) is int)
+        return ret
+
+    def __find_loops(self):
+        g = self.graph
+        self.__loops = []
+        lists = self.__statement_lists()
+        # a loop, which is the whole `statement_list`, is preceded by the
+        # statement in front of that list
+        previous = {}
+        for s in lists:
+            stmts = g.children(s)
+            for p in range(1, len(stmts)):
+                if g.kind(stmts[p]) == "statement_list":
+                    previous[stmts[p]] = stmts[p - 1]
+        for s in lists:
+            stmts = g.children(s)
+            # label_decl -> position of its label_expr
+            labels = {g.ref(j, "name"): p for p, j in enumerate(stmts)
+                      if g.kind(j) == "label_expr"}
+            for p, j in enumerate(stmts):
+                if g.kind(j) != "cond_expr":
+                    continue
+                goto = g.ref(j, "op1")
+                if goto < 0 or g.kind(goto) != "goto_expr":
+                    continue
+                start = labels.get(g.ref(goto, "labl"), p)
+                if start >= p:
+                    continue
+                # a pretest loop jumps to the label of the condition first
+                pre = stmts[start - 1] if start > 0 else MISSING
+                cond = labels.get(g.ref(pre, "labl")) if pre >= 0 and g.kind(pre) == "goto_expr" else None
+                label = g.ref(stmts[start], "name")
+                if cond is not None and start < cond < p:
+                    srcp = g.get(label, "srcp") if label >= 0 else None
+                    file, _, line = (srcp or "").rpartition(":")
+                    kind = "for" if line.isdigit() and \
+                        _FOR.search(g.source_line(file, int(line))) else "while"
+                    body = stmts[start + 1:cond]
+                else:
+                    kind = "do"
+                    body = stmts[start + 1:p]
+                exit_ = g.ref(j, "op2")
+                end = g.ref(exit_, "labl") if exit_ >= 0 and g.kind(exit_) == "goto_expr" else MISSING
+                init = MISSING
+                if kind == "for":
+                    init = stmts[start - 2] if start >= 2 else previous.get(s, MISSING)
+                self.__loops.append(GccLoop(g, kind, label, g.ref(j, "op0"), body, init, end))
+
+    def get_loops(self, kind: str = None):
+        """
+        :param kind: "for", "while" or "do", None for all
+        """
+        if self.__loops is None:
+            self.__find_loops()
+        return [l for l in self.__loops if kind is None or l.kind == kind]
+
+    def get_for_loops(self, i: int = None):
+        ret = self.get_loops("for")
+        return ret[i] if i is not None else ret
+
+    def get_while_loops(self, i: int = None):
+        ret = self.get_loops("while")
+        return ret[i] if i is not None else ret
+
+    def get_do_loops(self, i: int = None):
+        ret = self.get_loops("do")
+        return ret[i] if i is not None else ret
+
+
+GCC_NODE_CLASSES = {
+    "function_decl": GccFunctionDecl,
+    "var_decl": GccVarDecl,
+    "parm_decl": GccParmVarDecl,
+    "bind_expr": GccCompoundStmt,
+    "statement_list": GccCompoundStmt,
+}
+
+
+_HEADER = ";; Function "
+
+
+def parse_header(line: str):
+    """
+        ;; Function f (null)                         -> ("f", "f")
+        ;; Function int n::g(T) [with T = int] (_Z1gi) -> ("int n::g(T) [with T = int]", "g")
+    :return: the signature and the unqualified name of the function of a
+        section header
+    """
+    signature = line[len(_HEADER):].rstrip()
+    # the assembler name or `(null)`
+    if signature.endswith(")") and " (" in signature:
+        signature = signature[:signature.rindex(" (")]
+    decl = signature.split(" [with ")[0]
+    if "(" in decl:
+        decl = decl[:decl.index("(")]
+    name = decl.split()[-1] if decl.split() else signature
+    return signature, name.split("::")[-1]
+
+
+def _selected(functions, signature: str, name: str):
+    return not functions or name in functions or signature in functions
+
+
+def iter_sections(lines, functions: list[str] = None):
+    """
+    splits a dump into its `;; Function` sections. The lines of sections
+    which are not selected are skipped without being parsed.
+    :param lines: iterable over `str` or `bytes` lines
+    :param functions: if given, only the sections of the functions with
+        these names (or signatures)
+    :return: iterator over `(signature, name, lines)`
+    """
+    section = None
+    for line in lines:
+        line = _decode(line)
+        if line.startswith(_HEADER):
+            if section is not None:
+                yield section
+            signature, name = parse_header(line)
+            section = (signature, name, []) if _selected(functions, signature, name) else None
+        elif section is not None:
+            section[2].append(line)
+    if section is not None:
+        yield section
+
+
+def index_sections(path: str, functions: list[str] = None):
+    """
+    :return: `(signature, name, begin, end)` of the selected sections of the
+        dump `path`, with `begin` and `end` as byte offsets
+    """
+    ret = []
+    offset = 0
+    header = _HEADER.encode()
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(header):
+                if ret and ret[-1][3] is None:
+                    ret[-1][3] = offset
+                signature, name = parse_header(_decode(line))
+                if _selected(functions, signature, name):
+                    ret.append([signature, name, offset, None])
+            offset += len(line)
+    if ret and ret[-1][3] is None:
+        ret[-1][3] = offset
+    return [tuple(s) for s in ret]
+
+
+def _chunks(sections: list, n: int):
+    """
+    :return: `sections` split into about `n` lists of consecutive sections
+        of similar size
+    """
+    total = sum(s[3] - s[2] for s in sections)
+    ret = [[]]
+    size = 0
+    for s in sections:
+        if size >= total / n * len(ret):
+            ret.append([])
+        ret[-1].append(s)
+        size += s[3] - s[2]
+    return [c for c in ret if c]
+
+
+def _parse_sections(sections: list, dump: str, directory: str, graph: bool):
+    """
+    worker of `gcc_parser.execute`, parses consecutive sections of a dump
+    :return: tuple `(None, [(signature, result), ...])`, see `ParseResult`
+    """
+    with open(dump, "rb") as f:
+        f.seek(sections[0][2])
+        data = f.read(sections[-1][3] - sections[0][2])
+    ret = []
+    for signature, name, begin, end in sections:
+        begin -= sections[0][2]
+        end -= sections[0][2]
+        lines = data[begin:end].splitlines()
+        ret.append((signature, _parse_lines(signature, name, lines, directory, graph)))
+    return None, ret
+
+
+def _parse_lines(signature: str, name: str, lines, directory: str, graph: bool):
+    if graph:
+        g = GccGraph.from_lines(lines, directory)
+        g.signature, g.function = signature, name
+        return g
+    nodes = {}
+    for n in gcc_parser.iter_nodes(lines):
+        nodes[n.id] = n
+    return nodes
+
+
 class gcc_parser:
     """
-    wrapper around the command: `gcc -fdump-tree-original-raw=outfile.data input.c`
+    wrapper around the command: `gcc -fsyntax-only -fdump-tree-original-raw=outfile.data input.c`
+    The tree is dumped by the front end, hence no code is generated. Each
+    run uses its own temporary directory (or a pipe), so any number of
+    parsers can run concurrently.
     """
 
     BINARY = ["gcc"]
-    COMMANDS = ["-c", "-o", "/tmp/kek.o"]
+    COMMANDS = ["-fsyntax-only"]
     COMMAND = "-fdump-tree-original-raw="
 
-    def __init__(self, file: Union[str, Path]):
+    def __init__(self, file: Union[str, Path], functions: list[str] = [],
+                 stream: bool = False, graph: bool = False, jobs: int = 1):
+        """
+        :param functions: if given only the sections of these functions (by
+            name or signature) are parsed, the others are skipped
+        :param stream: if true, gcc writes the dump into a pipe, which is
+            parsed while gcc is still running, instead of a temporary file
+        :param graph: if true, each section is parsed into a `GccGraph`
+            instead of a dict of `ParsingNode`s
+        :param jobs: number of processes parsing the sections of the dump.
+            Not used in `stream` mode.
+        """
         self.__file = file if type(file) is str else file.absolute()
-        self.__outfile = tempfile.NamedTemporaryFile(suffix=".data")
+        self.__functions = functions
+        self.__stream = stream
+        self.__graph = graph
+        self.__jobs = jobs
+        self.__result = None
+
+    @staticmethod
+    def get_toolchain():
+        """
+        :return: the `Toolchain` of `BINARY` or None if it is not available
+        """
+        from python_c_cpp_parser.toolchain import discover
+        return discover(gcc_parser.BINARY[0])
+
+    def get_function_decls(self, i: int = None):
+        """
+        only available with `graph=True`
+        """
+        ret = []
+        for g in (self.__result or {}).values():
+            if type(g) is GccGraph:
+                ret.extend(g.get_function_decls())
+        if i is not None:
+            if i > len(ret):
+                print("OOB")
+                return None
+            return ret[i]
+        return ret
+
+    def __read(self, lines):
+        directory = os.path.dirname(str(self.__file))
+        self.__result = {}
+        for signature, name, section in iter_sections(lines, self.__functions):
+            self.__result[signature] = _parse_lines(signature, name, section, directory, self.__graph)
+        return self.__result
+
+    def __read_parallel(self, dump: str):
+        directory = os.path.dirname(str(self.__file))
+        sections = index_sections(dump, self.__functions)
+        jobs = self.__jobs if self.__jobs is not None else (os.cpu_count() or 1)
+        results = {}
+        kwargs = {"dump": dump, "directory": directory, "graph": self.__graph}
+        # a few chunks per process, as single sections are usually small
+        for r in run_many(_parse_sections, _chunks(sections, 4 * jobs), jobs, kwargs):
+            if not r.ok():
+                logging.error("couldn't parse the sections of %s-%s: %s",
+                              r.file[0][0], r.file[-1][0], r.error)
+                return None
+            results.update(r.root)
+        # in the order of the dump
+        self.__result = {s[0]: results[s[0]] for s in sections}
+        return self.__result
 
     def execute(self):
-        cmd = gcc_parser.BINARY + gcc_parser.COMMANDS + [gcc_parser.COMMAND+str(self.__outfile.name)]
-        cmd += [self.__file]
-        p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=STDOUT)
-        p.wait()
+        """
+        :return: dict of the signatures of the functions (e.g. `main` in c
+            or `int main()` in c++) and their parsed sections, in the order
+            of the dump. See `graph`.
+        """
+        if self.__stream:
+            return self.__execute_stream()
 
-        if p.returncode != 0 and p.returncode is not None:
-            logging.error("couldn't execute:")
-            print(p.stdout.read())
-            return None
+        from subprocess import Popen, PIPE, STDOUT, DEVNULL
+        import tempfile
+        with tempfile.TemporaryDirectory(prefix="gcc_parser") as directory:
+            dump = os.path.join(directory, "tree.raw")
+            cmd = gcc_parser.BINARY + gcc_parser.COMMANDS + [gcc_parser.COMMAND + dump]
+            cmd += [self.__file]
+            p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=STDOUT)
+            out, _ = p.communicate()
+
+            if p.returncode != 0:
+                logging.error("couldn't execute: %s %s", " ".join(map(str, cmd)),
+                              out.decode(errors="replace"))
+                return None
+
+            return self.__read_dump(dump)
 
-        self.__outfile.flush()
-        self.__outfile.seek(0)
-        lines = self.__outfile.readlines()
-        lines = [
-            str(a).replace("b'", "").replace("\\n'", "").lstrip()
-            for a in lines
-        ]
-        return self.parse(lines)
+    def __read_dump(self, dump: str):
+        if self.__jobs is None or self.__jobs > 1:
+            return self.__read_parallel(dump)
+        with open(dump, "rb") as f:
+            return self.__read(f)
 
-    def parse(self, lines: list[str]):
+    async def execute_async(self, semaphore: "asyncio.Semaphore" = None, executor=None):
+        """
+        like `execute()`, but without blocking the event loop: gcc runs as an
+        asyncio subprocess and the dump is parsed within `executor`.
+        :param semaphore: limits the number of concurrent gcc processes,
+            defaults to `batch.default_semaphore()`
+        :param executor: defaults to the default executor of the event loop.
+            A `ProcessPoolExecutor` is supported as well.
+        """
+        import asyncio
+        import tempfile
+        loop = asyncio.get_running_loop()
+        if self.__stream:
+            # parsed while gcc is running
+            async with semaphore if semaphore is not None else default_semaphore():
+                parser, result = await loop.run_in_executor(executor, gcc_parser._execute_worker, self)
+        else:
+            with tempfile.TemporaryDirectory(prefix="gcc_parser") as directory:
+                dump = os.path.join(directory, "tree.raw")
+                cmd = gcc_parser.BINARY + gcc_parser.COMMANDS + [gcc_parser.COMMAND + dump]
+                cmd += [str(self.__file)]
+                returncode, out, err = await run_process(cmd, None, semaphore)
+                if returncode != 0:
+                    logging.error("couldn't execute: %s %s", " ".join(cmd),
+                                  (out + err).decode(errors="replace"))
+                    return None
+                parser, result = await loop.run_in_executor(executor, gcc_parser._read_worker,
+                                                            self, dump)
+        if parser is not self:
+            self.__dict__.update(parser.__dict__)
+        return result
+
+    @staticmethod
+    def _execute_worker(parser):
+        """
+        worker of `execute_async`, may run in another process
+        """
+        return parser, parser.execute()
+
+    @staticmethod
+    def _read_worker(parser, dump: str):
+        """
+        worker of `execute_async`, parses the `dump` of gcc. May run in
+        another process.
+        """
+        return parser, parser.__read_dump(dump)
+
+    def __execute_stream(self):
+        """
+        gcc writes the dump to its stdout, its diagnostics are collected in
+        a temporary file.
+        """
+        from subprocess import Popen, PIPE, DEVNULL
+        import tempfile
+        cmd = gcc_parser.BINARY + gcc_parser.COMMANDS + [gcc_parser.COMMAND + "stdout"]
+        cmd += [self.__file]
+        with tempfile.TemporaryFile() as err:
+            p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=err)
+            try:
+                nodes = self.__read(p.stdout)
+            finally:
+                p.stdout.close()
+                p.wait()
+            if p.returncode != 0:
+                err.seek(0)
+                logging.error("couldn't execute: %s %s", " ".join(map(str, cmd)),
+                              err.read().decode(errors="replace"))
+                return None
+        return nodes
+
+    @staticmethod
+    def iter_nodes(lines):
         """
         parses something like:
         ...
-        @1      bind_expr        type: @2       vars: @3       body: @4      
-        @2      void_type        name: @5       algn: 8       
-        @3      var_decl         name: @6       type: @7       scpe: @8      
-                                 srcp: test2.c:3               init: @9      
-                                 size: @10      algn: 32       used: 1   
+        @1      bind_expr        type: @2       vars: @3       body: @4
+        @2      void_type        name: @5       algn: 8
+        @3      var_decl         name: @6       type: @7       scpe: @8
+                                 srcp: test2.c:3               init: @9
+                                 size: @10      algn: 32       used: 1
         ...
-
-        :return: a dictionary which keys are the node ids and values the nodes are.
+        line by line and yields each `ParsingNode` as soon as it is complete.
+        :param lines: iterable over `str` or `bytes` lines, e.g. a file
+            or a pipe
         """
-        # first find the entry
-        i = 0
-        while is_empty_str(lines[i]) or lines[i].startswith(";"):
-            i = i + 1
-
-        # now start the actual parsing
-        lines = lines[i:]
-        i = 0
         cNode = None
-        nodes = {}
-        while i < len(lines):
-            # if the line starts with `@` create a new node and pus the old one
-            if lines[i].startswith("@"):
-                if cNode is not None:
-                    assert cNode.id
-                    nodes[cNode.id] = cNode
-                
-                cNode = ParsingNode.from_line(lines[i])
-                i = i + 1
+        for line in lines:
+            line = _decode(line)
+            # `;; Function main (null)` headers and empty lines
+            if line.startswith(";") or line.isspace() or not line:
                 continue
 
+            head, options = split_line(line)
+            # if the line starts with `@` create a new node and push the old one
+            if head is not None:
+                if cNode is not None:
+                    yield cNode
+                cNode = ParsingNode(id=head[0], kind=head[1])
+
             # if not a new node update the current one:
             assert cNode
-            options = split_line(lines[i])
-            assert len(options) % 2 == 0
-            for j in range(0, len(options), 2):
-                opt = options[j]
-                val = options[j + 1]
-                cNode.__dict__[opt] = val
+            cNode.__dict__.update(options)
 
-            i = i + 1
+        if cNode is not None:
+            yield cNode
 
+    def parse(self, lines):
+        """
+        see `iter_nodes`, the dump must only contain a single function
+        section, see `iter_sections` otherwise.
+        :return: a dictionary which keys are the node ids and values the nodes are.
+        """
+        nodes = {}
+        for n in gcc_parser.iter_nodes(lines):
+            nodes[n.id] = n
         return nodes
 
 
-c = gcc_parser("../test/c/var_decl/simple.c")
-nodes = c.execute()
-#for n in nodes.values():
-#    print(n)
-nodes2 = parse_gcc_node_to_clang_node(nodes)
-for n in nodes2.values():
-    print(n)
+def _parse_one(file: Union[str, Path], **kwargs):
+    """
+    worker of `parse_many`
+    """
+    c = gcc_parser(file, **kwargs)
+    return c, c.execute()
+
+
+def parse_many(files: list[Union[str, Path]], jobs: int = None, **kwargs):
+    """
+    parses each file via `gcc_parser(file, **kwargs).execute()` within a
+    pool of `jobs` worker processes.
+        for r in parse_many(files, jobs=8, graph=True):
+            if r.ok():
+                print(r.file, r.parser.get_function_decls())
+    :param jobs: number of processes, defaults to the number of cpus.
+    :return: iterator over `ParseResult`s in completion order
+    """
+    return run_many(_parse_one, files, jobs, kwargs)
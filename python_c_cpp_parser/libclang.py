@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+in-process alternative to running `clang -Xclang -ast-dump=json`, based on
+the python bindings of libclang (`pip install libclang`). The cursors of a
+translation unit are translated into the json objects clang would dump, so
+the same `Node` classes are built from them.
+
+Differences to the json output of clang:
+    - locations are never elided and macro locations are given as their
+      expansion location (no `spellingLoc`/`expansionLoc`)
+    - `ImplicitCastExpr`s have no `castKind` and only `DeclRefExpr`s have
+      a `valueCategory`
+    - implicit declarations (e.g. `__int128_t`) and attributes are missing
+"""
+import logging
+import os
+import re
+
+try:
+    from clang import cindex
+except ImportError:
+    cindex = None
+
+# libclang cursor kinds whose name doesn't translate into the kind of the
+# json output by `_kind`
+KINDS = {
+    "TRANSLATION_UNIT": "TranslationUnitDecl",
+    "PARM_DECL": "ParmVarDecl",
+    "STRUCT_DECL": "RecordDecl",
+    "UNION_DECL": "RecordDecl",
+    "UNEXPOSED_EXPR": "ImplicitCastExpr",
+    "MEMBER_REF_EXPR": "MemberExpr",
+    "CSTYLE_CAST_EXPR": "CStyleCastExpr",
+    "COMPOUND_ASSIGNMENT_OPERATOR": "CompoundAssignOperator",
+    "CXX_UNARY_EXPR": "UnaryExprOrTypeTraitExpr",
+    "CLASS_DECL": "CXXRecordDecl",
+    "CXX_METHOD": "CXXMethodDecl",
+    "CONSTRUCTOR": "CXXConstructorDecl",
+    "DESTRUCTOR": "CXXDestructorDecl",
+    "NAMESPACE": "NamespaceDecl",
+    "CXX_BOOL_LITERAL_EXPR": "CXXBoolLiteralExpr",
+    "CXX_NULL_PTR_LITERAL_EXPR": "CXXNullPtrLiteralExpr",
+    "CXX_FOR_RANGE_STMT": "CXXForRangeStmt",
+    "CXX_THIS_EXPR": "CXXThisExpr",
+}
+
+_TOKEN = re.compile(rb'[A-Za-z0-9_.]+|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|'
+                    rb'<<=|>>=|\.\.\.|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||'
+                    rb'[-+*/%&|^]=|::|.', re.S)
+
+# created on first use, one per process
+_index = None
+
+
+def available() -> bool:
+    """
+    :return: true if the python bindings of libclang are installed
+    """
+    return cindex is not None
+
+
+def _kind(kind) -> str:
+    """
+    `FUNCTION_DECL` -> `FunctionDecl`
+    """
+    name = kind.name
+    if name in KINDS:
+        return KINDS[name]
+    return "".join(p.capitalize() for p in name.split("_"))
+
+
+class _Translator:
+    """
+    translates the cursors of a single translation unit
+    """
+
+    def __init__(self, cwd: str = None):
+        self.cwd = cwd
+        self.__sources = {}
+        self.__decl_ids = {}
+        self.__next_id = 1
+
+    def source(self, file: str) -> bytes:
+        if file not in self.__sources:
+            try:
+                with open(os.path.join(self.cwd or "", file), "rb") as f:
+                    self.__sources[file] = f.read()
+            except OSError:
+                self.__sources[file] = b""
+        return self.__sources[file]
+
+    def id(self, cursor=None):
+        """
+        declarations are referenced by their id, hence the same cursor
+        always gets the same id
+        """
+        if cursor is not None:
+            ret = self.__decl_ids.get(cursor)
+            if ret is not None:
+                return ret
+        ret = hex(self.__next_id)
+        self.__next_id += 1
+        if cursor is not None:
+            self.__decl_ids[cursor] = ret
+        return ret
+
+    def location(self, loc) -> dict:
+        if loc.file is None:
+            return {}
+        file = loc.file.name
+        m = _TOKEN.match(self.source(file), loc.offset)
+        return {"offset": loc.offset, "file": file, "line": loc.line,
+                "col": loc.column, "tokLen": m.end() - m.start() if m else 0}
+
+    def end_location(self, loc) -> dict:
+        """
+        libclang points behind the last token of a range, clang to its
+        beginning
+        """
+        if loc.file is None:
+            return {}
+        file = loc.file.name
+        begin = _token_begin(self.source(file), loc.offset)
+        return {"offset": begin, "file": file, "line": loc.line,
+                "col": loc.column - (loc.offset - begin), "tokLen": loc.offset - begin}
+
+    def text(self, begin, end) -> str:
+        if begin.file is None:
+            return ""
+        return self.source(begin.file.name)[begin.offset:end.offset].decode(errors="replace")
+
+    def node(self, cursor, children: list) -> dict:
+        """
+        :param children: the child cursors of `cursor`
+        :return: the json object of `cursor` without `inner`
+        """
+        kind = cursor.kind
+        d = {"id": self.id(cursor if kind.is_declaration() else None),
+             "kind": _kind(kind)}
+        if kind == cindex.CursorKind.TRANSLATION_UNIT:
+            d["loc"] = {}
+            d["range"] = {"begin": {}, "end": {}}
+            return d
+
+        # like clang, only declarations have a `loc`
+        extent = cursor.extent
+        if kind.is_declaration():
+            d["loc"] = self.location(cursor.location)
+        d["range"] = {"begin": self.location(extent.start),
+                      "end": self.end_location(extent.end)}
+        if kind.is_declaration():
+            if cursor.spelling:
+                d["name"] = cursor.spelling
+            if cursor.type.spelling:
+                d["type"] = {"qualType": cursor.type.spelling}
+            try:
+                storage = cursor.storage_class.name
+            except (ValueError, AttributeError):
+                storage = "NONE"
+            if storage not in ("NONE", "INVALID"):
+                d["storageClass"] = storage.lower()
+            if kind == cindex.CursorKind.VAR_DECL and children:
+                d["init"] = "c"
+            # libclang only knows the first declaration, not the previous one
+            canonical = cursor.canonical
+            if canonical is not None and canonical != cursor:
+                d["previousDecl"] = self.id(canonical)
+            return d
+
+        if kind.is_expression() and cursor.type.spelling:
+            d["type"] = {"qualType": cursor.type.spelling}
+
+        if kind == cindex.CursorKind.DECL_REF_EXPR:
+            ref = cursor.referenced
+            if ref is not None:
+                d["valueCategory"] = "prvalue" if \
+                    ref.kind == cindex.CursorKind.ENUM_CONSTANT_DECL else "lvalue"
+                d["referencedDecl"] = {"id": self.id(ref), "kind": _kind(ref.kind),
+                                       "name": ref.spelling,
+                                       "type": {"qualType": ref.type.spelling}}
+        elif kind in (cindex.CursorKind.BINARY_OPERATOR,
+                      cindex.CursorKind.COMPOUND_ASSIGNMENT_OPERATOR):
+            if len(children) == 2:
+                d["opcode"] = self.text(children[0].extent.end, children[1].extent.start).strip()
+        elif kind == cindex.CursorKind.UNARY_OPERATOR:
+            if len(children) == 1:
+                inner = children[0].extent
+                if extent.start.offset < inner.start.offset:
+                    d["isPostfix"] = False
+                    d["opcode"] = self.text(extent.start, inner.start).strip()
+                else:
+                    d["isPostfix"] = True
+                    d["opcode"] = self.text(inner.end, extent.end).strip()
+        elif kind == cindex.CursorKind.INTEGER_LITERAL:
+            d["value"] = _integer(self.text(extent.start, extent.end))
+        elif kind in (cindex.CursorKind.FLOATING_LITERAL, cindex.CursorKind.STRING_LITERAL,
+                      cindex.CursorKind.CHARACTER_LITERAL):
+            d["value"] = self.text(extent.start, extent.end)
+        return d
+
+    def for_slots(self, cursor, children: list):
+        """
+        clang writes all 5 children of a `ForStmt` (init, condition variable,
+        condition, increment and body), missing ones as `{}`. libclang only
+        returns the present ones.
+        :return: list of the indices of `children` in the `inner` of the
+            loop or None
+        """
+        text = self.text(cursor.extent.start, cursor.extent.end)
+        begin = text.find("(")
+        if begin < 0:
+            return None
+        parts = [""]
+        depth = 0
+        for c in text[begin + 1:]:
+            if c in "([{":
+                depth += 1
+            elif c in ")]}":
+                if depth == 0:
+                    break
+                depth -= 1
+            elif c == ";" and depth == 0:
+                parts.append("")
+                continue
+            parts[-1] += c
+        if len(parts) != 3:
+            return None
+        slots = [s for s, p in zip((0, 2, 3), parts) if p.strip()] + [4]
+        return slots if len(slots) == len(children) else None
+
+    def translate(self, cursor) -> dict:
+        """
+        :return: the json object of `cursor` and all its children
+        """
+        root = None
+        # (cursor, list of the parent, index within this list)
+        stack = [(cursor, None, 0)]
+        while stack:
+            c, inner, i = stack.pop()
+            children = [ch for ch in c.get_children()
+                        if not (ch.kind.is_reference() or ch.kind.is_attribute())]
+            d = self.node(c, children)
+            if inner is None:
+                root = d
+            else:
+                inner[i] = d
+            if not children:
+                continue
+
+            slots = None
+            if c.kind == cindex.CursorKind.FOR_STMT:
+                slots = self.for_slots(c, children)
+            if slots is not None:
+                d["inner"] = [{} for _ in range(5)]
+            else:
+                slots = range(len(children))
+                d["inner"] = [None] * len(children)
+            for ch, slot in reversed(list(zip(children, slots))):
+                stack.append((ch, d["inner"], slot))
+        return root
+
+
+def _token_begin(src: bytes, end: int) -> int:
+    """
+    :return: the beginning of the token ending at `end`
+    """
+    if end <= 0:
+        return 0
+    c = src[end - 1:end]
+    if c.isalnum() or c == b"_":
+        begin = end - 1
+        while begin > 0 and (src[begin - 1:begin].isalnum() or src[begin - 1:begin] == b"_"):
+            begin -= 1
+        return begin
+    if c == b'"' or c == b"'":
+        begin = src.rfind(c, 0, end - 1)
+        while begin > 0 and src[begin - 1:begin] == b"\\":
+            begin = src.rfind(c, 0, begin - 1)
+        return max(begin, 0)
+    for n in (3, 2):
+        m = _TOKEN.match(src, end - n) if end >= n else None
+        if m and m.end() == end:
+            return end - n
+    return end - 1
+
+
+def _integer(text: str) -> str:
+    """
+    `0x10u` -> `16`, as clang writes the value of integer literals
+    """
+    t = text.rstrip("uUlL")
+    try:
+        if t[:2] in ("0x", "0X"):
+            return str(int(t, 16))
+        if t[:2] in ("0b", "0B"):
+            return str(int(t, 2))
+        if len(t) > 1 and t[0] == "0":
+            return str(int(t, 8))
+        return str(int(t))
+    except ValueError:
+        return text
+
+
+def translate(file: str, flags: list[str] = None, cwd: str = None,
+              source_filter=None, functions: list[str] = None):
+    """
+    parses `file` via libclang and translates it into the json output of
+    `clang -Xclang -ast-dump=json`
+    :param flags: compiler flags
+    :param cwd: directory relative paths are resolved against
+    :param source_filter: `SourceFilter` applied to the top level declarations
+    :param functions: like `-ast-dump-filter`, only the top level
+        declarations whose name contains the last entry are translated
+    :return: tuple of the list of roots and the list of included files or
+        None on any error
+    """
+    global _index
+    if cindex is None:
+        logging.error("libclang is not available, install it via `pip install libclang`")
+        return None
+    if _index is None:
+        _index = cindex.Index.create()
+
+    args = list(flags) if flags is not None else []
+    path = str(file)
+    if cwd is not None:
+        args.append("-working-directory=" + str(cwd))
+        path = os.path.join(str(cwd), path)
+    try:
+        tu = _index.parse(path, args=args)
+    except cindex.TranslationUnitLoadError as e:
+        logging.error("couldn't parse %s: %s", file, e)
+        return None
+
+    errors = [d for d in tu.diagnostics if d.severity >= cindex.Diagnostic.Error]
+    if errors:
+        logging.error("couldn't parse %s: %s", file, "\n".join(str(d) for d in errors))
+        return None
+
+    t = _Translator(cwd)
+    dependencies = [os.path.abspath(path)]
+    for i in tu.get_includes():
+        dependencies.append(os.path.abspath(os.path.join(cwd or "", i.include.name)))
+
+    decls = []
+    for c in tu.cursor.get_children():
+        if c.kind.is_attribute() or c.kind.is_reference():
+            continue
+        if functions:
+            if functions[-1] in c.spelling:
+                decls.append(t.translate(c))
+            continue
+
+        f = c.location.file
+        f = f.name if f is not None else None
+        if source_filter is None or source_filter.keep(f):
+            decls.append(t.translate(c))
+        elif source_filter.stubs:
+            decls.append(source_filter.stub(t.node(c, []), f))
+
+    if functions:
+        return decls, dependencies
+
+    root = t.node(tu.cursor, [])
+    if decls:
+        root["inner"] = decls
+    return [root], dependencies
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+reuse of a precompiled header (PCH) for translation units sharing the same
+leading includes (the prelude). The prelude is compiled once via
+    clang -x c-header prelude.h -o prelude.pch
+and every later `clang_parser` run loads it via `-include-pch` instead of
+lexing and parsing the headers again:
+    pch = PrecompiledHeader(["<stdio.h>", "<stdlib.h>"], "build/pch")
+    for r in parse_many(files, pch=pch):
+        ...
+or, detecting the prelude from the files:
+    for r in parse_many(files, pch=True):
+        ...
+
+The headers of the translation units are still included, but skipped via
+their include guards (or `#pragma once`), hence only guarded headers are
+part of a prelude. clang doesn't dump the declarations loaded from a PCH
+(not even with `-ast-dump-all`), hence the AST of a translation unit lacks
+the declarations of the prelude. It is meant for uses only interested in
+the declarations of the translation unit itself, e.g. with `skip_system`
+and a prelude of system headers the AST is the same as without a PCH.
+clang rejects a PCH if one of its headers changed since it was built,
+therefore the size and modification time of all of them are recorded and
+the PCH is rebuilt on the first use after a change.
+"""
+from subprocess import Popen, PIPE, DEVNULL
+from typing import Union
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+from python_c_cpp_parser.toolchain import discover
+
+# default directory of the generated headers and PCHs
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                         "python_c_cpp_parser", "pch")
+
+_INCLUDE = re.compile(r'\s*#\s*include\s*([<"][^>"]+[>"])')
+_PRAGMA_ONCE = re.compile(r"\s*#\s*pragma\s+once\s*$")
+_IFNDEF = re.compile(r"\s*#\s*(?:ifndef\s+(\w+)|if\s+!\s*defined\s*\(?\s*(\w+)\s*\)?)\s*$")
+_ENDIF = re.compile(r"\s*#\s*endif\b")
+CXX_SUFFIXES = (".cc", ".cp", ".cxx", ".cpp", ".c++", ".C", ".hpp", ".hh", ".hxx")
+
+
+def language(file: Union[str, Path]) -> str:
+    """
+    :return: `c++` or `c`, by the suffix of `file`
+    """
+    return "c++" if str(file).endswith(CXX_SUFFIXES) else "c"
+
+
+def _code(lines):
+    """
+    :return: iterator over `lines` without comments
+    """
+    comment = False
+    for line in lines:
+        if comment:
+            if "*/" not in line:
+                continue
+            line = line[line.index("*/") + 2:]
+            comment = False
+        line = re.sub(r"/\*.*?\*/", "", line).split("//")[0]
+        if "/*" in line:
+            line, comment = line[:line.index("/*")], True
+        yield line
+
+
+def is_guarded(path: Union[str, Path]) -> bool:
+    """
+    :return: true if the header `path` contains `#pragma once` or is
+        enclosed by an include guard, i.e. a repeated `#include` of it
+        is empty
+    """
+    try:
+        with open(path, errors="replace") as f:
+            lines = [line for line in _code(f) if line.strip()]
+    except OSError:
+        return False
+    if any(_PRAGMA_ONCE.match(line) for line in lines):
+        return True
+    if len(lines) < 3:
+        return False
+    m = _IFNDEF.match(lines[0])
+    if m is None:
+        return False
+    name = m.group(1) or m.group(2)
+    if re.match(r"\s*#\s*define\s+{}\b".format(name), lines[1]) is None:
+        return False
+    # the guard has to be closed by the last line, without an `#else`
+    depth = 0
+    for i, line in enumerate(lines):
+        if re.match(r"\s*#\s*if", line):
+            depth += 1
+        elif depth == 1 and re.match(r"\s*#\s*(else|elif)\b", line):
+            return False
+        elif _ENDIF.match(line):
+            depth -= 1
+            if depth == 0:
+                return i == len(lines) - 1
+    return False
+
+
+def include_dirs(flags: list[str] = None, cwd: Union[str, Path] = None,
+                 language: str = "c") -> list[str]:
+    """
+    :return: the `#include` search path of `flags` (`-I`, `-iquote` and
+        `-isystem`), followed by the one of clang
+    """
+    from python_c_cpp_parser.clang import clang_parser
+    ret = []
+    flags = flags or []
+    for i, flag in enumerate(flags):
+        if flag in ("-I", "-iquote", "-isystem") and i + 1 < len(flags):
+            ret.append(flags[i + 1])
+        elif flag.startswith("-I") and flag != "-I":
+            ret.append(flag[2:])
+    ret = [os.path.join(str(cwd or ""), d) for d in ret]
+    t = discover(clang_parser.BINARY)
+    if t is not None:
+        ret += t.cxx_include_dirs if language == "c++" else t.include_dirs
+    return ret
+
+
+def resolve(header: str, directory: Union[str, Path], dirs: list[str]) -> Union[str, None]:
+    """
+    :param header: operand of an `#include`, e.g. `<stdio.h>` or `"util.h"`
+    :param directory: directory of the including file, searched first
+        for quoted includes
+    :param dirs: the search path, see `include_dirs()`
+    :return: the path of the included file or None if it wasn't found
+    """
+    name = header[1:-1]
+    if os.path.isabs(name):
+        return name if os.path.isfile(name) else None
+    for d in ([str(directory)] if header[0] == '"' else []) + list(dirs):
+        path = os.path.join(d, name)
+        if os.path.isfile(path):
+            return os.path.normpath(path)
+    return None
+
+
+def leading_includes(file: Union[str, Path], cwd: Union[str, Path] = None,
+                     dirs: list[str] = None) -> list[str]:
+    """
+    :param dirs: the search path of the headers, defaults to the one of
+        clang (see `include_dirs()`)
+    :return: the `#include`s at the beginning of `file`, before the first
+        other line which isn't a comment or the first header which isn't
+        guarded (see `is_guarded()`) or can't be found, e.g.
+        `['<stdio.h>', '"/abs/util.h"']`. Quoted includes found next to
+        `file` are made absolute, so they resolve the same from within
+        the prelude.
+    """
+    path = os.path.join(str(cwd or ""), str(file))
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        with open(path, errors="replace") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    dirs = dirs if dirs is not None else include_dirs(cwd=cwd, language=language(file))
+
+    ret = []
+    for line in _code(lines):
+        if not line.strip() or _PRAGMA_ONCE.match(line):
+            continue
+        m = _INCLUDE.match(line)
+        if m is None:
+            break
+        header = m.group(1)
+        found = resolve(header, directory, dirs)
+        # an unguarded header is expanded again by the translation unit
+        if found is None or not is_guarded(found):
+            break
+        if header[0] == '"' and os.path.isfile(os.path.join(directory, header[1:-1])):
+            header = '"{}"'.format(os.path.normpath(os.path.join(directory, header[1:-1])))
+        ret.append(header)
+    return ret
+
+
+def common_prelude(files: list[Union[str, Path]], cwd: Union[str, Path] = None,
+                   dirs: list[str] = None) -> list[str]:
+    """
+    :param dirs: the search path of the headers, see `leading_includes()`
+    :return: the longest list of `leading_includes` shared by all `files`
+    """
+    ret = None
+    if dirs is None and files:
+        dirs = include_dirs(cwd=cwd, language=language(files[0]))
+    for file in files:
+        includes = leading_includes(file, cwd, dirs)
+        if ret is None:
+            ret = includes
+            continue
+        n = 0
+        while n < min(len(ret), len(includes)) and ret[n] == includes[n]:
+            n += 1
+        ret = ret[:n]
+        if not ret:
+            break
+    return ret or []
+
+
+def _stat_inputs(files: list[str]):
+    """
+    :return: file -> [mtime, size] or None if a file doesn't exist
+    """
+    inputs = {}
+    for file in files:
+        try:
+            st = os.stat(file)
+        except OSError:
+            return None
+        inputs[file] = [st.st_mtime_ns, st.st_size]
+    return inputs
+
+
+class PrecompiledHeader:
+    """
+    a prelude of headers, compiled once for all translation units with the
+    same flags and working directory
+    """
+
+    def __init__(self, headers: list[str], directory: Union[str, Path] = CACHE_DIR,
+                 flags: list[str] = None, cwd: Union[str, Path] = None,
+                 language: str = "c"):
+        """
+        :param headers: operands of the `#include`s, e.g. `<stdio.h>` or
+            `"util.h"`. Plain paths are included as `"path"`. Only guarded
+            headers (see `is_guarded()`) can be precompiled.
+        :param directory: where the prelude and the PCH are written, created
+            if it doesn't exist
+        :param flags: compiler flags, must be the ones of the translation
+            units, as clang rejects a PCH built with other language options
+        :param cwd: directory clang is executed in
+        :param language: `c` or `c++`
+        """
+        self.headers = [h if h[0] in '<"' else '"{}"'.format(h) for h in headers]
+        self.directory = os.path.abspath(os.path.expanduser(str(directory)))
+        self.flags = list(flags) if flags is not None else []
+        self.cwd = str(cwd) if cwd is not None else None
+        self.language = language
+        self.builds = 0
+
+    def key(self, binary: str = None) -> Union[str, None]:
+        """
+        :return: name of the generated files, or None if clang is not available
+        """
+        # imported here, as clang.py uses this module
+        from python_c_cpp_parser.clang import clang_parser
+        binary = binary if binary is not None else clang_parser.BINARY
+        t = discover(binary)
+        if t is None:
+            return None
+        data = json.dumps([t.binary, t.version, self.headers, self.flags,
+                           self.cwd, self.language])
+        return hashlib.sha256(data.encode()).hexdigest()[:24]
+
+    def get_path(self, suffix: str = ".pch"):
+        """
+        :return: path of the PCH (or of the prelude with `suffix=".h"`)
+        """
+        key = self.key()
+        return os.path.join(self.directory, key + suffix) if key is not None else None
+
+    def is_valid(self):
+        """
+        :return: true if the PCH exists and none of its headers changed
+        """
+        manifest = self.get_path(".json")
+        if manifest is None:
+            return False
+        try:
+            with open(manifest) as f:
+                inputs = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not os.path.isfile(self.get_path()):
+            return False
+        return _stat_inputs(list(inputs)) == inputs
+
+    def build(self):
+        """
+        compiles the prelude, even if a valid PCH exists
+        :return: true on success
+        """
+        from python_c_cpp_parser.clang import clang_parser, parse_depfile
+        if not self.headers or self.key() is None:
+            return False
+        dirs = include_dirs(self.flags, self.cwd, self.language)
+        for header in self.headers:
+            path = resolve(header, self.directory, dirs)
+            if path is None or not is_guarded(path):
+                logging.error("couldn't build the pch: %s is not guarded", header)
+                return False
+        os.makedirs(self.directory, exist_ok=True)
+        prelude, pch = self.get_path(".h"), self.get_path()
+        with open(prelude, "w") as f:
+            f.writelines("#include {}\n".format(h) for h in self.headers)
+
+        # concurrent builds of the same PCH each write their own file, the
+        # last one wins
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".pch.tmp")
+        os.close(fd)
+        depfile = tempfile.NamedTemporaryFile(suffix=".d")
+        cmd = [clang_parser.BINARY, "-x", self.language + "-header"] + self.flags + \
+              ["-Wno-everything", "-MD", "-MF", depfile.name, "-o", tmp, prelude]
+        logging.info(cmd)
+        try:
+            p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE, cwd=self.cwd)
+            _, err = p.communicate()
+        except OSError as e:
+            err, p = str(e).encode(), None
+        if p is None or p.returncode != 0:
+            logging.error("couldn't build the pch: %s %s", " ".join(cmd),
+                          err.decode(errors="replace"))
+            os.unlink(tmp)
+            return False
+
+        deps = [os.path.abspath(os.path.join(self.cwd or "", d))
+                for d in parse_depfile(depfile.read().decode(errors="replace"))]
+        depfile.close()
+        inputs = _stat_inputs(deps)
+        if inputs is None:
+            os.unlink(tmp)
+            return False
+        os.replace(tmp, pch)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".json.tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(inputs, f)
+        os.replace(tmp, self.get_path(".json"))
+        self.builds += 1
+        return True
+
+    def get_flags(self) -> list[str]:
+        """
+        builds the PCH if it doesn't exist or is outdated
+        :return: the flags to use it, or an empty list if it couldn't be
+            built. Then the headers are simply parsed again.
+        """
+        if not self.is_valid() and not self.build():
+            return []
+        return ["-include-pch", self.get_path()]
+
+    def __str__(self):
+        return " ".join(self.headers)
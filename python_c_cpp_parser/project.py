@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+parsing of whole projects described by a `compile_commands.json`, e.g. as
+generated by `cmake -DCMAKE_EXPORT_COMPILE_COMMANDS=ON` or `bear -- make`.
+"""
+from typing import Union
+from pathlib import Path
+import hashlib
+import logging
+import json
+import os
+import shlex
+import tempfile
+
+from python_c_cpp_parser.batch import run_many
+from python_c_cpp_parser.clang import clang_parser
+from python_c_cpp_parser.pch import PrecompiledHeader, CACHE_DIR, common_prelude, include_dirs, language
+
+# flags of the recorded compiler invocation which are not forwarded to clang,
+# as they only control the output. The value is true if the flag takes an
+# argument.
+DROPPED_FLAGS = {
+    "-c": False, "-S": False, "-E": False, "-fsyntax-only": False,
+    "-M": False, "-MM": False, "-MD": False, "-MMD": False, "-MP": False,
+    "-MG": False, "-o": True, "-MF": True, "-MT": True, "-MQ": True,
+}
+
+
+class CompileCommand:
+    """
+    single entry of a `compile_commands.json`
+    """
+
+    def __init__(self, directory: str, file: str, flags: list[str]):
+        """
+        :param directory: working directory of the compiler
+        :param file: absolute path of the translation unit
+        :param flags: compiler flags, without the compiler, the output and
+            the translation unit itself
+        """
+        self.directory = directory
+        self.file = file
+        self.flags = flags
+
+    def signature(self):
+        """
+        :return: hash over everything besides the inputs, that influences
+            the AST of this translation unit
+        """
+        data = json.dumps([clang_parser.BINARY, clang_parser.COMMAND,
+                           self.directory, self.flags])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def __str__(self):
+        return self.file
+
+
+def filter_flags(arguments: list[str], file: str) -> list[str]:
+    """
+    removes the compiler, the output and dependency flags and the translation
+    unit from a recorded compiler invocation.
+        ["gcc", "-Iinc", "-c", "-o", "a.o", "a.c"] -> ["-Iinc"]
+    :param arguments: full command line
+    :param file: the translation unit, as written in the command line
+    """
+    flags = []
+    skip = False
+    for arg in arguments[1:]:
+        if skip:
+            skip = False
+            continue
+        if arg == file:
+            continue
+        if arg in DROPPED_FLAGS:
+            skip = DROPPED_FLAGS[arg]
+            continue
+        # joined form, e.g. `-oa.o` or `-MFa.d`
+        if any(arg.startswith(f) for f, has_arg in DROPPED_FLAGS.items() if has_arg):
+            continue
+        flags.append(arg)
+    return flags
+
+
+def load_compile_commands(path: Union[str, Path]) -> list[CompileCommand]:
+    """
+    :param path: path to a `compile_commands.json`. Relative `directory`
+        entries are relative to the directory of this file.
+    :return: one `CompileCommand` per entry
+    """
+    path = os.path.abspath(path)
+    with open(path) as f:
+        entries = json.load(f)
+
+    units = []
+    for entry in entries:
+        directory = os.path.join(os.path.dirname(path), entry["directory"])
+        directory = os.path.normpath(directory)
+        if "arguments" in entry:
+            arguments = entry["arguments"]
+        else:
+            arguments = shlex.split(entry["command"])
+        file = os.path.normpath(os.path.join(directory, entry["file"]))
+        units.append(CompileCommand(directory, file,
+                                    filter_flags(arguments, entry["file"])))
+    return units
+
+
+def _group(unit: CompileCommand):
+    """
+    :return: key of the units, which can share a `PrecompiledHeader`
+    """
+    return unit.directory, tuple(unit.flags), language(unit.file)
+
+
+def _parse_unit(unit: CompileCommand, pchs: dict = None, **kwargs):
+    """
+    worker of `clang_project.execute`
+    :param pchs: `_group` -> `PrecompiledHeader`
+    """
+    pch = pchs.get(_group(unit)) if pchs is not None else None
+    c = clang_parser(unit.file, flags=unit.flags, cwd=unit.directory,
+                     dependencies=True, pch=pch, **kwargs)
+    return c, c.execute()
+
+
+def _hash_file(file: str):
+    h = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _record_inputs(files: list[str]):
+    """
+    :return: file -> [mtime, size, sha256] or None if a file can't be read
+    """
+    inputs = {}
+    for file in files:
+        try:
+            st = os.stat(file)
+            inputs[file] = [st.st_mtime_ns, st.st_size, _hash_file(file)]
+        except OSError:
+            return None
+    return inputs
+
+
+def _inputs_unchanged(inputs: dict):
+    """
+    :param inputs: see `_record_inputs`
+    :return: true if none of the files changed. The content is only
+        hashed if the modification time or size differs.
+    """
+    for file, (mtime, size, digest) in inputs.items():
+        try:
+            st = os.stat(file)
+        except OSError:
+            return False
+        if st.st_mtime_ns == mtime and st.st_size == size:
+            continue
+        # e.g. touched, but not modified
+        if st.st_size != size or _hash_file(file) != digest:
+            return False
+    return True
+
+
+class clang_project:
+    """
+    parses all translation units of a `compile_commands.json`:
+        p = clang_project("build/compile_commands.json", jobs=8,
+                          state="build/ast_state.json", skip_system=True)
+        for r in p.execute(only_changed=True):
+            if r.ok():
+                print(r.file, r.parser.get_function_decls())
+    """
+
+    def __init__(self, compile_commands: Union[str, Path], jobs: int = None,
+                 state: Union[str, Path] = None, pch: Union[bool, list[str]] = False,
+                 pch_dir: Union[str, Path] = CACHE_DIR, **kwargs):
+        """
+        :param compile_commands: path to the `compile_commands.json`
+        :param jobs: number of processes, defaults to the number of cpus.
+        :param state: path of a json file in which the inputs of all
+            successfully parsed translation units are recorded. Needed for
+            `execute(only_changed=True)`.
+        :param pch: if true, the leading includes shared by all units with
+            the same flags are compiled into a `PrecompiledHeader` (see
+            `pch.py`). A list of headers, e.g. `["<stdio.h>"]`, is used as
+            prelude of all units instead. The declarations of the prelude
+            are missing from the ASTs then.
+        :param pch_dir: directory of the precompiled headers
+        :param kwargs: forwarded to each `clang_parser`
+        """
+        self.__units = load_compile_commands(compile_commands)
+        self.__jobs = jobs
+        self.__pch = pch
+        self.__pch_dir = pch_dir
+        self.__state_file = state
+        self.__kwargs = kwargs
+        self.__state = {}
+        self.__skipped = []
+        if state is not None and os.path.isfile(state):
+            try:
+                with open(state) as f:
+                    self.__state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error("couldn't read state %s: %s", state, e)
+
+    def get_units(self, i: int = None):
+        """
+        :return: the `CompileCommand`s of all translation units, or the
+            `i`th one or None if there are not that many
+        """
+        if i is not None:
+            if i >= len(self.__units):
+                return None
+            return self.__units[i]
+        return self.__units
+
+    def get_skipped(self):
+        """
+        :return: the `CompileCommand`s skipped by the last `execute()`
+        """
+        return self.__skipped
+
+    def is_unchanged(self, unit: CompileCommand):
+        """
+        :return: true if neither the flags, nor the translation unit or any
+            of the files included by it, changed since its last parse.
+        """
+        entry = self.__state.get(unit.file)
+        if entry is None or entry["signature"] != unit.signature():
+            return False
+        return _inputs_unchanged(entry["inputs"])
+
+    def __record(self, unit: CompileCommand, dependencies: list[str]):
+        inputs = _record_inputs([unit.file] + (dependencies or []))
+        if inputs is None:
+            # no entry: the unit is considered as changed on the next run
+            self.__state.pop(unit.file, None)
+            return
+        self.__state[unit.file] = {"signature": unit.signature(), "inputs": inputs}
+
+    def __save_state(self):
+        directory = os.path.dirname(os.path.abspath(self.__state_file))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.__state, f)
+        os.replace(tmp, self.__state_file)
+
+    def get_pchs(self, units: list[CompileCommand] = None):
+        """
+        builds the precompiled headers of `units`, if requested by `pch`
+        :return: `_group` -> `PrecompiledHeader`, only of groups whose
+            precompiled header could be built
+        """
+        if not self.__pch:
+            return {}
+        groups = {}
+        for unit in units if units is not None else self.__units:
+            groups.setdefault(_group(unit), []).append(unit)
+
+        ret = {}
+        for key, group in groups.items():
+            if self.__pch is True:
+                # nothing is shared by a single unit
+                if len(group) < 2:
+                    continue
+                headers = common_prelude([u.file for u in group], key[0],
+                                         include_dirs(list(key[1]), key[0], key[2]))
+            else:
+                headers = self.__pch
+            if not headers:
+                continue
+            pch = PrecompiledHeader(headers, self.__pch_dir, list(key[1]), key[0], key[2])
+            if pch.get_flags():
+                ret[key] = pch
+        return ret
+
+    def execute(self, only_changed: bool = False):
+        """
+        parses all translation units concurrently.
+        :param only_changed: skip the units for which `is_unchanged` is true.
+            These are listed in `get_skipped()`.
+        :return: iterator over `ParseResult`s in completion order. Their
+            `file` is the `CompileCommand` of the translation unit.
+        """
+        self.__skipped = []
+        units = []
+        for unit in self.__units:
+            if only_changed and self.is_unchanged(unit):
+                self.__skipped.append(unit)
+            else:
+                units.append(unit)
+
+        try:
+            kwargs = dict(self.__kwargs, pchs=self.get_pchs(units))
+            for r in run_many(_parse_unit, units, self.__jobs, kwargs):
+                if r.ok():
+                    self.__record(r.file, r.parser.get_dependencies())
+                else:
+                    self.__state.pop(r.file.file, None)
+                yield r
+        finally:
+            if self.__state_file is not None:
+                self.__save_state()
@@ -1,3 +1,41 @@
+#!/usr/bin/env python3
+"""
+backend based on pycparser (`pip install pycparser`), which only extracts the
+functions and their arguments of a piece of c code.
+"""
+import os
+
+# the package `pycparser`, not this module
+try:
+    from pycparser import c_ast, parse_file
+except ImportError:
+    c_ast = parse_file = None
+
+DEBUG = False
+
+
+def available() -> bool:
+    """
+    :return: true if pycparser is installed
+    """
+    return c_ast is not None
+
+
+class pycparser_parser:
+    """
+    parser build around `pycparser.parse_file(file, use_cpp=True)`
+    """
+
+    def __init__(self, c_code: str, target: str = ""):
+        """
+        :param c_code: the c code to parse
+        :param target: name of the function, whose arguments are extracted.
+            Can be empty if `c_code` contains a single function.
+        """
+        self.c_code = c_code
+        self.target = target
+        self.arg_num_in = 0
+        self.arg_num_out = 0
 
     def parse(self):
         """
@@ -6,7 +44,11 @@
 
         :return 0 on success
                 1 on any error
+        :raises ImportError: if pycparser is not installed
         """
+        if not available():
+            raise ImportError("pycparser is not installed, see `pip install pycparser`")
+
         # A simple visitor for FuncDef nodes that prints the names and
         # locations of function definitions.
         class FuncDefVisitor(c_ast.NodeVisitor):
@@ -22,14 +64,18 @@
                     }
 
         # TODO this looks wrong
-        f = tempfile.NamedTemporaryFile(delete=False)
+        import tempfile
+        f = tempfile.NamedTemporaryFile(suffix=".c", delete=False)
         name = f.name
         f.write(self.c_code.encode())
         f.flush()
         f.close()
 
         funcs = {}
-        ast = parse_file(name, use_cpp=True)
+        try:
+            ast = parse_file(name, use_cpp=True)
+        finally:
+            os.unlink(name)
         v = FuncDefVisitor()
         v.visit(ast)
         
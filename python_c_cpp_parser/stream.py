@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+incremental json parsing. Instead of loading a whole document into memory
+via `json.loads` the functions in this file emit a flat stream of events of
+the form (ijson `basic_parse` compatible):
+    ("start_map", None), ("map_key", "kind"), ("string", "ForStmt"), ...
+    ("end_map", None), ("start_array", None), ("end_array", None),
+    ("number", 1), ("boolean", True), ("null", None)
+
+If `ijson` is installed its (C accelerated) parser is used, otherwise a pure
+python tokenizer is used.
+"""
+import codecs
+import json
+import re
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# size of the chunks read from the underlying stream
+CHUNK_SIZE = 1 << 16
+
+_TOKEN = re.compile(r'[\s,:]*(?:([{}\[\]])|"([^"\\]*(?:\\.[^"\\]*)*)"|'
+                    r'(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)|(true|false|null))')
+_WHITESPACE = re.compile(r'[\s,:]*')
+_DELIMITERS = frozenset(" \t\r\n,:]}")
+_LITERALS = {"true": ("boolean", True),
+             "false": ("boolean", False),
+             "null": ("null", None)}
+
+
+def _tokenize(fp, chunk_size: int = CHUNK_SIZE):
+    """
+    pure python fallback of `basic_parse`. Multiple concatenated top level
+    values (as emitted by clang with `-ast-dump-filter`) are supported.
+    :param fp: binary (or text) file like object
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+    # stack of open containers: True = map, False = array
+    maps = []
+    expect_key = False
+    while True:
+        if not eof:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                eof = True
+                buf = buf[pos:] + decoder.decode(b"", final=True)
+            else:
+                if type(chunk) is bytes:
+                    chunk = decoder.decode(chunk)
+                buf = buf[pos:] + chunk
+            pos = 0
+
+        while True:
+            m = _TOKEN.match(buf, pos)
+            # a token touching the end of the buffer may be incomplete
+            if m is None or (m.end() == len(buf) and not eof):
+                break
+
+            bracket, string, number, literal = m.groups()
+            # a number like `-2.5` may continue with `e1` in the next chunk
+            if (number is not None or literal is not None) and not eof and \
+                    buf[m.end()] not in _DELIMITERS:
+                break
+
+            pos = m.end()
+            if bracket is not None:
+                if bracket == "{":
+                    maps.append(True)
+                    expect_key = True
+                    yield "start_map", None
+                elif bracket == "[":
+                    maps.append(False)
+                    expect_key = False
+                    yield "start_array", None
+                else:
+                    if not maps or maps[-1] != (bracket == "}"):
+                        raise ValueError("unbalanced {} at: {}".format(bracket, buf[pos - 1:pos + 31]))
+                    maps.pop()
+                    yield ("end_map" if bracket == "}" else "end_array"), None
+                    expect_key = len(maps) > 0 and maps[-1]
+                continue
+
+            if string is not None:
+                if "\\" in string:
+                    string = json.loads('"' + string + '"')
+                if expect_key:
+                    expect_key = False
+                    yield "map_key", string
+                    continue
+                yield "string", string
+            elif number is not None:
+                if "." in number or "e" in number or "E" in number:
+                    yield "number", float(number)
+                else:
+                    yield "number", int(number)
+            else:
+                yield _LITERALS[literal]
+
+            # the value of a key: value pair was read, so the next string
+            # within a map is a key again
+            expect_key = len(maps) > 0 and maps[-1]
+
+        if eof:
+            rest = _WHITESPACE.match(buf, pos).end()
+            if rest != len(buf):
+                raise ValueError("invalid json at: " + buf[rest:rest + 32])
+            if maps:
+                raise ValueError("invalid json: unexpected end of the input")
+            return
+
+
+def basic_parse(fp):
+    """
+    returns an iterator over the json events of all (concatenated) top level
+    values within `fp`.
+    :param fp: binary file like object, e.g. `Popen(...).stdout`
+    """
+    if ijson is not None:
+        return ijson.basic_parse(fp, multiple_values=True)
+    return _tokenize(fp)
+
+
+def events(value):
+    """
+    emits the events of an already loaded json value, e.g. to build a
+    `CompactTree` from objects which were not read from a stream.
+    """
+    # tuples on the stack are pending events, e.g. the end of a container
+    stack = [value]
+    while stack:
+        v = stack.pop()
+        t = type(v)
+        if t is dict:
+            yield "start_map", None
+            stack.append(("end_map", None))
+            for k, item in reversed(list(v.items())):
+                stack.append(item)
+                stack.append(("map_key", k))
+        elif t is list:
+            yield "start_array", None
+            stack.append(("end_array", None))
+            stack.extend(reversed(v))
+        elif t is tuple:
+            yield v
+        elif t is str:
+            yield "string", v
+        elif t is bool:
+            yield "boolean", v
+        elif v is None:
+            yield "null", None
+        else:
+            yield "number", v
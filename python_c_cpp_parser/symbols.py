@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+persistent index of the declarations of a whole project in a SQLite
+database, to answer "where is `foo` defined" without parsing anything:
+    index = SymbolIndex("build/symbols.db", "build/compile_commands.json")
+    index.update(jobs=8)  # only parses units whose inputs changed
+    for s in index.find("foo", kind="FunctionDecl", has_body=True):
+        print(s)
+
+Each declaration is stored once, identified by its file, line and USR,
+and linked to all translation units in which it was found, e.g. the
+declarations of a shared header. It is removed with the last of them.
+"""
+from typing import Union
+from pathlib import Path
+import json
+import logging
+import os
+import sqlite3
+
+from python_c_cpp_parser.batch import run_many, ParseResult
+from python_c_cpp_parser.clang import clang_parser, _walk_locations, _expansion
+from python_c_cpp_parser.project import load_compile_commands, CompileCommand, \
+    _record_inputs, _inputs_unchanged
+
+# increased on each change of the tables, older databases are recreated
+SCHEMA_VERSION = 2
+
+# kinds of the recorded declarations
+KINDS = ("FunctionDecl", "VarDecl", "RecordDecl", "CXXRecordDecl", "TypedefDecl")
+# declarations whose children are searched as well
+CONTAINERS = ("TranslationUnitDecl", "LinkageSpecDecl", "NamespaceDecl")
+
+SCHEMA = """
+CREATE TABLE units (
+    id INTEGER PRIMARY KEY,
+    file TEXT UNIQUE NOT NULL,
+    signature TEXT NOT NULL,
+    inputs TEXT NOT NULL
+);
+CREATE TABLE symbols (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file TEXT NOT NULL,
+    line INTEGER,
+    col INTEGER,
+    offset INTEGER,
+    type TEXT,
+    has_body INTEGER NOT NULL,
+    usr TEXT NOT NULL,
+    UNIQUE (file, line, usr)
+);
+CREATE TABLE unit_symbols (
+    unit INTEGER NOT NULL REFERENCES units(id) ON DELETE CASCADE,
+    symbol INTEGER NOT NULL REFERENCES symbols(id),
+    PRIMARY KEY (unit, symbol)
+) WITHOUT ROWID;
+CREATE INDEX symbols_name ON symbols(name, kind);
+CREATE INDEX symbols_file ON symbols(file);
+CREATE INDEX unit_symbols_symbol ON unit_symbols(symbol);
+"""
+
+COLUMNS = "name, kind, file, line, col, offset, type, has_body, usr"
+
+
+class Symbol:
+    """
+    single declaration of the index
+    """
+
+    def __init__(self, name: str, kind: str, file: str, line: int, col: int,
+                 offset: int, type: str, has_body: bool, usr: str = None):
+        """
+        :param file: absolute path of the file containing the declaration
+        :param type: e.g. `int (int, char **)` for functions
+        :param has_body: true for definitions: functions with a body,
+            complete records and variables which are not `extern`
+        :param usr: identifies the entity across translation units, see `_usr`
+        """
+        self.name = name
+        self.kind = kind
+        self.file = file
+        self.line = line
+        self.col = col
+        self.offset = offset
+        self.type = type
+        self.has_body = bool(has_body)
+        self.usr = usr
+
+    def __str__(self):
+        return "{}:{}:{}: {} {} '{}'".format(self.file, self.line, self.col,
+                                             self.kind, self.name, self.type)
+
+
+def _has_body(node):
+    if node.kind == "FunctionDecl":
+        return any(n.kind == "CompoundStmt" for n in node.inner or [])
+    if node.kind in ("RecordDecl", "CXXRecordDecl"):
+        return bool(node.__dict__.get("completeDefinition"))
+    if node.kind == "VarDecl":
+        return node.__dict__.get("storageClass") != "extern"
+    return True
+
+
+def _usr(node):
+    """
+    the json output of clang has no USR (unified symbol resolution), hence
+    the mangled name is used if there is one, else the kind and name
+    """
+    return node.__dict__.get("mangledName") or "{}:{}".format(node.kind, node.name)
+
+
+def extract_symbols(root, cwd: str = None):
+    """
+    :param root: `TranslationUnitDecl` of a `clang_parser`
+    :param cwd: working directory of clang, relative files are relative to it
+    :return: list of tuples in the order of `COLUMNS`
+    """
+    # the files and lines are only written if they change, hence the
+    # whole tree is walked once in dump order to resolve them
+    resolved = {}
+
+    def visit(loc, file, line):
+        resolved[id(loc)] = (file, line)
+
+    _walk_locations(root, [None, None], visit)
+
+    rows = []
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        if n.kind in CONTAINERS:
+            stack.extend(reversed(n.inner or []))
+            continue
+        if n.kind not in KINDS or not n.__dict__.get("name") or n.__dict__.get("isImplicit"):
+            continue
+        loc = _expansion(n.__dict__.get("loc"))
+        file, line = resolved.get(id(loc), (None, None))
+        if file is None:
+            # compiler builtins
+            continue
+        rows.append((n.name, n.kind, os.path.normpath(os.path.join(cwd or "", file)),
+                     line, loc.get("col"), loc.get("offset"), n.get_type(),
+                     int(_has_body(n)), _usr(n)))
+    return rows
+
+
+def _index_unit(unit: CompileCommand, **kwargs):
+    """
+    worker of `SymbolIndex.update`. Only the symbols are sent back, not the
+    tree.
+    :return: `ParseResult` whose `value` is the tuple `(dependencies, symbols)`
+    """
+    c = clang_parser(unit.file, flags=unit.flags, cwd=unit.directory,
+                     dependencies=True, **kwargs)
+    root = c.execute()
+    if root is None:
+        return ParseResult(unit, error="couldn't parse")
+    return ParseResult(unit, value=(c.get_dependencies(), extract_symbols(root, unit.directory)))
+
+
+class SymbolIndex:
+    """
+    SQLite backed index over the declarations of all translation units of a
+    `compile_commands.json`.
+    """
+
+    def __init__(self, database: Union[str, Path], compile_commands: Union[str, Path] = None,
+                 **kwargs):
+        """
+        :param database: path of the database, created if it doesn't exist
+        :param compile_commands: needed for `update()`
+        :param kwargs: forwarded to each `clang_parser`, e.g. `skip_system`.
+            `compact` is not supported.
+        """
+        self.__compile_commands = compile_commands
+        self.__kwargs = kwargs
+        self.__db = sqlite3.connect(str(database))
+        self.__db.execute("PRAGMA foreign_keys = ON")
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        version = self.__db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with self.__db:
+                self.__db.execute("DROP TABLE IF EXISTS unit_symbols")
+                self.__db.execute("DROP TABLE IF EXISTS symbols")
+                self.__db.execute("DROP TABLE IF EXISTS units")
+                self.__db.executescript(SCHEMA)
+                self.__db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def close(self):
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_unchanged(self, unit: CompileCommand):
+        """
+        :return: true if neither the flags, nor the translation unit or any
+            of the files included by it, changed since it was indexed.
+        """
+        row = self.__db.execute("SELECT signature, inputs FROM units WHERE file = ?",
+                                (unit.file,)).fetchone()
+        if row is None or row[0] != unit.signature():
+            return False
+        return _inputs_unchanged(json.loads(row[1]))
+
+    def update(self, jobs: int = None):
+        """
+        parses all translation units which changed since the last update and
+        replaces their symbols. Units which are no longer part of the
+        `compile_commands.json` are removed.
+        :param jobs: number of processes, defaults to the number of cpus.
+        :return: the `ParseResult`s of the units which couldn't be parsed
+        """
+        units = load_compile_commands(self.__compile_commands)
+        files = {u.file for u in units}
+        with self.__db:
+            for (file,) in self.__db.execute("SELECT file FROM units").fetchall():
+                if file not in files:
+                    self.__remove(file)
+
+        changed = [u for u in units if not self.is_unchanged(u)]
+        errors = []
+        for r in run_many(_index_unit, changed, jobs, self.__kwargs):
+            if not r.ok():
+                logging.error("couldn't index %s", r)
+                errors.append(r)
+                with self.__db:
+                    self.__remove(r.file.file)
+                continue
+            self.__store(r.file, *r.value)
+        return errors
+
+    def __remove(self, file: str):
+        """
+        removes the unit `file` and the symbols only found within it
+        """
+        self.__db.execute("DELETE FROM units WHERE file = ?", (file,))
+        self.__db.execute("DELETE FROM symbols WHERE id NOT IN (SELECT symbol FROM unit_symbols)")
+
+    def __store(self, unit: CompileCommand, dependencies: list[str], rows: list[tuple]):
+        inputs = _record_inputs([unit.file] + (dependencies or []))
+        with self.__db:
+            self.__remove(unit.file)
+            if inputs is None:
+                # indexed again on the next update
+                return
+            cur = self.__db.execute("INSERT INTO units (file, signature, inputs) VALUES (?, ?, ?)",
+                                    (unit.file, unit.signature(), json.dumps(inputs)))
+            # symbols of shared headers are already stored by other units
+            self.__db.executemany("INSERT OR IGNORE INTO symbols (" + COLUMNS + ") "
+                                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.__db.executemany("INSERT OR IGNORE INTO unit_symbols (unit, symbol) "
+                                  "SELECT ?, id FROM symbols WHERE file = ? AND line IS ? AND usr = ?",
+                                  [(cur.lastrowid, row[2], row[3], row[8]) for row in rows])
+
+    def __query(self, where: str, args: tuple):
+        rows = self.__db.execute("SELECT " + COLUMNS + " FROM symbols WHERE " + where +
+                                 " ORDER BY file, offset", args)
+        return [Symbol(*row) for row in rows]
+
+    def find(self, name: str, kind: str = None, has_body: bool = None):
+        """
+        :param kind: e.g. `FunctionDecl`, see `KINDS`
+        :param has_body: if given, only definitions (or only declarations)
+        :return: all declarations of `name`
+        """
+        where, args = "name = ?", (name,)
+        if kind is not None:
+            where, args = where + " AND kind = ?", args + (kind,)
+        if has_body is not None:
+            where, args = where + " AND has_body = ?", args + (int(has_body),)
+        return self.__query(where, args)
+
+    def find_definition(self, name: str, kind: str = "FunctionDecl"):
+        """
+        :return: the first definition of `name` or None
+        """
+        ret = self.find(name, kind, has_body=True)
+        return ret[0] if ret else None
+
+    def find_prefix(self, prefix: str, kind: str = None):
+        """
+        :return: all declarations whose name starts with `prefix`
+        """
+        # a range instead of `LIKE`, so the index on `name` is used
+        where, args = "name >= ? AND name < ?", (prefix, prefix + "\U0010ffff")
+        if kind is not None:
+            where, args = where + " AND kind = ?", args + (kind,)
+        return self.__query(where, args)
+
+    def get_symbols(self, file: Union[str, Path]):
+        """
+        :return: all declarations located in `file`
+        """
+        return self.__query("file = ?", (os.path.abspath(file),))
+
+    def get_units(self):
+        """
+        :return: the indexed translation units
+        """
+        return [f for (f,) in self.__db.execute("SELECT file FROM units ORDER BY file")]
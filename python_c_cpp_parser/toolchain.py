@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+discovery of the compilers used by the backends. Probing a compiler needs
+a few processes (`--version`, the resource directory and the include
+search path), hence the results are cached for the lifetime of the process
+and on disk, keyed by the path, modification time and size of the binary.
+"""
+from subprocess import Popen, PIPE, DEVNULL
+from typing import Union
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+# on disk cache of all probed compilers
+CACHE_FILE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                          "python_c_cpp_parser", "toolchains.json")
+
+# binary, as passed to `discover` -> `Toolchain` or None
+_toolchains = {}
+
+
+class Toolchain:
+    """
+    properties of a single compiler binary
+    """
+
+    def __init__(self, binary: str, version: str, resource_dir: str = None,
+                 include_dirs: list[str] = None, cxx_include_dirs: list[str] = None):
+        """
+        :param binary: absolute path of the compiler
+        :param version: first line of `--version`
+        :param resource_dir: directory of the builtin headers of the compiler,
+            e.g. `/usr/lib/clang/18`
+        :param include_dirs: the `#include <...>` search path for c
+        :param cxx_include_dirs: the `#include <...>` search path for c++
+        """
+        self.binary = binary
+        self.version = version
+        self.resource_dir = resource_dir
+        self.include_dirs = include_dirs if include_dirs is not None else []
+        self.cxx_include_dirs = cxx_include_dirs if cxx_include_dirs is not None else []
+
+    def is_clang(self):
+        return "clang" in self.version
+
+    def __str__(self):
+        return "{}: {}".format(self.binary, self.version)
+
+
+def _run(cmd: list[str]):
+    """
+    :return: tuple `(stdout, stderr)` or None if `cmd` failed
+    """
+    try:
+        p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=PIPE)
+        out, err = p.communicate()
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    return out.decode(errors="replace"), err.decode(errors="replace")
+
+
+def _include_dirs(binary: str, language: str):
+    """
+    :return: the system include directories, as printed by `-v`
+    """
+    ret = _run([binary, "-E", "-x", language, "-", "-v"])
+    if ret is None:
+        return []
+    dirs = []
+    inside = False
+    for line in ret[1].splitlines():
+        if line.startswith("#include <...> search starts here:"):
+            inside = True
+        elif line.startswith("End of search list."):
+            break
+        elif inside:
+            line = line.strip()
+            # macOS
+            if line.endswith(" (framework directory)"):
+                line = line[:-len(" (framework directory)")]
+            dirs.append(os.path.normpath(line))
+    return dirs
+
+
+def probe(binary: str) -> Union[Toolchain, None]:
+    """
+    runs `binary` to find its version and paths, without any caching
+    :param binary: absolute path of the compiler
+    """
+    ret = _run([binary, "--version"])
+    if ret is None or not ret[0].strip():
+        return None
+    version = ret[0].split("\n")[0].strip()
+
+    resource_dir = None
+    if "clang" in version:
+        ret = _run([binary, "-print-resource-dir"])
+        if ret is not None and ret[0].strip():
+            resource_dir = ret[0].strip()
+    else:
+        # gcc prints the input if it doesn't know the file
+        ret = _run([binary, "-print-file-name=include"])
+        if ret is not None and os.path.isabs(ret[0].strip()):
+            resource_dir = os.path.dirname(ret[0].strip())
+    return Toolchain(binary, version, resource_dir, _include_dirs(binary, "c"),
+                     _include_dirs(binary, "c++"))
+
+
+def _key(path: str):
+    st = os.stat(path)
+    return "{}:{}:{}".format(path, st.st_mtime_ns, st.st_size)
+
+
+def _load(cache_file: str):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.error("couldn't read %s: %s", cache_file, e)
+        return {}
+
+
+def _store(cache_file: str, key: str, toolchain: Toolchain):
+    try:
+        directory = os.path.dirname(cache_file)
+        os.makedirs(directory, exist_ok=True)
+        # entries of other binaries, possibly written by other processes
+        entries = _load(cache_file)
+        path = toolchain.binary + ":"
+        entries = {k: v for k, v in entries.items() if not k.startswith(path)}
+        entries[key] = toolchain.__dict__
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logging.error("couldn't write %s: %s", cache_file, e)
+
+
+def discover(binary: str, cache_file: str = CACHE_FILE) -> Union[Toolchain, None]:
+    """
+    :param binary: name or path of the compiler, e.g. `clang`
+    :param cache_file: on disk cache, None to always probe a new process
+    :return: the `Toolchain` of `binary` or None if it can't be executed.
+        The result is cached for the lifetime of the process.
+    """
+    if binary in _toolchains:
+        return _toolchains[binary]
+
+    path = shutil.which(binary)
+    ret = None
+    if path is not None:
+        # not resolved, as it may be a symlink to a wrapper like `ccache`
+        path = os.path.abspath(path)
+        key = _key(path)
+        entry = _load(cache_file).get(key) if cache_file is not None else None
+        if entry is not None:
+            ret = Toolchain(**entry)
+        else:
+            ret = probe(path)
+            if ret is not None and cache_file is not None:
+                _store(cache_file, key, ret)
+    _toolchains[binary] = ret
+    return ret
+
+
+def clear():
+    """
+    forgets the compilers found within this process, e.g. after changing
+    `PATH`. The on disk cache is not modified.
+    """
+    _toolchains.clear()
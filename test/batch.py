@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+import os
+
+from python_c_cpp_parser.batch import *
+
+
+def _worker(file: str, log: str):
+    with open(log, "a") as f:
+        f.write(file + "\n")
+    if file == "crash":
+        os._exit(1)
+    return None, file
+
+
+def test_run_many_crash(tmp_path):
+    log = str(tmp_path / "log")
+    files = ["a", "crash", "b", "c", "d", "e"]
+    results = {r.file: r for r in run_many(_worker, files, jobs=2, kwargs={"log": log})}
+    assert sorted(results) == sorted(files)
+    assert results["crash"].error == "worker process died"
+    assert all(results[f].ok() and results[f].root == f for f in files if f != "crash")
+    # alone until `MAX_CRASHES`, before possibly once with other files in flight
+    with open(log) as f:
+        assert f.read().split().count("crash") in (MAX_CRASHES, MAX_CRASHES + 1)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+compares reopening a saved `CompactTree` via `mmap` (`CompactTree.load`)
+with unpickling it and with loading the json output of clang.
+usage (from within the `test` directory):
+    python bench_binary.py [number of nodes]
+"""
+import itertools
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from python_c_cpp_parser.compact import CompactTree
+from python_c_cpp_parser.stream import events
+
+_ids = itertools.count(1)
+
+
+def function(i: int):
+    """
+    json object of a function with 32 nodes
+    """
+    def loc(line):
+        return {"offset": line * 20, "line": line, "col": 5, "tokLen": 3}
+
+    stmts = []
+    for j in range(6):
+        var = {"id": hex(next(_ids)), "kind": "VarDecl", "loc": loc(i * 8 + j), "name": "x%d" % j,
+               "type": {"qualType": "int"}, "inner": [
+                   {"id": hex(next(_ids)), "kind": "IntegerLiteral", "value": str(j),
+                    "type": {"qualType": "int"}}]}
+        ref = {"id": hex(next(_ids)), "kind": "DeclRefExpr", "type": {"qualType": "int"},
+               "referencedDecl": {"id": var["id"], "kind": "VarDecl", "name": var["name"]}}
+        stmts.append({"id": hex(next(_ids)), "kind": "DeclStmt", "inner": [var]})
+        stmts.append({"id": hex(next(_ids)), "kind": "ImplicitCastExpr", "castKind": "LValueToRValue",
+                      "inner": [ref]})
+    return {"id": hex(next(_ids)), "kind": "FunctionDecl", "loc": dict(loc(i * 8), file="big.c"),
+            "name": "f%d" % i, "type": {"qualType": "void ()"}, "inner": [
+                {"id": hex(next(_ids)), "kind": "CompoundStmt", "inner": stmts}]}
+
+
+def timed(f):
+    start = time.perf_counter()
+    ret = f()
+    return ret, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    data = {"id": hex(next(_ids)), "kind": "TranslationUnitDecl",
+            "inner": [function(i) for i in range(nodes // 32)]}
+    tree, t = timed(lambda: CompactTree.from_events(events(data)))
+    print("nodes: {} build: {:.2f}s".format(len(tree), t))
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "big.ast")
+        _, t = timed(lambda: tree.save(path))
+        print("save binary: {:.3f}s {:.1f}MB".format(t, os.path.getsize(path) / 1e6))
+        with open(os.path.join(d, "big.pickle"), "wb") as f:
+            pickle.dump(tree, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(d, "big.json"), "w") as f:
+            json.dump(data, f)
+        del data
+
+        def load_binary():
+            t = CompactTree.load(path)
+            # first query: the kind of the root
+            return t.roots()[0].kind
+
+        def load_pickle():
+            with open(os.path.join(d, "big.pickle"), "rb") as f:
+                return pickle.load(f).roots()[0].kind
+
+        def load_json():
+            with open(os.path.join(d, "big.json")) as f:
+                return json.load(f)["kind"]
+
+        for name, f in [("binary (mmap)", load_binary), ("pickle", load_pickle), ("json", load_json)]:
+            kind, t = timed(f)
+            print("open {:<14} {:>9.2f}ms {:>8.1f}MB ({})".format(
+                name, t * 1e3, os.path.getsize(
+                    {"binary (mmap)": path, "pickle": os.path.join(d, "big.pickle"),
+                     "json": os.path.join(d, "big.json")}[name]) / 1e6, kind))
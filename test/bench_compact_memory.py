@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+compares the memory needed to keep the AST of a file as tree of `Node`s and
+as `CompactTree`. The `CompactTree` is built from the json events of the
+stream, which bounds the peak memory. Without `ijson` these come from the
+pure python tokenizer of `stream.py`, which takes most of the time, hence
+the time of building the tree from already tokenized events is shown, too.
+usage (from within the `test` directory):
+    python bench_compact_memory.py [file.c]
+"""
+from subprocess import Popen, PIPE, DEVNULL
+import gc
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from python_c_cpp_parser.clang import clang_parser, Node
+from python_c_cpp_parser.compact import CompactTree
+from python_c_cpp_parser.stream import basic_parse, ijson
+
+
+def dump(file: str):
+    """
+    :return: the json output of clang for `file`
+    """
+    cmd = [clang_parser.BINARY] + clang_parser.COMMAND + [file]
+    p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL)
+    data = p.stdout.read()
+    p.wait()
+    return data
+
+
+def measure(f):
+    """
+    :return: (result, retained bytes, peak bytes, seconds) of `f()`
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    ret = f()
+    t = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ret, current, peak, t
+
+
+def count_nodes(node):
+    ret = 1
+    for n in node.inner or []:
+        ret += count_nodes(n)
+    return ret
+
+
+if __name__ == "__main__":
+    file = sys.argv[1] if len(sys.argv) > 1 else "c/headers/stdio.c"
+    data = dump(file)
+    print("json: {} bytes".format(len(data)))
+
+    root, current, peak, t = measure(lambda: Node(**json.loads(data)))
+    nodes = count_nodes(root)
+    print("Node:        {:>7} nodes retained: {:>11} B ({:>6.1f} B/node) peak: {:>11} B time: {:.3f}s"
+          .format(nodes, current, current / nodes, peak, t))
+    del root
+
+    tree, current, peak, t = measure(lambda: CompactTree.from_events(basic_parse(io.BytesIO(data))))
+    nodes = len(tree)
+    print("CompactTree: {:>7} nodes retained: {:>11} B ({:>6.1f} B/node) peak: {:>11} B time: {:.3f}s"
+          .format(nodes, current, current / nodes, peak, t))
+
+    events = list(basic_parse(io.BytesIO(data)))
+    start = time.perf_counter()
+    CompactTree.from_events(iter(events))
+    t = time.perf_counter() - start
+    print("CompactTree build only (tokenizer: {}): {:.3f}s".format(
+        "ijson" if ijson is not None else "python", t))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+compares the latency per (small) file of the `clang` engine, which runs
+clang and parses its json output, with the in-process `libclang` engine.
+usage (from within the `test` directory):
+    python bench_engines.py [repetitions] [file.c ...]
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+from python_c_cpp_parser.clang import clang_parser
+from python_c_cpp_parser import libclang
+
+
+def latency(file: str, engine: str, repetitions: int):
+    """
+    :return: list of seconds per `execute()`
+    """
+    ret = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        c = clang_parser(file, engine=engine)
+        if c.execute() is None:
+            return None
+        ret.append(time.perf_counter() - start)
+    return ret
+
+
+if __name__ == "__main__":
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # the sources of a project (e.g. `c/project`) need the flags of their
+    # `compile_commands.json`, e.g. `-Iinclude`
+    files = sys.argv[2:] or sorted(f for f in glob.glob("c/*/*.c") if not os.path.isfile(
+        os.path.join(os.path.dirname(f), "compile_commands.json")))
+    engines = ["clang"] + (["libclang"] if libclang.available() else [])
+    if not libclang.available():
+        print("libclang is not available, install it via `pip install libclang`")
+
+    print("{:<32} {:>10} {:>10} {:>10}".format("file", "engine", "median", "p90"))
+    for file in files:
+        for engine in engines:
+            t = latency(file, engine, repetitions)
+            if t is None:
+                print("{:<32} {:>10} {:>10}".format(file, engine, "failed"))
+                continue
+            t.sort()
+            print("{:<32} {:>10} {:>9.2f}ms {:>9.2f}ms".format(
+                file, engine, statistics.median(t) * 1e3, t[int(len(t) * 0.9) - 1] * 1e3))
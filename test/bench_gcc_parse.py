@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+throughput of parsing a large `-fdump-tree-original-raw` dump of gcc, from
+a file and straight from the pipe while gcc is still running, of a single
+selected function section and of all sections in several processes.
+usage (from within the `test` directory):
+    python bench_gcc_parse.py [number of functions]
+"""
+import os
+import sys
+import tempfile
+import time
+from subprocess import run
+
+from python_c_cpp_parser.gcc import gcc_parser
+
+
+def source(functions: int):
+    ret = ['const char *names[] = {"first name", "second  name"};\n']
+    for i in range(functions):
+        ret.append("int f%d(int n) {\n"
+                   "    int sum = 0;\n"
+                   "    for (int i = 0; i < n; i++) {\n"
+                   "        sum += i * %d;\n"
+                   "    }\n"
+                   "    return sum;\n"
+                   "}\n" % (i, i))
+    return "".join(ret)
+
+
+def timed(f):
+    start = time.perf_counter()
+    ret = f()
+    return ret, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as d:
+        file = os.path.join(d, "big.c")
+        with open(file, "w") as f:
+            f.write(source(functions))
+        dump = os.path.join(d, "big.dump")
+        run(["gcc", "-fsyntax-only", "-fdump-tree-original-raw=" + dump, file], check=True)
+        size = os.path.getsize(dump)
+        with open(dump, "rb") as f:
+            lines = sum(1 for _ in f)
+
+        def parse_file():
+            with open(dump, "rb") as f:
+                return sum(1 for _ in gcc_parser.iter_nodes(f))
+
+        nodes, t = timed(parse_file)
+        print("dump: {:.1f}MB {} lines {} nodes".format(size / 1e6, lines, nodes))
+        print("parse file: {:.3f}s {:.0f} lines/s {:.1f}MB/s".format(t, lines / t, size / 1e6 / t))
+
+        _, t = timed(lambda: gcc_parser(file, stream=True).execute())
+        print("gcc + parse pipe: {:.3f}s".format(t))
+        _, t = timed(lambda: gcc_parser(file).execute())
+        print("gcc + parse file: {:.3f}s".format(t))
+        _, t = timed(lambda: gcc_parser(file, functions=["f%d" % (functions // 2)]).execute())
+        print("gcc + parse one function: {:.3f}s".format(t))
+        for jobs in [1, os.cpu_count() or 1]:
+            _, t = timed(lambda: gcc_parser(file, graph=True, jobs=jobs).execute())
+            print("gcc + graphs of all sections, {} processes: {:.3f}s".format(jobs, t))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+compares the memory retained by the `Node` tree of a header heavy
+translation unit with and without interning the repeated strings (see
+`ParseContext.intern`).
+usage (from within the `test` directory):
+    python bench_interning.py [file.c] [compiler flags ...]
+The json output is taken from clang, or from libclang if clang isn't
+available.
+"""
+from subprocess import Popen, PIPE, DEVNULL
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from python_c_cpp_parser.clang import clang_parser, clang_version, Node, ParseContext
+from python_c_cpp_parser import libclang
+
+
+def dump(file: str, flags: list[str]):
+    """
+    :return: the json output of clang for `file`
+    """
+    if clang_version() is None and libclang.available():
+        roots, _ = libclang.translate(file, flags)
+        return json.dumps(roots[0])
+    cmd = [clang_parser.BINARY] + clang_parser.COMMAND + flags + [file]
+    p = Popen(cmd, stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL)
+    data = p.stdout.read()
+    p.wait()
+    return data
+
+
+def measure(data, intern_strings: bool):
+    """
+    :return: (retained bytes, seconds) of building the tree
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = Node(ctx=ParseContext(intern_strings=intern_strings), **json.loads(data))
+    t = time.perf_counter() - start
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del root
+    return retained, t
+
+
+if __name__ == "__main__":
+    file = sys.argv[1] if len(sys.argv) > 1 else "c/headers/many.c"
+    data = dump(file, sys.argv[2:])
+    print("{}: {:.1f}MB of json".format(file, len(data) / 1e6))
+    for intern_strings in [False, True]:
+        retained, t = measure(data, intern_strings)
+        print("interning: {:<5} retained: {:>7.1f}MB build: {:.3f}s".format(
+            str(intern_strings), retained / 1e6, t))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+builds the AST of a generated function with deeply nested loops and queries
+the loops and declarations of every block. Compares the `SubtreeIndex`
+based accessors with walking every subtree again (`reparse` with `check`).
+usage (from within the `test` directory):
+    python bench_nested.py [depth]
+"""
+import itertools
+import sys
+import time
+
+from python_c_cpp_parser.clang import Node, CompoundStmt, ForStmt, DeclStmt
+
+_ids = itertools.count(1)
+
+
+def nested(depth: int):
+    """
+    generates the json objects of `depth` nested blocks of the form
+        for (...) { int x = 0; for (...) { int x = 0; ... } }
+    """
+    inner = []
+    for _ in range(depth):
+        decl = {"id": hex(next(_ids)), "kind": "DeclStmt", "inner": [
+            {"id": hex(next(_ids)), "kind": "VarDecl", "name": "x",
+             "type": {"qualType": "int"}, "inner": [
+                {"id": hex(next(_ids)), "kind": "IntegerLiteral", "value": "0"}]}]}
+        body = {"id": hex(next(_ids)), "kind": "CompoundStmt", "inner": [decl] + inner}
+        loop = {"id": hex(next(_ids)), "kind": "ForStmt", "inner": [
+            {"id": hex(next(_ids)), "kind": "NullStmt"}, {},
+            {"id": hex(next(_ids)), "kind": "IntegerLiteral", "value": "1"},
+            {"id": hex(next(_ids)), "kind": "NullStmt"}, body]}
+        inner = [loop]
+    func = {"id": hex(next(_ids)), "kind": "FunctionDecl", "name": "f",
+            "type": {"qualType": "void ()"}, "inner": [
+                {"id": hex(next(_ids)), "kind": "CompoundStmt", "inner": inner}]}
+    return {"id": hex(next(_ids)), "kind": "TranslationUnitDecl", "inner": [func]}
+
+
+def query(root):
+    blocks = root.reparse([], CompoundStmt)
+    loops = 0
+    for b in blocks:
+        loops += len(b.get_for_loops())
+    for f in root.reparse([], ForStmt):
+        loops += len(f.get_var_decls())
+    return loops
+
+
+def query_walk(root):
+    """ the same queries, but every subtree is walked again """
+    blocks = root.reparse([], CompoundStmt, check=lambda out, n: True)
+    loops = 0
+    for b in blocks:
+        loops += len(b.reparse([], ForStmt, check=lambda out, n: True))
+    for f in root.reparse([], ForStmt, check=lambda out, n: True):
+        body = f.get_body()
+        loops += len(body.reparse([], DeclStmt, check=lambda out, n: True))
+    return loops
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(100000)
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    data = nested(depth)
+    for name, q in [("index", query), ("walk", query_walk)]:
+        start = time.perf_counter()
+        root = Node(**data)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        n = q(root)
+        t = time.perf_counter() - start
+        print("{:<6} depth: {} build: {:.4f}s queries: {:.4f}s ({} results)".format(
+            name, depth, build, t, n))
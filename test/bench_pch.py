@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+compares the time to parse a batch of files sharing a large prelude of
+system headers with and without a precompiled header. With `skip_system`
+both runs result in the same ASTs, as the declarations of the prelude are
+not dumped with a precompiled header anyway.
+usage (from within the `test` directory):
+    python bench_pch.py
+"""
+import tempfile
+import time
+import os
+
+from python_c_cpp_parser.clang import parse_many
+
+FILES = 16
+PRELUDE = ["<stdio.h>", "<stdlib.h>", "<string.h>", "<math.h>", "<time.h>",
+           "<signal.h>", "<stdint.h>", "<inttypes.h>", "<ctype.h>", "<errno.h>"]
+
+
+def bench(directory: str, **kwargs):
+    files = [os.path.join(directory, "f%d.c" % i) for i in range(FILES)]
+    start = time.perf_counter()
+    results = list(parse_many(files, jobs=1, skip_system=True, **kwargs))
+    t = time.perf_counter() - start
+    assert all(r.ok() for r in results)
+    return t
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(FILES):
+            with open(os.path.join(directory, "f%d.c" % i), "w") as f:
+                f.writelines("#include {}\n".format(h) for h in PRELUDE)
+                f.write("\nint f%d(int a) {\n    return abs(a) + %d;\n}\n" % (i, i))
+        print("{:<30} time: {:.4f}s".format("without pch", bench(directory)))
+        # the first batch builds the pch, the second one only reuses it
+        for run in ["pch (build)", "pch (reuse)"]:
+            t = bench(directory, pch=True)
+            print("{:<30} time: {:.4f}s".format(run, t))
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+compares the number of constructed nodes and the parse time of a file
+including `<stdio.h>` with and without `skip_system`.
+usage (from within the `test` directory):
+    python bench_system_headers.py
+"""
+import time
+
+from python_c_cpp_parser.clang import clang_parser
+
+FILE = "c/headers/stdio.c"
+RUNS = 5
+
+
+def count_nodes(node):
+    ret = 1
+    for n in node.inner or []:
+        ret += count_nodes(n)
+    return ret
+
+
+def bench(**kwargs):
+    best, nodes = None, 0
+    for _ in range(RUNS):
+        c = clang_parser(FILE, **kwargs)
+        start = time.perf_counter()
+        root = c.execute()
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+        nodes = count_nodes(root)
+    return nodes, best
+
+
+if __name__ == "__main__":
+    for kwargs in [{}, {"skip_system": True}, {"skip_system": True, "stubs": True},
+                   {"stream": True}, {"stream": True, "skip_system": True}]:
+        nodes, t = bench(**kwargs)
+        print("{:<45} nodes: {:>7} time: {:.4f}s".format(str(kwargs), nodes, t))
@@ -0,0 +1,8 @@
+int g(void);
+int f(int n) {
+    int s = 0, i;
+    for (i = 0; i < n; i += 2) { if (s > 5) break; s += g(); }
+    for (int j = 1; j <= 8; j++) { int t = j; s += t; }
+    while (n > 0) { n--; }
+    return s;
+}
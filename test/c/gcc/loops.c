@@ -0,0 +1,9 @@
+int g;
+int f(int n, long m) {
+    int sum = 0;
+    for (int i = 0; i < n; i++) { sum += i; }
+    while (n > 0) { n--; }
+    do { sum++; } while (sum < 10);
+    return sum;
+}
+int h(void) { return f(1, 2); }
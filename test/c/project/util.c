@@ -0,0 +1,5 @@
+#include "util.h"
+
+int util(void) {
+    return VALUE;
+}
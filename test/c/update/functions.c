@@ -0,0 +1,14 @@
+int offset = 3;
+
+int one(void) {
+    int a = 1;
+}
+
+int two(void) {
+    int b = 2;
+    int c = offset;
+}
+
+int three(void) {
+    int d = 4;
+}
@@ -0,0 +1,14 @@
+int total = 0;
+
+int add(int x, int y);
+
+int add(int x, int y) {
+    int s = x + y;
+    total = total + s;
+    return s;
+}
+
+int main(void) {
+    int a = add(1, 2);
+    return add(a, a);
+}
@@ -1,4 +1,9 @@
 #!/usr/bin/env python3
+import asyncio
+import shutil
+
+import pytest
+
 from python_c_cpp_parser.clang import *
 
 
@@ -85,3 +90,365 @@ def test_simple_var_decls():
     assert vd
     assert vd.get_width() == 4
     print(vd)
+
+
+def test_stream_for_loop():
+    c = clang_parser("c/for_loops/var_decls.c", stream=True)
+    root = c.execute()
+    assert root
+    assert len(c.get_function_decls()) == 1
+    f = c.get_function_decls(0)
+    body = f.get_body()
+    assert body
+    fl = body.get_for_loops(0)
+    assert fl
+    assert fl.is_basic_loop()
+    assert len(fl.get_var_decls()) == 1
+    # the output is never written into a temporary file
+    assert c._clang_parser__outfile is None
+
+
+def test_stream_tokenizer():
+    import io
+    from python_c_cpp_parser.stream import _tokenize
+    data = b'{"a": [1, -2.5e1, "x\\"y"], "b": {}, "c": true}\n{"d": null}'
+    events = list(_tokenize(io.BytesIO(data), chunk_size=3))
+    assert events == [
+        ("start_map", None), ("map_key", "a"), ("start_array", None),
+        ("number", 1), ("number", -25.0), ("string", 'x"y'), ("end_array", None),
+        ("map_key", "b"), ("start_map", None), ("end_map", None),
+        ("map_key", "c"), ("boolean", True), ("end_map", None),
+        ("start_map", None), ("map_key", "d"), ("null", None), ("end_map", None),
+    ]
+    # unbalanced brackets
+    for data in [b'{"a": 1}}', b'[1]]', b'{"a": [1}', b'{"a": 1']:
+        with pytest.raises(ValueError):
+            list(_tokenize(io.BytesIO(data)))
+
+
+def test_skip_system_headers():
+    for stream in [False, True]:
+        c = clang_parser("c/headers/stdio.c", stream=stream)
+        full = c.execute()
+        assert len(c.get_function_decls()) > 1
+
+        c = clang_parser("c/headers/stdio.c", stream=stream, skip_system=True)
+        root = c.execute()
+        assert root
+        assert len(c.get_function_decls()) == 1
+        assert c.get_function_decls(0).name == "main"
+        assert len(root.inner) < len(full.inner)
+
+
+def test_system_header_stubs():
+    c = clang_parser("c/headers/stdio.c", skip_system=True, stubs=True)
+    assert c.execute().kind == "TranslationUnitDecl"
+    stubs = [f for f in c.get_function_decls() if f.name != "main"]
+    assert len(stubs) > 0
+    for f in stubs:
+        assert f.inner is None
+        assert f.get_file().startswith("/usr")
+
+
+def test_lazy_for_loop():
+    for stream in [False, True]:
+        c = clang_parser("c/for_loops/var_decls.c", stream=stream, lazy=True)
+        c.execute()
+        assert len(c.get_function_decls()) == 1
+        f = c.get_function_decls(0)
+        assert "inner" not in f.__dict__
+        body = f.get_body()
+        assert body
+        assert "inner" not in body.__dict__
+        fl = body.get_for_loops(0)
+        assert fl
+        assert fl.is_basic_loop()
+        assert len(fl.get_var_decls()) == 1
+        assert body.get_var_decls() == []
+
+
+def test_compact_for_loop():
+    c = clang_parser("c/for_loops/var_decls.c", compact=True)
+    root = c.execute()
+    assert root.kind == "TranslationUnitDecl"
+    assert len(c.get_function_decls()) == 1
+    f = c.get_function_decls(0)
+    assert f.name == "for_loop"
+    assert f.get_file() == "c/for_loops/var_decls.c"
+    assert f.get_location().line == 1
+    body = f.get_body()
+    assert body
+    assert body.parent == f
+    fl = body.get_for_loops(0)
+    assert fl
+    assert fl.is_basic_loop()
+    assert len(fl.get_var_decls()) == 1
+    assert fl.get_lower_limit()
+    assert fl.get_upper_limit()
+    assert fl.get_step_size()
+    v = fl.get_var_decls()[0].inner[0]
+    assert v.is_integral() and v.get_width() == 4
+    # a declaration without a type
+    v.tree.types[v.index] = 0
+    assert v.get_width() is None and not v.is_integral()
+
+
+def test_compact_skip_system_headers():
+    c = clang_parser("c/headers/stdio.c", compact=True, skip_system=True)
+    root = c.execute()
+    assert len(root.inner) == 1
+    assert c.get_function_decls(0).name == "main"
+
+
+def test_unknown_kinds():
+    data = {"id": "0x1", "kind": "TranslationUnitDecl", "inner": [
+        {"id": "0x2", "kind": "SwitchStmt", "inner": [
+            {"id": "0x3", "kind": "StringLiteral", "value": "\"abc\""}]}]}
+    root = Node(**data)
+    assert type(root.inner[0]) is UnknownNode
+    assert root.inner[0].inner[0].kind == "StringLiteral"
+
+
+def test_register_node():
+    @register_node("StringLiteral")
+    class StringLiteral(Node):
+        def get_value(self):
+            return self.value
+
+    try:
+        data = {"id": "0x1", "kind": "StringLiteral", "value": "\"abc\""}
+        assert Node(inner=[data], id="0x0", kind="TranslationUnitDecl").inner[0].get_value() == "\"abc\""
+    finally:
+        del NODE_CLASSES["StringLiteral"]
+
+
+def test_subtree_index():
+    loop = {"id": "0x5", "kind": "ForStmt", "inner": [
+        {"id": "0x6", "kind": "CompoundStmt", "inner": [
+            {"id": "0x7", "kind": "ForStmt", "inner": [
+                {"id": "0x8", "kind": "CompoundStmt"}]}]}]}
+    data = {"id": "0x1", "kind": "TranslationUnitDecl", "inner": [
+        {"id": "0x2", "kind": "FunctionDecl", "name": "f", "inner": [
+            {"id": "0x3", "kind": "CompoundStmt", "inner": [loop,
+                {"id": "0x9", "kind": "ForStmt"}]}]}]}
+    root = Node(**data)
+    body = root.inner[0].get_body()
+    loops = body.get_for_loops()
+    assert [l.id for l in loops] == ["0x5", "0x7", "0x9"]
+    assert [l.id for l in loops[0].get_body().get_for_loops()] == ["0x7"]
+    assert body.reparse([], ForStmt) == body.reparse([], ForStmt, check=lambda out, n: True)
+
+
+def test_parallel_parsers():
+    from concurrent.futures import ThreadPoolExecutor
+    files = {"c/funcs/simple.c": "one", "c/funcs/int_ret_type.c": "two",
+             "c/funcs/decl.c": "three", "c/for_loops/var_decls.c": "for_loop"}
+
+    def parse(file):
+        c = clang_parser(file, stream=True)
+        c.execute()
+        return [f.name for f in c.get_function_decls()]
+
+    with ThreadPoolExecutor(4) as pool:
+        for _ in range(4):
+            results = list(pool.map(parse, files.keys()))
+            assert results == [[n] for n in files.values()]
+
+
+def test_parse_many():
+    files = ["c/funcs/simple.c", "c/funcs/int_ret_type.c", "c/does_not_exist.c",
+             "c/for_loops/var_decls.c"]
+    for jobs in [1, 2]:
+        results = {r.file: r for r in parse_many(files, jobs=jobs, stream=True)}
+        assert len(results) == 4
+        assert not results["c/does_not_exist.c"].ok()
+        assert results["c/funcs/simple.c"].parser.get_function_decls(0).name == "one"
+        fl = results["c/for_loops/var_decls.c"].parser.get_function_decls(0).get_body().get_for_loops(0)
+        assert len(fl.get_var_decls()) == 1
+        assert results["c/funcs/int_ret_type.c"].root.kind == "TranslationUnitDecl"
+
+
+def test_update(tmp_path):
+    shutil.copytree("c/update", tmp_path / "update")
+    file = str(tmp_path / "update" / "functions.c")
+    c = clang_parser(file)
+    root = c.execute()
+    one, two, three = c.get_function_decls()
+    line, offset = three.get_location().line, three.get_location().offset
+
+    # a new statement within `two`, only `two` is dumped again
+    with open(file) as f:
+        src = f.read()
+    with open(file, "w") as f:
+        f.write(src.replace("    int b = 2;\n", "    int b = 2;\n    int e = 5;\n"))
+    c._clang_parser__execute = None
+    assert c.update() is root
+    del c._clang_parser__execute
+    assert c.get_function_decls(0) is one and c.get_function_decls(2) is three
+    new = c.get_function_decls(1)
+    assert new is not two and new.id == two.id and new.parent is root
+    assert [d.inner[0].name for d in new.get_body().get_var_decls()] == ["b", "e", "c"]
+    ref = new.get_body().get_var_decls(2).inner[0].inner[0].inner[0]
+    assert ref.referencedDecl["id"] == root.inner[0].id
+    assert three.get_location().line == line + 1
+    assert three.get_location().offset == offset + len("    int e = 5;\n")
+    assert len(c.get_function_decls()) == 3
+
+    # a new declaration outside of the functions
+    with open(file, "a") as f:
+        f.write("int four = 4;\n")
+    c.update()
+    assert c.get_function_decls(0) is not one and len(c.get_function_decls()) == 3
+
+
+def test_functions(tmp_path):
+    shutil.copytree("c/update", tmp_path / "update")
+    file = str(tmp_path / "update" / "functions.c")
+    for stream in [False, True]:
+        c = clang_parser(file, functions=["two"], stream=stream)
+        root = c.execute()
+        assert root.kind == "FunctionDecl" and root.name == "two"
+        assert [f.name for f in c.get_function_decls()] == ["two"]
+
+
+def test_update_first_loop(tmp_path):
+    shutil.copytree("c/update", tmp_path / "update")
+    file = str(tmp_path / "update" / "functions.c")
+    with open(file) as f:
+        src = f.read()
+    loop = "    for (int i = 0; i < 2; i++) {}\n"
+    with open(file, "w") as f:
+        f.write(src.replace("    int d = 4;\n", "    int d = 4;\n" + loop))
+    c = clang_parser(file)
+    c.execute()
+    three = c._clang_parser__for_loop_decls[0]
+
+    # `one` had no loop before, its loop is the first one of the file
+    with open(file, "w") as f:
+        f.write(src.replace("    int d = 4;\n", "    int d = 4;\n" + loop)
+                .replace("    int a = 1;\n", "    int a = 1;\n" + loop))
+    c.update()
+    loops = c._clang_parser__for_loop_decls
+    assert len(loops) == 2 and loops[1] is three
+    assert loops[0].parent.parent is c.get_function_decls(0)
+    assert [f.name for f in c.get_function_decls()] == ["one", "two", "three"]
+
+
+def test_location_index(tmp_path):
+    shutil.copytree("c/update", tmp_path / "update")
+    file = str(tmp_path / "update" / "functions.c")
+    with open(file) as f:
+        src = f.read()
+    c = clang_parser(file)
+    c.execute()
+    two = c.get_function_decls(1)
+
+    # `offset` within `int c = offset;`
+    pos = src.index("= offset") + 2
+    n = c.get_node_at(pos)
+    assert n.kind == "DeclRefExpr" and n.get_range().begin_offset == pos
+    assert c.get_node_at(line=9, col=13) is n
+    kinds = [e.kind for e in c.get_enclosing_nodes(pos)]
+    assert kinds[0] == "DeclRefExpr" and kinds[-1] == "FunctionDecl"
+    assert two in c.get_enclosing_nodes(pos)
+
+    # the translation unit has no range
+    assert c.get_node_at(src.index("int two") - 1) is None
+    assert c.get_node_at(pos, file="other.c") is None
+    r = two.get_range()
+    assert (r.begin_line, r.end_line) == (7, 10) and r.file == file
+
+
+def test_usages():
+    for stream in [False, True]:
+        c = clang_parser("c/usages/usages.c", stream=stream)
+        root = c.execute()
+        total = root.inner[-4]
+        assert [f.name for f in c.get_function_decls()] == ["add", "add", "main"]
+        proto, add, main = c.get_function_decls()
+        x, y = add.get_arguments()
+        # the references within the nodes are plain json
+        ref = x.usages()[0].referencedDecl
+        assert type(ref) is dict and x.usages()[0].get_reference_id() == x.id
+
+        assert [u.kind for u in x.usages()] == ["DeclRefExpr"]
+        assert x.usages()[0].get_referenced_decl() is x
+        assert len(total.usages()) == 2
+        # calls of the prototype and of the definition
+        assert len(add.usages()) == 2 and len(proto.usages()) == 2
+        s = add.get_body().get_var_decls(0)
+        assert [r.get_referenced_decl() for r in s.get_references()] == [s.inner[0], s.inner[0]]
+        assert root.get_decl_index().get_node(main.id) is main
+
+
+def test_libclang_engine():
+    from python_c_cpp_parser import libclang
+    if not libclang.available():
+        pytest.skip("libclang is not installed")
+
+    for compact in [False, True]:
+        c = clang_parser("c/for_loops/var_decls.c", engine="libclang", compact=compact)
+        root = c.execute()
+        assert root.kind == "TranslationUnitDecl"
+        f = c.get_function_decls(0)
+        assert f.name == "for_loop"
+        fl = f.get_body().get_for_loops(0)
+        assert len(fl.inner) == 4
+        assert len(fl.get_var_decls()) == 1
+
+    c = clang_parser("c/for_loops/var_decls.c", engine="libclang")
+    c.execute()
+    fl = c.get_function_decls(0).get_body().get_for_loops(0)
+    assert fl.is_basic_loop()
+    i = fl.inner[0].inner[0]
+    assert i.get_init_value() == "0"
+    assert fl.inner[1].opcode == "<" and fl.inner[2].opcode == "++"
+    assert fl.inner[1].inner[0].inner[0].get_reference_id() == i.id
+
+
+def test_compact_save_load(tmp_path):
+    from python_c_cpp_parser.compact import CompactTree
+    c = clang_parser("c/for_loops/var_decls.c", compact=True)
+    tree = c.execute().tree
+    tree.save(str(tmp_path / "a.ast"))
+    loaded = CompactTree.load(str(tmp_path / "a.ast"))
+    assert len(loaded) == len(tree)
+    assert [n.kind for n in loaded.find("ForStmt")[0].inner] == \
+        [n.kind for n in tree.find("ForStmt")[0].inner]
+    f = loaded.roots()[0].inner[-1]
+    assert f.name == "for_loop" and f.get_location().line == 1
+    assert len(f.get_body().get_for_loops(0).get_var_decls()) == 1
+
+    # from a tree of `Node`s
+    c = clang_parser("c/for_loops/var_decls.c")
+    converted = CompactTree.from_node(c.execute())
+    assert list(converted.kinds) == list(tree.kinds)
+
+    with open(tmp_path / "b.ast", "wb") as f:
+        f.write(b"garbage")
+    with pytest.raises(ValueError):
+        CompactTree.load(str(tmp_path / "b.ast"))
+
+
+def test_interning():
+    c = clang_parser("c/for_loops/var_decls.c")
+    assert c.execute()
+    loop = c.get_function_decls(0).get_body().get_for_loops(0)
+    i = loop.inner[0].inner[0]
+    tmp = loop.get_body().get_var_decls(0).inner[0]
+    assert i.type is tmp.type
+    assert i.kind is tmp.kind
+    assert type2width(i.get_type()) == 4 and type2width("char *") == 8
+
+
+def test_execute_async():
+    async def parse_all(files):
+        semaphore = asyncio.Semaphore(2)
+        parsers = [clang_parser(f) for f in files]
+        roots = await asyncio.gather(*[p.execute_async(semaphore) for p in parsers])
+        return parsers, roots
+
+    parsers, roots = asyncio.run(parse_all(["c/for_loops/var_decls.c"] * 3 + ["c/missing.c"]))
+    assert [r.kind for r in roots[:3]] == ["TranslationUnitDecl"] * 3
+    assert roots[3] is None
+    assert parsers[0].get_function_decls(0).get_body() is not None
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import shutil
+
+from python_c_cpp_parser.cache import *
+from python_c_cpp_parser.clang import *
+
+
+def test_cache(tmp_path):
+    shutil.copytree("c/project", tmp_path / "project")
+    cache = ASTCache(tmp_path / "cache")
+    flags = ["-Iinclude", "-DVALUE=3"]
+    for i in range(2):
+        c = clang_parser("util.c", flags=flags, cwd=tmp_path / "project", cache=cache)
+        root = c.execute()
+        assert root.kind == "TranslationUnitDecl"
+        assert c.get_function_decls(0).name == "util"
+        assert (cache.hits, cache.misses) == (i, 1)
+
+    # other flags or a modified header
+    clang_parser("util.c", flags=flags + ["-O2"], cwd=tmp_path / "project", cache=cache).execute()
+    assert cache.misses == 2
+    with open(tmp_path / "project" / "include" / "util.h", "a") as f:
+        f.write("\n")
+    clang_parser("util.c", flags=flags, cwd=tmp_path / "project", cache=cache).execute()
+    assert cache.misses == 3
+
+
+def test_cache_eviction(tmp_path):
+    cache = ASTCache(tmp_path / "cache", max_size=0)
+    c = clang_parser("c/funcs/simple.c", cache=cache)
+    c.execute()
+    assert cache.size() == 0
+    c.execute()
+    assert cache.hits == 0
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import shutil
+
+from python_c_cpp_parser.clang import clang_parser
+from python_c_cpp_parser.pch import *
+from python_c_cpp_parser.project import clang_project
+
+
+def test_common_prelude(tmp_path):
+    (tmp_path / "sys").mkdir()
+    (tmp_path / "sys" / "x.h").write_text("/* x */\n#ifndef X_H\n#define X_H 1\nint x;\n#endif // X_H\n")
+    (tmp_path / "sys" / "y.h").write_text("#if !defined(Y_H)\n#define Y_H\n#ifdef N\n#endif\nint y;\n#endif\n")
+    (tmp_path / "a.h").write_text("#pragma once\nint a;\n")
+    (tmp_path / "u.h").write_text("#ifndef U_H\n#define U_H\n#endif\nint u;\n")
+    (tmp_path / "a.c").write_text("// comment\n#pragma once\n#include <x.h>\n"
+                                  "/* multi\n line */\n#include \"a.h\"\n#include <y.h>\n"
+                                  "int main() { return 0; }\n#include <z.h>\n")
+    (tmp_path / "b.c").write_text("#include <x.h>\n#include \"a.h\"\n#define N 1\n#include <y.h>\n")
+    (tmp_path / "c.c").write_text("#include <x.h>\n#include \"u.h\"\n#include \"a.h\"\n")
+    (tmp_path / "d.c").write_text("#include <x.h>\n#include <missing.h>\n#include \"a.h\"\n")
+    dirs = [str(tmp_path / "sys")]
+    a = '"{}"'.format(tmp_path / "a.h")
+    assert leading_includes(tmp_path / "a.c", dirs=dirs) == ["<x.h>", a, "<y.h>"]
+    assert common_prelude([tmp_path / "a.c", tmp_path / "b.c"], dirs=dirs) == ["<x.h>", a]
+    assert common_prelude(["b.c", "a.c"], cwd=tmp_path, dirs=dirs) == ["<x.h>", a]
+    # stops at an unguarded header and at one which can't be found
+    assert leading_includes(tmp_path / "c.c", dirs=dirs) == ["<x.h>"]
+    assert leading_includes(tmp_path / "d.c", dirs=dirs) == ["<x.h>"]
+    assert not is_guarded(tmp_path / "u.h") and is_guarded(tmp_path / "sys" / "y.h")
+    assert include_dirs(["-Iinc", "-isystem", "/sys", "-DN"], "/p")[:2] == ["/p/inc", "/sys"]
+    assert language("a.cpp") == "c++" and language("a.c") == "c"
+
+
+def test_pch_ast(tmp_path):
+    shutil.copytree("c/project", tmp_path / "project")
+    cwd = tmp_path / "project"
+    flags = ["-Iinclude", "-DVALUE=3"]
+    pch = PrecompiledHeader(['"util.h"'], tmp_path / "pch", flags, cwd)
+
+    def parse(run_async=False, **kwargs):
+        c = clang_parser("main.c", flags=flags, cwd=cwd, **kwargs)
+        root = asyncio.run(c.execute_async()) if run_async else c.execute()
+        return c, [(d.kind, d.name) for d in root.inner]
+
+    full = parse()[1]
+    assert ("FunctionDecl", "util") in full
+    # the declarations of the pch are not dumped, the ones of main.c are
+    for kwargs in [{}, {"stream": True}, {"run_async": True}]:
+        c, decls = parse(pch=pch, **kwargs)
+        assert ("FunctionDecl", "util") not in decls and decls[-1] == ("FunctionDecl", "main")
+        assert [d for d in full if d in decls] == decls
+        call = c.get_function_decls(0).get_body().inner[0].inner[0]
+        ref = call.inner[0].inner[0]
+        assert ref.referencedDecl["name"] == "util" and ref.get_referenced_decl() is None
+    assert pch.builds == 1
+
+    # a pch rejected by clang is not used, the whole file is parsed
+    with open(pch.get_path(), "w") as f:
+        f.write("corrupted")
+    for kwargs in [{}, {"stream": True}, {"run_async": True}]:
+        assert parse(pch=pch, **kwargs)[1] == full
+
+    # only guarded headers are precompiled
+    (cwd / "include" / "plain.h").write_text("int plain(void);\n")
+    assert PrecompiledHeader(['"plain.h"'], tmp_path / "pch", flags, cwd).get_flags() == []
+
+
+def test_project_pch(tmp_path):
+    shutil.copytree("c/project", tmp_path / "project")
+    pch_dir = tmp_path / "pch"
+    p = clang_project(tmp_path / "project" / "compile_commands.json", jobs=1,
+                      pch=True, pch_dir=pch_dir)
+    pchs = p.get_pchs()
+    assert len(pchs) == 1
+    pch = next(iter(pchs.values()))
+    assert pch.headers == ['"util.h"']
+    assert pch.is_valid() and pch.builds == 1
+    assert os.path.isfile(pch.get_path())
+
+    results = {os.path.basename(r.file.file): r for r in p.execute()}
+    assert all(r.ok() for r in results.values())
+    assert results["util.c"].parser.get_function_decls(0).name == "util"
+
+    # reused by the next batch, rebuilt after a change of the header
+    pch = next(iter(p.get_pchs().values()))
+    assert pch.builds == 0
+    with open(tmp_path / "project" / "include" / "util.h", "a") as f:
+        f.write("\n")
+    assert not pch.is_valid()
+    assert pch.get_flags() == ["-include-pch", pch.get_path()]
+    assert pch.builds == 1 and pch.is_valid()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import os
+import shutil
+
+from python_c_cpp_parser.project import *
+
+
+def test_filter_flags():
+    args = ["gcc", "-Iinc", "-DN=1", "-c", "-o", "a.o", "-MD", "-MFa.d", "a.c", "-O2"]
+    assert filter_flags(args, "a.c") == ["-Iinc", "-DN=1", "-O2"]
+
+
+def test_load_compile_commands():
+    units = load_compile_commands("c/project/compile_commands.json")
+    assert len(units) == 2
+    assert units[0].file == os.path.abspath("c/project/main.c")
+    assert units[0].directory == os.path.abspath("c/project")
+    assert units[0].flags == ["-Iinclude", "-DVALUE=3"]
+    assert units[1].flags == ["-Iinclude", "-DVALUE=3"]
+
+
+def test_project(tmp_path):
+    shutil.copytree("c/project", tmp_path / "project")
+    state = str(tmp_path / "state.json")
+    p = clang_project(tmp_path / "project" / "compile_commands.json", jobs=2, state=state)
+    results = {os.path.basename(r.file.file): r for r in p.execute(only_changed=True)}
+    assert len(results) == 2 and all(r.ok() for r in results.values())
+    assert len(p.get_units()) == 2 and p.get_units(1) is p.get_units()[1]
+    assert p.get_units(2) is None
+    assert results["util.c"].parser.get_function_decls(0).name == "util"
+    deps = results["main.c"].parser.get_dependencies()
+    assert str(tmp_path / "project" / "include" / "util.h") in deps
+
+    # nothing changed
+    p = clang_project(tmp_path / "project" / "compile_commands.json", jobs=1, state=state)
+    assert list(p.execute(only_changed=True)) == []
+    assert len(p.get_skipped()) == 2
+
+    # touched, but not modified
+    os.utime(tmp_path / "project" / "main.c", ns=(0, 0))
+    p = clang_project(tmp_path / "project" / "compile_commands.json", jobs=1, state=state)
+    assert list(p.execute(only_changed=True)) == []
+
+    # a modified header affects both units
+    with open(tmp_path / "project" / "include" / "util.h", "a") as f:
+        f.write("\n")
+    p = clang_project(tmp_path / "project" / "compile_commands.json", jobs=1, state=state)
+    assert len(list(p.execute(only_changed=True))) == 2
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import shutil
+import sqlite3
+
+from python_c_cpp_parser.project import load_compile_commands
+from python_c_cpp_parser.symbols import *
+
+
+def test_symbol_index(tmp_path):
+    shutil.copytree("c/project", tmp_path / "project")
+    project = tmp_path / "project"
+    db = str(tmp_path / "symbols.db")
+    with SymbolIndex(db, project / "compile_commands.json") as index:
+        assert index.update(jobs=1) == []
+        assert len(index.get_units()) == 2
+
+        util = index.find("util")
+        assert [(s.file, s.has_body) for s in util] == [
+            (str(project / "include" / "util.h"), False), (str(project / "util.c"), True)]
+        assert index.find_definition("util").line == 3
+        assert index.find_definition("util").type == "int (void)"
+        assert [s.name for s in index.find_prefix("ma")] == ["main"]
+        assert [s.name for s in index.get_symbols(project / "main.c")] == ["main"]
+
+    # the declaration of `util.h` is stored once and shared by both units
+    db_ = sqlite3.connect(db)
+    rows = db_.execute("SELECT id FROM symbols WHERE name = 'util' AND has_body = 0").fetchall()
+    assert len(rows) == 1
+    assert db_.execute("SELECT COUNT(*) FROM unit_symbols WHERE symbol = ?", rows[0]).fetchone()[0] == 2
+    db_.close()
+
+    # only the modified unit is parsed again
+    with open(project / "util.c", "a") as f:
+        f.write("int counter;\n")
+    with SymbolIndex(db, project / "compile_commands.json") as index:
+        assert index.is_unchanged(load_compile_commands(project / "compile_commands.json")[0])
+        index.update(jobs=1)
+        assert index.find("counter", kind="VarDecl")[0].has_body
+        assert index.find("main")
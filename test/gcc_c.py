@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+import asyncio
+
+from python_c_cpp_parser.gcc import *
+
+
+def test_parse_dump():
+    with open("a-test.c.005t.original", "rb") as f:
+        nodes = gcc_parser.parse(None, f)
+    assert nodes["7"].kind == "modify_expr" and nodes["7"].op0 == "@16"
+    assert nodes["9"].strg == "sum1" and nodes["10"].min == "@19"
+    head, options = split_line("@28  string_cst  type: @40  strg: a b  lngt: 4  ")
+    assert head == ("28", "string_cst") and options[1] == ("strg", "a b")
+
+
+def test_graph():
+    c = gcc_parser("c/gcc/loops.c", graph=True)
+    g = c.execute()["f"]
+    assert g.function == "f" and g.kind(0) == "bind_expr"
+    assert g.kind(g.ref(0, "vars")) == "var_decl"
+
+    f = c.get_function_decls(0)
+    assert f.name == "f" and f.get_return_type() == "int"
+    assert [(a.name, a.get_type(), a.get_width()) for a in f.get_arguments()] == [("n", "int", 4)]
+    body = f.get_body()
+    assert [(v.name, v.get_init_value()) for v in body.get_var_decls()] == [("sum", "0"), ("i", "0")]
+    assert [l.kind for l in body.get_loops()] == ["for", "while", "do"]
+    assert body.get_for_loops(0).get_condition().kind == "lt_expr"
+    assert body.get_while_loops(0).get_location().line == 5
+
+
+def test_parse_gcc_node_to_clang_node():
+    sections = gcc_parser("c/gcc/loops.c").execute()
+    views = parse_gcc_node_to_clang_node(sections)
+    assert list(views) == ["f", "h"]
+    assert views["f"]["1"].kind == "bind_expr"
+    assert [v.name for v in views["h"].values() if v.kind == "function_decl"][:1] == ["h"]
+    # a single section, also as list and as plain dicts
+    assert parse_gcc_node_to_clang_node(sections["f"]).keys() == views["f"].keys()
+    nodes = list(sections["f"].values())
+    assert parse_gcc_node_to_clang_node(nodes).keys() == views["f"].keys()
+    dicts = parse_gcc_node_to_clang_node([dict(n.__dict__) for n in nodes])
+    assert [v.kind for v in dicts.values()] == [v.kind for v in views["f"].values()]
+    # the sections of `graph=True`
+    graphs = gcc_parser("c/gcc/loops.c", graph=True).execute()
+    assert parse_gcc_node_to_clang_node(graphs)["f"].keys() == views["f"].keys()
+
+def test_loop_accessors():
+    c = gcc_parser("c/gcc/for.c", graph=True)
+    c.execute()
+    body = c.get_function_decls(0).get_body()
+    first, second = body.get_for_loops()
+    assert first.is_basic_loop() and second.is_basic_loop()
+    assert first.get_variable().name == "i" and first.get_init().kind == "modify_expr"
+    assert first.get_lower_limit().get("int") == "0"
+    assert first.get_upper_limit().name == "n"
+    assert first.get_step_size().get("int") == "2"
+    assert first.get_increment().kind == "modify_expr"
+    assert [n.kind for n in first.get_func_calls()] == ["call_expr"]
+    assert len(first.get_break_stmts()) == 1
+    assert first.get_increment().index not in [n.index for n in first.get_body()]
+
+    # declared within the loop
+    assert second.get_variable().name == "j" and second.get_init() is second.get_variable()
+    assert second.get_lower_limit().get("int") == "1"
+    assert second.get_upper_limit().get("int") == "8"
+    assert second.get_step_size().get("int") == "1"
+    assert [v.name for v in second.get_var_decls()] == ["t"]
+    assert second.get_break_stmts() == []
+
+    # no equivalent for while loops
+    loop = body.get_while_loops(0)
+    assert not loop.is_basic_loop()
+    assert loop.get_init() is None and loop.get_increment() is None
+    assert loop.get_variable() is None and loop.get_lower_limit() is None
+    assert [n.kind for n in loop.get_body()] == ["postdecrement_expr"]
+
+
+def test_sections():
+    assert parse_header(";; Function int n::g(T) [with T = int] (_Z1gIiET_S0_)\n") == \
+        ("int n::g(T) [with T = int]", "g")
+
+    sections = gcc_parser("c/gcc/loops.c").execute()
+    assert list(sections) == ["f", "h"]
+    assert any(getattr(n, "strg", None) == "h" for n in sections["h"].values())
+
+    # only the selected function, in worker processes
+    c = gcc_parser("c/gcc/loops.c", functions=["h"], graph=True, jobs=2)
+    sections = c.execute()
+    assert list(sections) == ["h"]
+    assert [f.name for f in c.get_function_decls()] == ["h"]
+
+
+def test_parse_many():
+    files = ["c/gcc/loops.c"] * 4 + ["c/gcc/missing.c"]
+    results = list(parse_many(files, jobs=2, graph=True))
+    assert sum(r.ok() for r in results) == 4
+    assert all(list(r.root) == ["f", "h"] for r in results if r.ok())
+    assert all(r.parser.get_function_decls(0).name == "f" for r in results if r.ok())
+
+
+def test_execute_async():
+    c = gcc_parser("c/gcc/loops.c", graph=True)
+    sections = asyncio.run(c.execute_async())
+    assert list(sections) == ["f", "h"] and c.get_function_decls(0).name == "f"
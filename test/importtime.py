@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules which are only imported on first use
+LAZY = ["asyncio", "concurrent.futures", "subprocess", "tempfile", "json",
+        "copy", "difflib", "typing", "pathlib"]
+# cumulative import time of the backends in microseconds, about 2-3 times
+# the measured ~20-28ms (mostly `logging` and `re`)
+LIMIT = 60000
+
+
+def run(code: str, *args, env: dict = None):
+    env = dict(os.environ, **(env or {}))
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, env.get("PYTHONPATH", "")])
+    p = subprocess.run([sys.executable] + list(args) + ["-c", code], env=env,
+                       capture_output=True, text=True, check=True)
+    return p.stdout, p.stderr
+
+
+def test_lazy_package():
+    out, _ = run("import sys, python_c_cpp_parser\n"
+                 "print(sorted(m for m in sys.modules if m.startswith('python_c_cpp_parser')))")
+    assert out.strip() == "['python_c_cpp_parser']"
+
+    out, _ = run("import sys, python_c_cpp_parser as p\n"
+                 "assert p.clang_parser is p.clang.clang_parser\n"
+                 "assert p.gcc_parser.__module__ == 'python_c_cpp_parser.gcc'\n"
+                 "print('python_c_cpp_parser.symbols' in sys.modules)")
+    assert out.strip() == "False"
+
+
+def test_no_work_at_import():
+    out, _ = run("import sys, python_c_cpp_parser.gcc, python_c_cpp_parser.clang\n"
+                 "print(' '.join(m for m in %r if m in sys.modules))" % LAZY)
+    assert out.strip() == ""
+
+
+def test_independent_backends():
+    out, _ = run("import sys, python_c_cpp_parser.gcc\n"
+                 "print('python_c_cpp_parser.clang' in sys.modules)")
+    assert out.strip() == "False"
+
+
+def test_importtime(tmp_path):
+    # with written bytecode, otherwise compiling is measured
+    env = {"PYTHONPYCACHEPREFIX": str(tmp_path), "PYTHONDONTWRITEBYTECODE": ""}
+    run("import python_c_cpp_parser.gcc", env=env)
+    best = None
+    for _ in range(3):
+        _, err = run("import python_c_cpp_parser.gcc", "-X", "importtime", env=env)
+        t = 0
+        for line in err.splitlines():
+            _, cumulative, name = line.split("|")
+            # only top level imports, their cumulative time includes the others
+            if name.startswith(" python_c_cpp_parser"):
+                t += int(cumulative)
+        best = t if best is None else min(best, t)
+    assert 0 < best < LIMIT
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+import pytest
+
+from python_c_cpp_parser.pycparser import pycparser_parser, available
+
+
+def test_parse():
+    p = pycparser_parser("void f(const int *a, int *b) { *b = *a; }", "f")
+    if not available():
+        with pytest.raises(ImportError):
+            p.parse()
+        return
+    assert p.parse() == 0
+    assert p.arg_num_in == 1 and p.arg_num_out == 1
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import json
+import os
+
+from python_c_cpp_parser.toolchain import *
+from python_c_cpp_parser import toolchain
+
+
+def test_discover(tmp_path):
+    cache_file = str(tmp_path / "toolchains.json")
+    clear()
+    t = discover("gcc", cache_file)
+    assert t is not None
+    assert "gcc" in t.version or "GCC" in t.version
+    assert os.path.isabs(t.binary)
+    assert t.include_dirs and all(os.path.isabs(d) for d in t.include_dirs)
+    assert discover("gcc", cache_file) is t
+
+    # the second process only reads the cache
+    with open(cache_file) as f:
+        entries = json.load(f)
+    assert len(entries) == 1
+    key = next(iter(entries))
+    entries[key]["version"] = "cached"
+    with open(cache_file, "w") as f:
+        json.dump(entries, f)
+    clear()
+    assert discover("gcc", cache_file).version == "cached"
+    clear()
+
+
+def test_discover_missing(tmp_path):
+    assert discover("does-not-exist-cc", str(tmp_path / "toolchains.json")) is None
+    assert not (tmp_path / "toolchains.json").exists()
+    toolchain._toolchains.pop("does-not-exist-cc")